@@ -4,8 +4,16 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.schemas.item import ItemResponse, ItemListResponse, ItemUpdateCandidate
+from app.schemas.item import (
+    ItemResponse,
+    ItemListResponse,
+    ItemTimeseriesResponse,
+    ItemUpdateCandidate,
+    TimeseriesPoint,
+)
 from app.services.item_service import ItemService
+from app.services.keepa import keepa_minutes_to_dates
+from app.services.timeseries import DAILY_AGGREGATION_BY_METRIC, TimeseriesService
 
 router = APIRouter()
 
@@ -53,6 +61,26 @@ def get_item(item_id: int, db: Session = Depends(get_db)):
     return item
 
 
+@router.get("/{item_id}/timeseries", response_model=ItemTimeseriesResponse)
+def get_item_timeseries(item_id: int, db: Session = Depends(get_db)):
+    """アイテムの時系列（価格・ランキング）を取得（TIMESERIES_STORAGE=rows/packed のどちらでも同じ形式）"""
+    item = ItemService.get_item(db, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    series = {}
+    for metric in DAILY_AGGREGATION_BY_METRIC:
+        result = TimeseriesService.get_series(db, item.job_id, item.asin, metric)
+        if result is None:
+            continue
+        minutes, values = result
+        series[metric] = [
+            TimeseriesPoint(date=recorded_date, value=value)
+            for recorded_date, value in zip(keepa_minutes_to_dates(minutes), values.tolist())
+        ]
+    return ItemTimeseriesResponse(item_id=item.id, asin=item.asin, series=series)
+
+
 @router.patch("/{item_id}/candidate", response_model=ItemResponse)
 def update_candidate(
     item_id: int,
@@ -1,11 +1,15 @@
 import os
 from functools import lru_cache
+from typing import Literal
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
 load_dotenv()
 
+# 時系列を1日1点へ集約する方法
+DailyAggregation = Literal["min", "max", "last", "mean"]
+
 
 class Settings(BaseSettings):
     # Database
@@ -26,11 +30,85 @@ class Settings(BaseSettings):
     # Cache TTL (seconds)
     cache_ttl_seconds: int = int(os.getenv("CACHE_TTL_SECONDS", "86400"))  # 24時間
 
+    # 多段キャッシュ（L1: プロセス内LRU / L2: Redis / L3: MySQL api_cache）
+    cache_local_max_entries: int = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "10000"))  # 0で無効
+    cache_redis_enabled: bool = os.getenv("CACHE_REDIS_ENABLED", "true").lower() == "true"
+
+    # キャッシュ圧縮（none / zlib / zstd）。この値以上のサイズ（bytes）のレスポンスのみ圧縮
+    cache_compression: str = os.getenv("CACHE_COMPRESSION", "zlib")
+    cache_compression_min_bytes: int = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", "4096"))
+
+    # 期限切れキャッシュをそのまま返し、低優先度キュー（cache_refresh）で再取得する（stale-while-revalidate）
+    cache_serve_stale: bool = os.getenv("CACHE_SERVE_STALE", "true").lower() == "true"
+    cache_stale_max_seconds: int = int(os.getenv("CACHE_STALE_MAX_SECONDS", "604800"))  # 期限切れ後7日まで
+
+    # ネガティブキャッシュ（該当データなし）のTTL（seconds）
+    cache_negative_ttl_keepa: int = int(os.getenv("CACHE_NEGATIVE_TTL_KEEPA", "21600"))  # 6時間
+    cache_negative_ttl_sp_api: int = int(os.getenv("CACHE_NEGATIVE_TTL_SP_API", "21600"))  # 6時間
+    cache_negative_ttl_rakuten: int = int(os.getenv("CACHE_NEGATIVE_TTL_RAKUTEN", "21600"))  # 6時間
+
+    # api_cacheの掃除（期限切れ削除 + 行数上限を超えた分を最終アクセスの古い順に削除）
+    cache_sweep_interval_seconds: int = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "3600"))
+    cache_sweep_chunk_size: int = int(os.getenv("CACHE_SWEEP_CHUNK_SIZE", "1000"))
+    cache_max_rows: int = int(os.getenv("CACHE_MAX_ROWS", "0"))  # 0で上限なし
+
+    # キャッシュ書き込みをまとめる場合の1文あたりの行数（INSERT ... ON DUPLICATE KEY UPDATE）
+    cache_write_batch_size: int = int(os.getenv("CACHE_WRITE_BATCH_SIZE", "100"))
+
+    # リサーチジョブの実行方式
+    # （batch: Keepaバッチごとに順に処理 / pipeline: 段ごとのスレッドで並行処理 / async: イベントループで並行処理）
+    research_worker_mode: str = os.getenv("RESEARCH_WORKER_MODE", "batch")
+    # pipeline: 段の間のキューの上限件数 / SP-API・楽天段のワーカー数（0でレート制限から自動）
+    pipeline_queue_size: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "200"))
+    pipeline_sp_api_workers: int = int(os.getenv("PIPELINE_SP_API_WORKERS", "0"))
+    pipeline_rakuten_workers: int = int(os.getenv("PIPELINE_RAKUTEN_WORKERS", "0"))
+    # async: 同時に処理する（楽天へ問い合わせる）アイテム数の上限 / SP-API用スレッド数（0でレート制限から自動）
+    async_max_in_flight: int = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "100"))
+    async_sp_api_threads: int = int(os.getenv("ASYNC_SP_API_THREADS", "0"))
+
+    # リサーチジョブの分割: 1つのRQジョブ（チャンク）で処理するアイテム数
+    job_chunk_size: int = int(os.getenv("JOB_CHUNK_SIZE", "500"))
+
+    # 処理待ちアイテムの読み込み単位（この件数ずつid順に読んで処理する）
+    job_page_size: int = int(os.getenv("JOB_PAGE_SIZE", "500"))
+
+    # 確保したアイテムの処理期限（秒）。過ぎても終わらないアイテムは処理待ちに戻す
+    job_claim_lease_seconds: int = int(os.getenv("JOB_CLAIM_LEASE_SECONDS", "3600"))
+
+    # リサーチジョブのDB書き込み（この件数ごとに1トランザクションでコミット）
+    job_commit_batch_size: int = int(os.getenv("JOB_COMMIT_BATCH_SIZE", "20"))
+    # ジョブの集計（進捗）をこの秒数ごとに反映
+    job_progress_interval_seconds: float = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "10"))
+
+    # 時系列の保存形式（rows: 1日1行 / packed: ASIN・メトリクスごとに1行の差分列）
+    timeseries_storage: Literal["rows", "packed"] = os.getenv("TIMESERIES_STORAGE", "rows")
+    # 保存前に1日1点へ集約する方法（min / max / last / mean）。不正な値は起動時にエラー
+    timeseries_daily_agg_price: DailyAggregation = os.getenv("TIMESERIES_DAILY_AGG_PRICE", "min")
+    timeseries_daily_agg_rank: DailyAggregation = os.getenv("TIMESERIES_DAILY_AGG_RANK", "mean")
+
     # Rate Limits (requests per second)
     rate_limit_keepa: float = float(os.getenv("RATE_LIMIT_KEEPA", "0.5"))  # 2秒に1回
     rate_limit_sp_api: float = float(os.getenv("RATE_LIMIT_SP_API", "1.0"))  # 1秒に1回
     rate_limit_rakuten: float = float(os.getenv("RATE_LIMIT_RAKUTEN", "1.0"))  # 1秒に1回
 
+    # SP-API 操作ごとのレート制限（rate: requests per second / burst）
+    # デフォルトはSP-APIのUsage Plan。x-amzn-RateLimit-Limitヘッダーがあればそちらを優先
+    sp_api_rate_get_item_offers: float = float(os.getenv("SP_API_RATE_GET_ITEM_OFFERS", "0.5"))
+    sp_api_burst_get_item_offers: int = int(os.getenv("SP_API_BURST_GET_ITEM_OFFERS", "1"))
+    sp_api_rate_get_fees_estimate: float = float(os.getenv("SP_API_RATE_GET_FEES_ESTIMATE", "1.0"))
+    sp_api_burst_get_fees_estimate: int = int(os.getenv("SP_API_BURST_GET_FEES_ESTIMATE", "2"))
+    sp_api_rate_get_catalog_item: float = float(os.getenv("SP_API_RATE_GET_CATALOG_ITEM", "2.0"))
+    sp_api_burst_get_catalog_item: int = int(os.getenv("SP_API_BURST_GET_CATALOG_ITEM", "2"))
+    sp_api_rate_get_listings_restrictions: float = float(os.getenv("SP_API_RATE_GET_LISTINGS_RESTRICTIONS", "5.0"))
+    sp_api_burst_get_listings_restrictions: int = int(os.getenv("SP_API_BURST_GET_LISTINGS_RESTRICTIONS", "10"))
+    sp_api_rate_get_item_offers_batch: float = float(os.getenv("SP_API_RATE_GET_ITEM_OFFERS_BATCH", "0.1"))
+    sp_api_burst_get_item_offers_batch: int = int(os.getenv("SP_API_BURST_GET_ITEM_OFFERS_BATCH", "1"))
+    sp_api_rate_get_fees_estimates: float = float(os.getenv("SP_API_RATE_GET_FEES_ESTIMATES", "0.5"))
+    sp_api_burst_get_fees_estimates: int = int(os.getenv("SP_API_BURST_GET_FEES_ESTIMATES", "1"))
+
+    # redis: 全ワーカーで共有 / local: プロセス内のみ
+    rate_limit_backend: str = os.getenv("RATE_LIMIT_BACKEND", "redis")
+
     # Default thresholds
     default_profit_amount: int = 1000
     default_profit_rate: float = 0.15
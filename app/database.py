@@ -1,4 +1,9 @@
+from functools import lru_cache
+from typing import Iterable
+
+from redis import Redis
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from app.config import get_settings
@@ -27,3 +32,19 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+@lru_cache
+def get_redis() -> Redis:
+    """Redis接続（RQ・レート制限で共有）"""
+    return Redis.from_url(settings.redis_url)
+
+
+def upsert_statement(model, rows: list[dict], update_columns: Iterable[str]):
+    """
+    複数行の INSERT ... ON DUPLICATE KEY UPDATE 文を作成
+
+    一意キーが重複した行は update_columns のみ新しい値で上書きする
+    """
+    stmt = mysql_insert(model).values(rows)
+    return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
@@ -1,6 +1,6 @@
 from app.models.job import ResearchJob
 from app.models.item import ResearchItem
-from app.models.timeseries import ResearchTimeseries
+from app.models.timeseries import ResearchTimeseries, ResearchTimeseriesPacked
 from app.models.rakuten_candidate import RakutenCandidate
 from app.models.cache import ApiCache
 
@@ -8,6 +8,7 @@ __all__ = [
     "ResearchJob",
     "ResearchItem",
     "ResearchTimeseries",
+    "ResearchTimeseriesPacked",
     "RakutenCandidate",
     "ApiCache",
 ]
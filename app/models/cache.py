@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import Any, Optional
 
-from sqlalchemy import String, Enum, DateTime, JSON, Index
+from sqlalchemy import String, Enum, DateTime, JSON, Index, LargeBinary
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -15,6 +16,7 @@ class ApiCache(Base):
     api_type: Mapped[str] = mapped_column(
         Enum(
             "KEEPA",
+            "KEEPA_PARSED",
             "SP_API_FEES",
             "SP_API_PRICING",
             "SP_API_CATALOG",
@@ -26,14 +28,22 @@ class ApiCache(Base):
         nullable=False
     )
     request_params: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
-    response_data: Mapped[Any] = mapped_column(JSON, nullable=False)
+    # 非圧縮時はresponse_data、圧縮時はresponse_blobに保存（response_encodingで判別）
+    response_data: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
+    response_blob: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary().with_variant(MEDIUMBLOB(), "mysql"), nullable=True
+    )
+    response_encoding: Mapped[str] = mapped_column(String(16), nullable=False, default="json")
 
     fetched_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # 行数上限を超えた場合の削除順（古い順）
+    last_accessed_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
 
     __table_args__ = (
         Index("idx_cache_type", "api_type"),
         Index("idx_cache_expires", "expires_at"),
+        Index("idx_cache_last_accessed", "last_accessed_at"),
     )
 
     def __repr__(self) -> str:
@@ -22,6 +22,10 @@ class ResearchItem(Base):
     )
     fail_reason: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
 
+    # 処理の確保（複数ワーカーが同じアイテムを処理しないよう、確保したワーカーのトークンと期限）
+    claim_token: Mapped[Optional[str]] = mapped_column(String(36), nullable=True)
+    claimed_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
     # 商品基本情報
     title: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     jan_code: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
@@ -145,6 +149,7 @@ class ResearchItem(Base):
     __table_args__ = (
         Index("uk_job_asin", "job_id", "asin", unique=True),
         Index("idx_item_job", "job_id"),
+        Index("idx_item_job_status", "job_id", "process_status"),
         Index("idx_item_asin", "asin"),
         Index("idx_item_process_status", "process_status"),
         Index("idx_item_pass_status", "pass_status"),
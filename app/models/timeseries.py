@@ -1,6 +1,6 @@
 from datetime import datetime, date
 
-from sqlalchemy import String, Integer, Date, Enum, DateTime, ForeignKey, Index
+from sqlalchemy import String, Integer, Date, Enum, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -36,3 +36,38 @@ class ResearchTimeseries(Base):
 
     def __repr__(self) -> str:
         return f"<ResearchTimeseries(asin={self.asin}, metric={self.metric}, date={self.recorded_date})>"
+
+
+class ResearchTimeseriesPacked(Base):
+    """
+    時系列データ（圧縮保存: job_id + ASIN + メトリクスごとに1行）
+
+    data: (keepa_minute, value) の組をint32リトルエンディアンで並べ、
+    先頭の組以外は直前との差分で保存（app.services.timeseries.unpack_series で復元）
+    """
+    __tablename__ = "research_timeseries_packed"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(String(36), ForeignKey("research_job.job_id", ondelete="CASCADE"), nullable=False)
+    asin: Mapped[str] = mapped_column(String(20), nullable=False)
+
+    metric: Mapped[str] = mapped_column(
+        Enum("PRICE", "RANK", "SELLER_COUNT", "FBA_SELLER_COUNT", name="timeseries_metric"),
+        nullable=False
+    )
+    point_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    source: Mapped[str] = mapped_column(
+        Enum("KEEPA", "SP_API", "MANUAL", name="timeseries_source"),
+        nullable=False,
+        default="KEEPA"
+    )
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("uk_timeseries_packed", "job_id", "asin", "metric", unique=True),
+    )
+
+    def __repr__(self) -> str:
+        return f"<ResearchTimeseriesPacked(asin={self.asin}, metric={self.metric}, points={self.point_count})>"
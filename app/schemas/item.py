@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Any
 from enum import Enum
 
@@ -89,6 +89,18 @@ class ItemListResponse(BaseModel):
     review_count: int
 
 
+class TimeseriesPoint(BaseModel):
+    date: date
+    value: int
+
+
+class ItemTimeseriesResponse(BaseModel):
+    item_id: int
+    asin: str
+    # メトリクス（PRICE/RANK）ごとの1日1点の時系列（日付の昇順）
+    series: dict[str, List[TimeseriesPoint]]
+
+
 class ItemUpdateCandidate(BaseModel):
     is_candidate: bool = Field(..., description="仕入れ候補フラグ")
     user_memo: Optional[str] = Field(None, description="ユーザーメモ")
@@ -0,0 +1,916 @@
+"""
+APIキャッシュ（多段キャッシュ）
+
+Keepa / SP-API / 楽天の各サービスで共有するキャッシュアクセス。
+
+- L1: プロセス内LRU（件数上限つき。ジョブをまたいで再利用）
+- L2: Redis（全ワーカーで共有）
+- L3: MySQL api_cacheテーブル（永続）
+
+読み込みはL1 → L2 → L3の順に探し、下位でヒットしたものは上位へ昇格する。
+書き込みは全段へ同時に反映する（write-through）。TTLは全段で同じ期限を使う。
+
+一定サイズ以上のレスポンス（Keepaのcsv/stats等）はJSONをzlib/zstdで圧縮し、
+L2/L3にはバイト列のまま保存する（L1はデコード済みのデータを保持）。
+
+ジョブ開始時に対象キーをまとめて読み込み（prefetch）、
+以降はメモリ上で判定してDB/APIへの問い合わせを真のミスだけに絞る。
+
+CACHE_SERVE_STALE有効時は期限切れ後もCACHE_STALE_MAX_SECONDSの間は各段に残し、
+期限切れのデータをそのまま返したうえで低優先度キュー（cache_refresh）に再取得を積む。
+期限切れのエントリはミスとして下位の段も探し、再取得済みの有効なデータがあればそちらを使う。
+ジョブはキャッシュの更新を待たない。
+
+APIに該当データが無かった結果（未登録ASIN・楽天ヒットなし等）はNOT_FOUNDとして
+API種別ごとの短いTTLで保存し（ネガティブキャッシュ）、同じ空振りでクォータを消費しない。
+
+キャッシュミス時のAPI取得はキー単位のRedisロックで1回にまとめる（singleflight）。
+他のワーカーが取得中のキーはロックの解放を待ってキャッシュから読む。
+取得側はロックの解放前に結果をRedisへ置く（L2無効時も受け渡し用に短いTTLで置く）ため、
+L3への書き込みが未コミットでも待機側は再取得しない。
+
+ヒットしたキーの最終アクセス日時（last_accessed_at）はまとめて更新し、
+定期掃除（sweep_expired / evict_least_recently_used）で行数上限を超えた分の削除順に使う。
+
+L3への書き込みは INSERT ... ON DUPLICATE KEY UPDATE の1文で行う。
+buffer_writes=True の場合はL1/L2へ即時反映したうえでL3への書き込みをためておき、
+flush() で複数行の1文 + 1コミットにまとめる（バッチ単位の書き込み）。
+このときはためた件数が上限に達した場合の自動反映（書き込み・最終アクセス日時）もコミットせず、
+コミットは呼び出し側（ItemUnitOfWork等）に任せる。
+auto_flush=False の場合は自動反映もせずにため続け、take_pending_writes で取り出して
+別のストアの add_pending_writes へ渡す（別スレッドのセッションで書き込まず、書き込むセッションを1つにまとめる）。
+
+非同期版のメソッド（*_async）はセッションを使う処理を run_db で実行する。
+db_executor を渡すとそのスレッドで実行し、イベントループをDBの待ちで止めない
+（セッションはスレッドセーフではないため、1スレッドのexecutorを渡すこと）。
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Executor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from redis.exceptions import RedisError
+from rq import Queue
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import get_redis, upsert_statement
+from app.models.cache import ApiCache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    if settings.cache_compression == "zstd":
+        logger.warning("zstandard not available, falling back to zlib cache compression")
+
+# prefetch時の IN (...) / MGET 1回あたりのキー数
+PREFETCH_CHUNK_SIZE = 500
+
+# 最終アクセス日時の更新をこの件数たまったらまとめて反映
+ACCESS_FLUSH_SIZE = 500
+
+# 書き込み時に上書きする列（一意キーcache_keyが重複した場合）
+UPSERT_COLUMNS = (
+    "api_type",
+    "request_params",
+    "response_data",
+    "response_blob",
+    "response_encoding",
+    "fetched_at",
+    "expires_at",
+    "last_accessed_at",
+)
+
+# Redis上のキー: apicache:{cache_key}
+REDIS_KEY_PREFIX = "apicache:"
+
+# 期限切れ後もデータを残して返す秒数（0: 期限切れはミス扱い）
+STALE_GRACE_SECONDS = settings.cache_stale_max_seconds if settings.cache_serve_stale else 0
+
+# 再取得キュー（researchより低優先度: `rq worker research cache_refresh`）
+CACHE_REFRESH_QUEUE = "cache_refresh"
+
+# 再取得の重複登録防止: apicache:refresh:{cache_key}
+# この秒数で自動解除（再取得に失敗したキーもこの間隔でしか再登録しない）
+REFRESH_MARK_PREFIX = "apicache:refresh:"
+REFRESH_MARK_SECONDS = 3600
+
+# 取得中ロック: apicache:lock:{cache_key}
+# 取得側が異常終了してもこの秒数で解放され、待機側が自分で取得する
+# （L2無効時に取得結果を待機側へ受け渡すエントリもこの秒数で消える）
+FETCH_LOCK_PREFIX = "apicache:lock:"
+FETCH_LOCK_SECONDS = 300
+FETCH_WAIT_INTERVAL = 0.2
+
+# 自分が取得したロックのみ解放
+RELEASE_LOCKS_SCRIPT = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+        released = released + 1
+    end
+end
+return released
+"""
+
+# 保存形式: json（非圧縮） / json+zlib / json+zstd / not_found（ネガティブキャッシュ）
+ENCODING_JSON = "json"
+ENCODING_ZLIB = "json+zlib"
+ENCODING_ZSTD = "json+zstd"
+ENCODING_NOT_FOUND = "not_found"
+
+
+class _NotFound:
+    """ネガティブキャッシュの値（APIに該当データなし）"""
+
+    def __repr__(self) -> str:
+        return "NOT_FOUND"
+
+
+NOT_FOUND = _NotFound()
+
+# ネガティブキャッシュのTTL（API種別ごと）
+NEGATIVE_TTL_SECONDS = {
+    "KEEPA": settings.cache_negative_ttl_keepa,
+    "KEEPA_PARSED": settings.cache_negative_ttl_keepa,
+    "SP_API_FEES": settings.cache_negative_ttl_sp_api,
+    "SP_API_PRICING": settings.cache_negative_ttl_sp_api,
+    "SP_API_CATALOG": settings.cache_negative_ttl_sp_api,
+    "SP_API_RESTRICTIONS": settings.cache_negative_ttl_sp_api,
+    "RAKUTEN_PRODUCT": settings.cache_negative_ttl_rakuten,
+    "RAKUTEN_SEARCH": settings.cache_negative_ttl_rakuten,
+}
+
+
+def _to_epoch(dt: datetime) -> float:
+    """expires_at（UTCのnaive datetime）をUNIX時刻に変換"""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _compression_encoding() -> str:
+    """設定に応じた圧縮形式（zstdが無ければzlib）"""
+    if settings.cache_compression == "zstd":
+        if ZSTD_AVAILABLE:
+            return ENCODING_ZSTD
+        return ENCODING_ZLIB
+    if settings.cache_compression == "zlib":
+        return ENCODING_ZLIB
+    return ENCODING_JSON
+
+
+def encode_payload(data: Any) -> tuple[str, bytes]:
+    """
+    データをシリアライズ（一定サイズ以上なら圧縮）
+
+    Returns:
+        (encoding, バイト列)
+    """
+    if data is NOT_FOUND:
+        return ENCODING_NOT_FOUND, b""
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    encoding = _compression_encoding()
+    if encoding == ENCODING_JSON or len(raw) < settings.cache_compression_min_bytes:
+        return ENCODING_JSON, raw
+    if encoding == ENCODING_ZSTD:
+        return encoding, zstandard.ZstdCompressor().compress(raw)
+    return encoding, zlib.compress(raw)
+
+
+def decode_payload(encoding: str, body: bytes) -> Any:
+    """encode_payloadの逆変換"""
+    if encoding == ENCODING_NOT_FOUND:
+        return NOT_FOUND
+    if encoding == ENCODING_ZLIB:
+        body = zlib.decompress(body)
+    elif encoding == ENCODING_ZSTD:
+        body = zstandard.ZstdDecompressor().decompress(body)
+    return json.loads(body)
+
+
+class LruCache:
+    """プロセス内LRU（件数上限・期限つき、スレッドセーフ）"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[tuple[float, Any]]:
+        """(期限, データ) を返す（期限切れでも猶予期間内なら返す）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] + STALE_GRACE_SECONDS <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, data: Any, expires: float):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# L1はプロセス内で共有（同じASINがジョブをまたいで繰り返し出てくるため）
+_local_cache = LruCache(settings.cache_local_max_entries)
+
+
+class RedisCacheTier:
+    """L2: Redis（値は "{期限(UNIX時刻)}|{encoding}|" + バイト列）"""
+
+    def __init__(self):
+        self._fallback_logged = False
+
+    def _log_error(self, e: Exception):
+        if not self._fallback_logged:
+            logger.warning(f"API cache: Redis unavailable, skipping L2 ({e})")
+            self._fallback_logged = True
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple[float, Any]]:
+        """有効なエントリを {cache_key: (期限, データ)} で返す"""
+        if not keys:
+            return {}
+        try:
+            values = get_redis().mget([REDIS_KEY_PREFIX + key for key in keys])
+            self._fallback_logged = False
+        except RedisError as e:
+            self._log_error(e)
+            return {}
+
+        now = time.time()
+        result = {}
+        for key, value in zip(keys, values):
+            if value is None:
+                continue
+            try:
+                expires, encoding, body = value.split(b"|", 2)
+                expires = float(expires)
+                if expires + STALE_GRACE_SECONDS > now:
+                    result[key] = (expires, decode_payload(encoding.decode(), body))
+            except (ValueError, zlib.error) as e:
+                logger.warning(f"API cache: invalid Redis entry {key} ({e})")
+        return result
+
+    def set_many(self, entries: dict[str, tuple[float, str, bytes]], max_ttl: Optional[int] = None):
+        """
+        {cache_key: (期限, encoding, バイト列)} を残りTTLつきで保存
+
+        Args:
+            max_ttl: TTLの上限（秒）。取得結果の受け渡しだけに使う場合に指定する
+        """
+        if not entries:
+            return
+        now = time.time()
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key, (expires, encoding, body) in entries.items():
+                ttl = int(expires + STALE_GRACE_SECONDS - now)
+                if max_ttl is not None:
+                    ttl = min(ttl, max_ttl)
+                if ttl <= 0:
+                    continue
+                pipe.setex(REDIS_KEY_PREFIX + key, ttl, f"{expires:.3f}|{encoding}|".encode() + body)
+            pipe.execute()
+            self._fallback_logged = False
+        except RedisError as e:
+            self._log_error(e)
+
+    def mark_for_refresh(self, keys: list[str]) -> list[str]:
+        """再取得待ちとして登録し、新たに登録できたキーを返す（他ワーカーが登録済みのものは除く）"""
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key in keys:
+                pipe.set(REFRESH_MARK_PREFIX + key, 1, nx=True, ex=REFRESH_MARK_SECONDS)
+            marked = [key for key, ok in zip(keys, pipe.execute()) if ok]
+            self._fallback_logged = False
+            return marked
+        except RedisError as e:
+            self._log_error(e)
+            return []
+
+    def acquire_locks(self, keys: list[str], token: str) -> list[str]:
+        """
+        取得中ロックを獲得し、獲得できたキーを返す
+
+        Redisに接続できない場合は全キーを返す（まとめずにそれぞれ取得する）
+        """
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key in keys:
+                pipe.set(FETCH_LOCK_PREFIX + key, token, nx=True, px=FETCH_LOCK_SECONDS * 1000)
+            owned = [key for key, ok in zip(keys, pipe.execute()) if ok]
+            self._fallback_logged = False
+            return owned
+        except RedisError as e:
+            self._log_error(e)
+            return list(keys)
+
+    def release_locks(self, keys: list[str], token: str):
+        """獲得した取得中ロックを解放"""
+        if not keys:
+            return
+        try:
+            get_redis().eval(RELEASE_LOCKS_SCRIPT, len(keys), *[FETCH_LOCK_PREFIX + key for key in keys], token)
+        except RedisError as e:
+            self._log_error(e)
+
+    def locked_keys(self, keys: list[str]) -> set[str]:
+        """他で取得中（ロックが残っている）のキー"""
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for key in keys:
+                pipe.exists(FETCH_LOCK_PREFIX + key)
+            return {key for key, exists in zip(keys, pipe.execute()) if exists}
+        except RedisError as e:
+            self._log_error(e)
+            return set()
+
+    def clear_refresh_marks(self, keys: list[str]):
+        """再取得待ちの登録を解除"""
+        try:
+            get_redis().delete(*[REFRESH_MARK_PREFIX + key for key in keys])
+        except RedisError as e:
+            self._log_error(e)
+
+
+_redis_tier = RedisCacheTier()
+
+
+def enqueue_cache_refresh(cache_keys: list[str]) -> Optional[str]:
+    """
+    期限切れキャッシュの再取得を低優先度キューに登録
+
+    Returns:
+        RQ job ID（登録対象なし / Redis接続不可の場合はNone）
+    """
+    keys = _redis_tier.mark_for_refresh(cache_keys)
+    if not keys:
+        return None
+    try:
+        job = Queue(CACHE_REFRESH_QUEUE, connection=get_redis()).enqueue(
+            "app.workers.tasks.refresh_stale_cache",
+            keys,
+            job_timeout="1h",
+            result_ttl=3600,
+        )
+    except RedisError as e:
+        logger.warning(f"API cache: failed to enqueue refresh ({e})")
+        _redis_tier.clear_refresh_marks(keys)
+        return None
+    logger.info(f"Cache refresh enqueued: {len(keys)} keys")
+    return job.id
+
+
+class ApiCacheStore:
+    """APIキャッシュの読み書き（多段キャッシュ + ジョブ単位のprefetch）"""
+
+    def __init__(
+        self,
+        db: Session,
+        buffer_writes: bool = False,
+        db_executor: Optional[Executor] = None,
+        auto_flush: bool = True,
+    ):
+        self.db = db
+        self.local = _local_cache
+        self.redis = _redis_tier if settings.cache_redis_enabled else None
+        # L3への書き込みをflush()までためる
+        self.buffer_writes = buffer_writes
+        # buffer_writes時: 件数上限での自動反映をしない（take_pending_writesで取り出すまでためる）
+        self.auto_flush = auto_flush
+        self._pending_rows: dict[str, dict] = {}
+        self._entries: dict[str, Any] = {}
+        # prefetch済みのキー（ヒットしなかったキーも含む。どの段にも無いことが確定している）
+        self._loaded_keys: set[str] = set()
+        # 最終アクセス日時の更新待ち
+        self._accessed_keys: set[str] = set()
+        # fetch_coalesced_asyncで取得中のキー（完了を通知するFuture）
+        self._async_fetches: dict[str, asyncio.Future] = {}
+        # L2無効時: ロックを取って取得中に書き込んだ値（ロック解放前に待機側へ受け渡す）
+        self._coalescing = 0
+        self._handoff: dict[str, tuple[float, str, bytes]] = {}
+        # 非同期版のメソッドでセッションを使う処理を実行するスレッド（Noneならイベントループで直接実行）
+        self.db_executor = db_executor
+
+    async def run_db(self, fn: Callable[..., Any], *args) -> Any:
+        """セッションを使う処理を実行（db_executorがあればそのスレッドで実行して待つ）"""
+        if self.db_executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.db_executor, partial(fn, *args))
+
+    def _mark_accessed(self, cache_keys: Iterable[str]):
+        """ヒットしたキーを記録（一定件数たまったらDBへ反映。buffer_writes時はコミットしない）"""
+        self._accessed_keys.update(cache_keys)
+        if self.auto_flush and len(self._accessed_keys) >= ACCESS_FLUSH_SIZE:
+            self.flush_access_times(commit=not self.buffer_writes)
+
+    def flush_access_times(self, commit: bool = True):
+        """
+        記録したキーのlast_accessed_atをまとめて更新
+
+        commit=False の場合は実行のみ行い、コミットは呼び出し側に任せる
+        """
+        if not self._accessed_keys:
+            return
+        keys = list(self._accessed_keys)
+        self._accessed_keys.clear()
+        now = datetime.utcnow()
+        for start in range(0, len(keys), PREFETCH_CHUNK_SIZE):
+            chunk = keys[start:start + PREFETCH_CHUNK_SIZE]
+            self.db.query(ApiCache).filter(ApiCache.cache_key.in_(chunk)).update(
+                {ApiCache.last_accessed_at: now}, synchronize_session=False
+            )
+        if commit:
+            self.db.commit()
+
+    def _lookup(self, keys: list[str]) -> dict[str, Any]:
+        """
+        L1 → L2 → L3の順に探し、下位でヒットしたものを上位へ昇格
+
+        期限切れ（猶予期間内）のエントリはミスとして下位の段も探す（再取得ジョブが
+        更新した新しいデータがあればそちらを使う）。どの段にも有効なデータが無い場合のみ
+        最も新しい期限切れのデータを返し、再取得をキューに積む
+        """
+        found: dict[str, Any] = {}
+        # 期限切れのうち最も新しいもの: {cache_key: (期限, データ)}
+        stale_entries: dict[str, tuple[float, Any]] = {}
+        now = time.time()
+
+        def consider(key: str, expires: float, data: Any) -> bool:
+            """有効ならfoundへ、期限切れなら新しい方を残す。有効ならTrue"""
+            if expires > now:
+                found[key] = data
+                stale_entries.pop(key, None)
+                return True
+            if key not in stale_entries or stale_entries[key][0] < expires:
+                stale_entries[key] = (expires, data)
+            return False
+
+        missing = []
+        for key in keys:
+            entry = self.local.get(key)
+            if entry is None or not consider(key, *entry):
+                missing.append(key)
+
+        if missing and self.redis is not None:
+            hits = self.redis.get_many(missing)
+            for key, (expires, data) in hits.items():
+                if consider(key, expires, data):
+                    self.local.set(key, data, expires)
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            rows = (
+                self.db.query(
+                    ApiCache.cache_key,
+                    ApiCache.response_data,
+                    ApiCache.response_blob,
+                    ApiCache.response_encoding,
+                    ApiCache.expires_at,
+                )
+                .filter(
+                    ApiCache.cache_key.in_(missing),
+                    ApiCache.expires_at > datetime.utcnow() - timedelta(seconds=STALE_GRACE_SECONDS),
+                )
+                .all()
+            )
+            promoted = {}
+            for cache_key, response_data, response_blob, encoding, expires_at in rows:
+                expires = _to_epoch(expires_at)
+                stale = stale_entries.get(cache_key)
+                if expires <= now and stale is not None and stale[0] >= expires:
+                    continue
+                if encoding == ENCODING_NOT_FOUND:
+                    data = NOT_FOUND
+                    promoted[cache_key] = (expires, encoding, b"")
+                elif response_blob is not None:
+                    data = decode_payload(encoding, response_blob)
+                    promoted[cache_key] = (expires, encoding, response_blob)
+                else:
+                    data = response_data
+                    if self.redis is not None:
+                        promoted[cache_key] = (expires, *encode_payload(data))
+                consider(cache_key, expires, data)
+                self.local.set(cache_key, data, expires)
+            if self.redis is not None:
+                self.redis.set_many(promoted)
+
+        if stale_entries:
+            logger.debug(f"Serving {len(stale_entries)} stale cache entries")
+            for key, (_, data) in stale_entries.items():
+                found[key] = data
+            enqueue_cache_refresh(list(stale_entries))
+
+        self._mark_accessed(found)
+        return found
+
+    def prefetch(self, cache_keys: Iterable[str]) -> int:
+        """
+        有効なキャッシュをまとめて読み込む
+
+        Returns:
+            ヒット件数
+        """
+        keys = [key for key in dict.fromkeys(cache_keys) if key not in self._loaded_keys]
+        if not keys:
+            return 0
+
+        hits = 0
+        for start in range(0, len(keys), PREFETCH_CHUNK_SIZE):
+            chunk = keys[start:start + PREFETCH_CHUNK_SIZE]
+            found = self._lookup(chunk)
+            self._entries.update(found)
+            hits += len(found)
+            self._loaded_keys.update(chunk)
+
+        logger.info(f"Cache prefetch: {hits}/{len(keys)} hits")
+        return hits
+
+    def fetch_coalesced(
+        self,
+        cache_keys: list[str],
+        fetch: Callable[[list[str]], dict[str, Any]],
+    ) -> dict[str, Any]:
+        """
+        キャッシュミスしたキーをワーカー間で1回だけ取得（singleflight）
+
+        ロックを獲得できたキーはfetchで取得し、他で取得中のキーは完了を待ってキャッシュから読む。
+        取得側が失敗した（キャッシュに無い）キーは自分でfetchする。
+
+        Args:
+            cache_keys: キャッシュミスしたキー
+            fetch: キーのリストを受け取りAPIから取得する関数。
+                   結果をキャッシュに保存（set）し、{cache_key: データ} を返すこと
+
+        Returns:
+            {cache_key: データ}（取得できなかったキー・NOT_FOUNDのキーは含まない）
+        """
+        token = uuid.uuid4().hex
+        owned = _redis_tier.acquire_locks(cache_keys, token)
+        waiting = [key for key in cache_keys if key not in set(owned)]
+
+        results = {}
+        if owned:
+            self._coalescing += 1
+            try:
+                results.update(fetch(owned))
+                self._publish_fetched(owned)
+            finally:
+                self._coalescing -= 1
+                self._discard_handoff(owned)
+                _redis_tier.release_locks(owned, token)
+
+        if waiting:
+            logger.debug(f"Waiting for {len(waiting)} keys fetched by other workers")
+            found = self._wait_for_fetch(waiting)
+            remaining = self._take_fetched(waiting, found, results)
+            if remaining:
+                results.update(fetch(remaining))
+
+        return results
+
+    async def fetch_coalesced_async(
+        self,
+        cache_keys: list[str],
+        fetch: Callable[[list[str]], Awaitable[dict[str, Any]]],
+    ) -> dict[str, Any]:
+        """
+        fetch_coalescedの非同期版（fetchはコルーチン関数）
+
+        他で取得中のキーはasyncio.sleepで待つため、待機中も同じイベントループの他の処理が進む。
+        同じイベントループ内で取得中のキーはその完了を待つ（Redisに接続できなくても1回にまとまる）。
+        """
+        in_flight = {key: self._async_fetches[key] for key in cache_keys if key in self._async_fetches}
+        own = [key for key in cache_keys if key not in in_flight]
+
+        results = {}
+        if own:
+            done = asyncio.get_running_loop().create_future()
+            for key in own:
+                self._async_fetches[key] = done
+            try:
+                results.update(await self._fetch_locked_async(own, fetch))
+            finally:
+                for key in own:
+                    del self._async_fetches[key]
+                done.set_result(None)
+
+        if in_flight:
+            await asyncio.gather(*set(in_flight.values()))
+            remaining = await self.run_db(self._take_loaded, list(in_flight), results)
+            if remaining:
+                results.update(await fetch(remaining))
+
+        return results
+
+    async def _fetch_locked_async(
+        self,
+        cache_keys: list[str],
+        fetch: Callable[[list[str]], Awaitable[dict[str, Any]]],
+    ) -> dict[str, Any]:
+        """Redisロック（ワーカー間のsingleflight）を取って取得"""
+        token = uuid.uuid4().hex
+        owned = _redis_tier.acquire_locks(cache_keys, token)
+        waiting = [key for key in cache_keys if key not in set(owned)]
+
+        results = {}
+        if owned:
+            self._coalescing += 1
+            try:
+                results.update(await fetch(owned))
+                self._publish_fetched(owned)
+            finally:
+                self._coalescing -= 1
+                self._discard_handoff(owned)
+                _redis_tier.release_locks(owned, token)
+
+        if waiting:
+            logger.debug(f"Waiting for {len(waiting)} keys fetched by other workers")
+            found = await self._wait_for_fetch_async(waiting)
+            remaining = await self.run_db(self._take_fetched, waiting, found, results)
+            if remaining:
+                results.update(await fetch(remaining))
+
+        return results
+
+    def _publish_fetched(self, cache_keys: list[str]):
+        """
+        取得した値を待機側が読めるようにする（ロック解放前に呼ぶ）
+
+        L2有効時はset()でRedisへ書き込み済み。L2無効時はL3の書き込みがコミット前
+        （buffer_writes）でも見えるよう、受け渡し用に短いTTLでRedisへ置く
+        """
+        if self.redis is not None:
+            return
+        entries = {key: self._handoff.pop(key) for key in cache_keys if key in self._handoff}
+        _redis_tier.set_many(entries, max_ttl=FETCH_LOCK_SECONDS)
+
+    def _discard_handoff(self, cache_keys: list[str]):
+        for key in cache_keys:
+            self._handoff.pop(key, None)
+
+    def _read_fetched(self, cache_keys: list[str]) -> dict[str, Any]:
+        """他で取得されたキーを読む（L2無効時も受け渡し用のRedisのエントリを先に見る）"""
+        found = {}
+        if self.redis is None:
+            for key, (expires, data) in _redis_tier.get_many(cache_keys).items():
+                self.local.set(key, data, expires)
+                found[key] = data
+        rest = [key for key in cache_keys if key not in found]
+        if rest:
+            found.update(self._lookup(rest))
+        return found
+
+    def _take_fetched(self, waiting: list[str], found: dict[str, Any], results: dict[str, Any]) -> list[str]:
+        """
+        他で取得されたキーを読み込み済みにしてresultsへ追加
+
+        Returns:
+            取得されなかった（自分で取得する）キー
+        """
+        self._entries.update(found)
+        self._loaded_keys.update(found)
+        results.update((key, data) for key, data in found.items() if data is not NOT_FOUND)
+        return [key for key in waiting if key not in found]
+
+    def _take_loaded(self, waiting: list[str], results: dict[str, Any]) -> list[str]:
+        """同じイベントループ内で取得されたキー（読み込み済み）をresultsへ追加"""
+        found = {key: self._entries[key] for key in waiting if key in self._entries}
+        return self._take_fetched(waiting, found, results)
+
+    def fetch_one(self, cache_key: str, fetch: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """単一キー版のfetch_coalesced（fetchは結果をキャッシュに保存して返すこと）"""
+        def fetch_keys(keys: list[str]) -> dict[str, Any]:
+            data = fetch()
+            return {cache_key: data} if data is not None else {}
+
+        return self.fetch_coalesced([cache_key], fetch_keys).get(cache_key)
+
+    async def fetch_one_async(self, cache_key: str, fetch: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """fetch_oneの非同期版（fetchはコルーチン関数）"""
+        async def fetch_keys(keys: list[str]) -> dict[str, Any]:
+            data = await fetch()
+            return {cache_key: data} if data is not None else {}
+
+        return (await self.fetch_coalesced_async([cache_key], fetch_keys)).get(cache_key)
+
+    def _wait_for_fetch(self, cache_keys: list[str]) -> dict[str, Any]:
+        """他で取得中のキーのロック解放を待ち、キャッシュから読む"""
+        found = {}
+        pending = list(cache_keys)
+        deadline = time.monotonic() + FETCH_LOCK_SECONDS
+        while pending and time.monotonic() < deadline:
+            time.sleep(FETCH_WAIT_INTERVAL)
+            locked = _redis_tier.locked_keys(pending)
+            done = [key for key in pending if key not in locked]
+            if done:
+                found.update(self._read_fetched(done))
+            pending = [key for key in pending if key in locked]
+        return found
+
+    async def _wait_for_fetch_async(self, cache_keys: list[str]) -> dict[str, Any]:
+        """_wait_for_fetchの非同期版"""
+        found = {}
+        pending = list(cache_keys)
+        deadline = time.monotonic() + FETCH_LOCK_SECONDS
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(FETCH_WAIT_INTERVAL)
+            locked = _redis_tier.locked_keys(pending)
+            done = [key for key in pending if key not in locked]
+            if done:
+                found.update(await self.run_db(self._read_fetched, done))
+            pending = [key for key in pending if key in locked]
+        return found
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        """
+        キャッシュからデータを取得
+
+        Returns:
+            データ / NOT_FOUND（ネガティブキャッシュ） / None（キャッシュなし）
+        """
+        if cache_key in self._loaded_keys:
+            data = self._entries.get(cache_key)
+            if data is not None:
+                logger.debug(f"Cache hit (prefetched): {cache_key}")
+                self._mark_accessed([cache_key])
+            return data
+
+        data = self._lookup([cache_key]).get(cache_key)
+        if data is not None:
+            logger.debug(f"Cache hit: {cache_key}")
+        return data
+
+    def set(
+        self,
+        cache_key: str,
+        api_type: str,
+        data: Any,
+        params: dict = None,
+        ttl_seconds: Optional[int] = None,
+    ):
+        """キャッシュにデータを保存（全段へ書き込み）"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds or settings.cache_ttl_seconds)
+
+        encoding, body = encode_payload(data)
+
+        self._pending_rows[cache_key] = {
+            "cache_key": cache_key,
+            "api_type": api_type,
+            "request_params": params,
+            "response_data": data if encoding == ENCODING_JSON else None,
+            "response_blob": body if encoding in (ENCODING_ZLIB, ENCODING_ZSTD) else None,
+            "response_encoding": encoding,
+            "fetched_at": now,
+            "expires_at": expires_at,
+            "last_accessed_at": now,
+        }
+        self._flush_if_full()
+
+        expires = _to_epoch(expires_at)
+        self.local.set(cache_key, data, expires)
+        if self.redis is not None:
+            self.redis.set_many({cache_key: (expires, encoding, body)})
+        elif self._coalescing:
+            self._handoff[cache_key] = (expires, encoding, body)
+
+        self._entries[cache_key] = data
+        self._loaded_keys.add(cache_key)
+
+    def set_not_found(self, cache_key: str, api_type: str, params: dict = None):
+        """該当データなしをAPI種別ごとのTTLで保存（ネガティブキャッシュ）"""
+        self.set(cache_key, api_type, NOT_FOUND, params, ttl_seconds=NEGATIVE_TTL_SECONDS.get(api_type))
+
+    def _flush_if_full(self):
+        """L3への書き込みを反映（buffer_writes時はためた件数が上限に達した場合のみ）"""
+        if not self.buffer_writes:
+            self.flush()
+        elif self.auto_flush and len(self._pending_rows) >= settings.cache_write_batch_size:
+            # ためた分の書き込みのみ実行（コミットはItemUnitOfWork等の呼び出し側）
+            self.flush(commit=False)
+
+    def take_pending_writes(self) -> tuple[list[dict], Iterable[str]]:
+        """
+        ためたL3への書き込みと最終アクセス日時の更新待ちを取り出す（このストアでは反映しない）
+
+        Returns:
+            (api_cacheの行リスト, 最終アクセス日時を更新するキー)
+        """
+        rows = list(self._pending_rows.values())
+        self._pending_rows.clear()
+        accessed_keys, self._accessed_keys = self._accessed_keys, set()
+        return rows, accessed_keys
+
+    def add_pending_writes(self, rows: list[dict], accessed_keys: Iterable[str]):
+        """別のストアの take_pending_writes で取り出した書き込みを、このストアのセッションで反映する"""
+        for row in rows:
+            self._pending_rows[row["cache_key"]] = row
+        if rows:
+            self._flush_if_full()
+        if accessed_keys:
+            self._mark_accessed(accessed_keys)
+
+    def flush(self, commit: bool = True):
+        """
+        ためたL3への書き込みを複数行のupsertでまとめて反映（1コミット）
+
+        commit=False の場合は実行のみ行い、コミットは呼び出し側に任せる
+        """
+        if not self._pending_rows:
+            return
+        # 一意キーのロックを全ワーカーで同じ順に取るよう、cache_keyの順に並べる（デッドロック防止）
+        rows = sorted(self._pending_rows.values(), key=lambda row: row["cache_key"])
+        self._pending_rows.clear()
+        batch_size = max(settings.cache_write_batch_size, 1)
+        for start in range(0, len(rows), batch_size):
+            self.db.execute(upsert_statement(ApiCache, rows[start:start + batch_size], UPSERT_COLUMNS))
+        if commit:
+            self.db.commit()
+
+
+def sweep_expired(db: Session, chunk_size: int = None) -> int:
+    """
+    期限切れ（stale猶予期間も過ぎた）キャッシュを削除
+
+    ロックを長く保持しないよう chunk_size 件ずつ削除・コミットする
+
+    Returns:
+        削除件数
+    """
+    chunk_size = chunk_size or settings.cache_sweep_chunk_size
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_GRACE_SECONDS)
+    deleted = 0
+    while True:
+        ids = [
+            row.id
+            for row in db.query(ApiCache.id)
+            .filter(ApiCache.expires_at <= cutoff)
+            .order_by(ApiCache.expires_at)
+            .limit(chunk_size)
+            .all()
+        ]
+        if not ids:
+            break
+        db.query(ApiCache).filter(ApiCache.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+        if len(ids) < chunk_size:
+            break
+    return deleted
+
+
+def evict_least_recently_used(db: Session, max_rows: int = None, chunk_size: int = None) -> int:
+    """
+    行数上限を超えた分を最終アクセスの古い順に削除
+
+    Returns:
+        削除件数
+    """
+    max_rows = settings.cache_max_rows if max_rows is None else max_rows
+    chunk_size = chunk_size or settings.cache_sweep_chunk_size
+    if max_rows <= 0:
+        return 0
+
+    excess = db.query(func.count(ApiCache.id)).scalar() - max_rows
+    deleted = 0
+    while excess > 0:
+        ids = [
+            row.id
+            for row in db.query(ApiCache.id)
+            .order_by(ApiCache.last_accessed_at)
+            .limit(min(chunk_size, excess))
+            .all()
+        ]
+        if not ids:
+            break
+        db.query(ApiCache).filter(ApiCache.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += len(ids)
+        excess -= len(ids)
+    return deleted
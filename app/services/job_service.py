@@ -1,14 +1,17 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
 import uuid
 
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
+from app.config import get_settings
 from app.models.job import ResearchJob
 from app.models.item import ResearchItem
 from app.schemas.job import JobCreate
 
+settings = get_settings()
+
 
 class JobService:
 
@@ -126,18 +129,143 @@ class JobService:
         return job
 
     @staticmethod
-    def get_pending_items(db: Session, job_id: str, limit: int = 100) -> List[ResearchItem]:
-        """処理待ちのアイテムを取得"""
-        return (
+    def iter_pending_id_ranges(db: Session, job_id: str, chunk_size: int) -> Iterator[Tuple[int, int]]:
+        """
+        処理待ちのアイテムをid順にchunk_size件ずつ区切り、各区切りの (最初のid, 最後のid) を返す
+
+        idだけをキーセット方式で読むため、件数によらずメモリに載るのはchunk_size件分だけ
+        """
+        chunk_size = max(chunk_size, 1)
+        last_id = None
+        while True:
+            query = db.query(ResearchItem.id).filter(
+                ResearchItem.job_id == job_id,
+                ResearchItem.process_status == "PENDING"
+            )
+            if last_id is not None:
+                query = query.filter(ResearchItem.id > last_id)
+            item_ids = [item_id for item_id, in query.order_by(ResearchItem.id).limit(chunk_size)]
+            if not item_ids:
+                return
+            last_id = item_ids[-1]
+            yield item_ids[0], last_id
+            if len(item_ids) < chunk_size:
+                return
+
+    @staticmethod
+    def claim_pending_items(
+        db: Session,
+        job_id: str,
+        limit: Optional[int] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+    ) -> List[ResearchItem]:
+        """
+        処理待ちのアイテムをid順にlimit件まで確保し、PROCESSINGにして返す
+
+        SELECT ... FOR UPDATE SKIP LOCKED で他のワーカーが確保中の行を飛ばして選び、
+        PENDINGのままの行だけを確保トークン付きで更新する（条件付きUPDATE）。
+        同時に呼ばれても同じアイテムを複数のワーカーが確保することはない。
+        確保は lease_seconds 後に期限切れとなり、release_expired_claims で処理待ちに戻る
+
+        Args:
+            limit: 確保する件数（省略時はJOB_PAGE_SIZE）
+            min_id / max_id: id範囲（チャンクの処理用）
+            lease_seconds: 確保の期限（省略時はJOB_CLAIM_LEASE_SECONDS）
+
+        Returns:
+            確保したアイテム（空なら処理待ちなし）
+        """
+        limit = max(limit or settings.job_page_size, 1)
+        if lease_seconds is None:
+            lease_seconds = settings.job_claim_lease_seconds
+
+        query = db.query(ResearchItem.id).filter(
+            ResearchItem.job_id == job_id,
+            ResearchItem.process_status == "PENDING"
+        )
+        if min_id is not None:
+            query = query.filter(ResearchItem.id >= min_id)
+        if max_id is not None:
+            query = query.filter(ResearchItem.id <= max_id)
+        item_ids = [
+            item_id
+            for item_id, in query.order_by(ResearchItem.id).limit(limit).with_for_update(skip_locked=True)
+        ]
+        if not item_ids:
+            db.commit()
+            return []
+
+        claim_token = str(uuid.uuid4())
+        (
             db.query(ResearchItem)
             .filter(
-                ResearchItem.job_id == job_id,
+                ResearchItem.id.in_(item_ids),
                 ResearchItem.process_status == "PENDING"
             )
-            .limit(limit)
+            .update(
+                {
+                    "process_status": "PROCESSING",
+                    "claim_token": claim_token,
+                    "claimed_until": datetime.utcnow() + timedelta(seconds=lease_seconds),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+
+        return (
+            db.query(ResearchItem)
+            .filter(
+                ResearchItem.id.in_(item_ids),
+                ResearchItem.claim_token == claim_token
+            )
+            .order_by(ResearchItem.id)
             .all()
         )
 
+    @staticmethod
+    def release_expired_claims(db: Session, job_id: str) -> int:
+        """確保の期限が切れたPROCESSINGのアイテム（ワーカーの異常終了等）を処理待ちに戻す"""
+        count = (
+            db.query(ResearchItem)
+            .filter(
+                ResearchItem.job_id == job_id,
+                ResearchItem.process_status == "PROCESSING",
+                ResearchItem.claimed_until < datetime.utcnow()
+            )
+            .update(
+                {"process_status": "PENDING", "claim_token": None, "claimed_until": None},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return count
+
+    @staticmethod
+    def release_claims(db: Session, job_id: str, min_id: int, max_id: int) -> int:
+        """
+        id範囲内のPROCESSINGのアイテムを確保の期限によらず処理待ちに戻す
+
+        失敗・タイムアウトしたチャンク用（チャンクのワーカーは終了しており、確保したまま残ったアイテムは処理されない）
+        """
+        count = (
+            db.query(ResearchItem)
+            .filter(
+                ResearchItem.job_id == job_id,
+                ResearchItem.process_status == "PROCESSING",
+                ResearchItem.id >= min_id,
+                ResearchItem.id <= max_id
+            )
+            .update(
+                {"process_status": "PENDING", "claim_token": None, "claimed_until": None},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        return count
+
     @staticmethod
     def get_failed_items(db: Session, job_id: str) -> List[ResearchItem]:
         """失敗したアイテムを取得"""
@@ -4,18 +4,28 @@ Keepa API クライアント
 v1.0では Request Products（基本情報/統計のみ）を使用
 offersは使わない（コスト抑制：1ASIN=1トークン想定）
 
+非同期ワーカー（RESEARCH_WORKER_MODE=async）は AsyncKeepaClient（httpx.AsyncClient）と
+KeepaServiceの *_async メソッドを使う
+
 参考: https://keepa.com/#!discuss/t/product-request/110
 """
+import asyncio
+import bisect
 import logging
+import math
+import threading
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import Optional, Any
 
 import httpx
+import numpy as np
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models.cache import ApiCache
+from app.services.api_cache import NOT_FOUND, ApiCacheStore
+from app.services.rate_limiter import TokenBucket, get_rate_limiter
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -23,9 +33,29 @@ settings = get_settings()
 # Keepa domain codes
 KEEPA_DOMAIN_JP = 5  # Japan
 
+# 1リクエストで取得できる最大ASIN数
+KEEPA_MAX_ASINS_PER_REQUEST = 100
+
+# 1ASINあたりの消費トークン（offersなし）
+KEEPA_TOKENS_PER_ASIN = 1
+
+# トークン不足(429)時の最大リトライ回数
+KEEPA_MAX_RETRIES = 3
+
+# 解析済みデータに残す時系列の日数（最新の点の日を含む直近N日。1日1点への集約は保存時）
+KEEPA_HISTORY_DAYS = 90
+
+# parse_productの出力形式を変えたら上げる（解析済みキャッシュのキーに含める）
+# v2: 時系列を列形式（keepa_minute列 / 値列）に変更
+# v3: 時系列を直近90件から直近KEEPA_HISTORY_DAYS日分の全点に変更
+KEEPA_PARSER_VERSION = 3
+
 # Keepa時間はMinutes since 01.01.2011
 KEEPA_EPOCH = datetime(2011, 1, 1)
 
+# Keepa時間（分）の1日
+MINUTES_PER_DAY = 1440
+
 
 def keepa_time_to_datetime(keepa_time: int) -> datetime:
     """Keepa時間をdatetimeに変換"""
@@ -37,6 +67,158 @@ def datetime_to_keepa_time(dt: datetime) -> int:
     return int((dt - KEEPA_EPOCH).total_seconds() / 60)
 
 
+def keepa_minutes_to_dates(minutes) -> list[date]:
+    """Keepa時間の列を日付の列に変換（NumPyで一括変換）"""
+    days = np.datetime64(KEEPA_EPOCH, "m") + np.asarray(minutes, dtype=np.int64).astype("timedelta64[m]")
+    return days.astype("datetime64[D]").tolist()
+
+
+def keepa_cache_key(asin: str) -> str:
+    """Keepa商品データのキャッシュキー"""
+    return f"keepa_product_{asin}"
+
+
+def keepa_parsed_cache_key(asin: str) -> str:
+    """Keepa解析済みデータのキャッシュキー（パーサーのバージョンつき）"""
+    return f"keepa_parsed_v{KEEPA_PARSER_VERSION}_{asin}"
+
+
+class KeepaTokenScheduler:
+    """
+    Keepaトークン残量モデル
+
+    レスポンスの tokensLeft / refillIn / refillRate / tokensConsumed から
+    現在のトークン残量を推定し、リクエスト前に必要分が貯まるまで待機する。
+    Keepaのトークンは1分ごとに refillRate 分補充され、上限は60分ぶん。
+
+    同じAPIキーを使う他ワーカーの消費分は bucket（Redis共有）で調整する。
+    """
+
+    REFILL_INTERVAL = 60.0  # 秒
+
+    def __init__(self, bucket: Optional[TokenBucket] = None):
+        self.bucket = bucket
+        self.tokens_left: Optional[float] = None  # 最初のレスポンスまでは不明
+        self.refill_rate = 0.0  # tokens / minute
+        self.refill_in = 0.0    # 観測時点から次回補充までの秒数
+        self.observed_at = 0.0
+        self.tokens_consumed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_known(self) -> bool:
+        return self.tokens_left is not None
+
+    def update(self, data: dict):
+        """レスポンスのトークン情報でモデルを更新"""
+        tokens_left = data.get("tokensLeft")
+        if tokens_left is None:
+            return
+
+        with self._lock:
+            self.tokens_left = float(tokens_left)
+            self.refill_rate = float(data.get("refillRate") or self.refill_rate)
+            self.refill_in = float(data.get("refillIn") or 0) / 1000.0
+            self.observed_at = time.monotonic()
+            self.tokens_consumed += int(data.get("tokensConsumed") or 0)
+
+        # 共有バケットを実際の残量に合わせる
+        if self.bucket and self.refill_rate > 0:
+            self.bucket.sync(
+                self.tokens_left,
+                rate=self.refill_rate / self.REFILL_INTERVAL,
+                capacity=self.refill_rate * self.REFILL_INTERVAL,
+            )
+
+    def _refills_since_observed(self, now: float) -> int:
+        elapsed = now - self.observed_at
+        if elapsed < self.refill_in:
+            return 0
+        return 1 + int((elapsed - self.refill_in) // self.REFILL_INTERVAL)
+
+    def estimate_tokens(self, now: float = None) -> Optional[float]:
+        """現在のトークン残量を推定"""
+        if self.tokens_left is None:
+            return None
+        now = now or time.monotonic()
+        tokens = self.tokens_left + self._refills_since_observed(now) * self.refill_rate
+        if self.refill_rate > 0:
+            tokens = min(tokens, self.refill_rate * self.REFILL_INTERVAL)
+        return tokens
+
+    def seconds_until(self, cost: float, now: float = None) -> float:
+        """costトークン貯まるまでの待機秒数"""
+        now = now or time.monotonic()
+        tokens = self.estimate_tokens(now)
+        if self.refill_rate > 0:
+            # 上限を超えるコストは満タンになれば実行できる
+            cost = min(cost, self.refill_rate * self.REFILL_INTERVAL)
+        if tokens is None or tokens >= cost:
+            return 0.0
+        if self.refill_rate <= 0:
+            return self.REFILL_INTERVAL
+
+        refills_needed = math.ceil((cost - tokens) / self.refill_rate)
+        refills_done = self._refills_since_observed(now)
+        target = self.refill_in + (refills_done + refills_needed - 1) * self.REFILL_INTERVAL
+        return max(0.0, target - (now - self.observed_at))
+
+    def _reserve(self, cost: float) -> float:
+        """costトークン分を予約できれば0、足りなければ補充までの待機秒数を返す"""
+        with self._lock:
+            wait = self.seconds_until(cost)
+            if wait <= 0:
+                # 次のレスポンスまでの間、他スレッドが使い過ぎないよう先に差し引く
+                if self.tokens_left is not None:
+                    self.tokens_left -= cost
+                return 0.0
+        logger.info(f"Keepa tokens low: waiting {wait:.1f}s for {cost} tokens")
+        return wait
+
+    def acquire(self, cost: float):
+        """costトークン分を予約（不足時は補充まで待機）"""
+        while (wait := self._reserve(cost)) > 0:
+            time.sleep(wait)
+
+        # 他ワーカーの消費分を含めた共有バケットで待機
+        if self.bucket:
+            self.bucket.acquire(cost)
+
+    async def acquire_async(self, cost: float):
+        """acquireの非同期版"""
+        while (wait := self._reserve(cost)) > 0:
+            await asyncio.sleep(wait)
+
+        if self.bucket:
+            await self.bucket.acquire_async(cost)
+
+    def max_batch_size(self, limit: int = KEEPA_MAX_ASINS_PER_REQUEST) -> int:
+        """今すぐ消費できるトークンで取得可能なASIN数"""
+        tokens = self.estimate_tokens()
+        if tokens is None:
+            return limit
+        affordable = int(tokens // KEEPA_TOKENS_PER_ASIN)
+        if affordable <= 0 and self.refill_rate > 0:
+            # 補充1回分を待てば取得できる件数
+            affordable = int(self.refill_rate // KEEPA_TOKENS_PER_ASIN)
+        return max(1, min(limit, affordable))
+
+
+@lru_cache
+def get_keepa_scheduler() -> KeepaTokenScheduler:
+    """
+    Keepaトークン残量モデルを取得（プロセス内で共有）
+
+    トークンはAPIキー単位のため、KeepaClient（ページ・段・ワーカーごとに生成）の間で
+    モデルを共有し、直近のレスポンスで学習した残量を引き継ぐ
+    """
+    return KeepaTokenScheduler(
+        bucket=get_rate_limiter(
+            "keepa", "tokens", rate=settings.rate_limit_keepa, capacity=KEEPA_MAX_ASINS_PER_REQUEST
+        ),
+    )
+
+
 class KeepaClient:
     """Keepa APIクライアント"""
 
@@ -47,45 +229,95 @@ class KeepaClient:
         Args:
             api_key: Keepa API Key
             rate_limit: requests per second (default: 0.5 = 2秒に1回)
+                        トークン残量が不明な間（初回レスポンス前）のみ使用
         """
         self.api_key = api_key
         self.rate_limit = rate_limit
-        self._last_request_time = 0.0
-        self._client = httpx.Client(timeout=30.0)
+        self._client = self._create_http_client()
+        self.scheduler = get_keepa_scheduler()
 
-    def _wait_for_rate_limit(self):
-        """レート制限を遵守"""
-        if self.rate_limit <= 0:
-            return
-        min_interval = 1.0 / self.rate_limit
-        elapsed = time.time() - self._last_request_time
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-        self._last_request_time = time.time()
+    def _create_http_client(self):
+        return httpx.Client(timeout=30.0)
 
-    def _request(self, endpoint: str, params: dict) -> dict:
-        """APIリクエストを実行"""
-        self._wait_for_rate_limit()
+    def _wait_for_rate_limit(self):
+        """レート制限を遵守（全ワーカー共有）"""
+        get_rate_limiter("keepa", "request", rate=self.rate_limit).acquire()
 
-        params["key"] = self.api_key
-        url = f"{self.BASE_URL}/{endpoint}"
+    def _handle_response(self, response: httpx.Response, attempt: int, cost: int) -> tuple[Optional[dict], float]:
+        """
+        レスポンスを検査してトークン残量モデルを更新
 
+        Returns:
+            (データ, 0) / トークン不足で再試行する場合は (None, 待機秒数)
+        """
         try:
-            response = self._client.get(url, params=params)
-            response.raise_for_status()
             data = response.json()
+        except ValueError:
+            data = {}
+        self.scheduler.update(data)
 
-            # トークン残量をログ
-            tokens_left = data.get("tokensLeft", "?")
-            logger.info(f"Keepa API: tokens_left={tokens_left}")
+        # トークン不足: 次回補充まで待って再試行
+        if response.status_code == 429 and attempt < KEEPA_MAX_RETRIES:
+            wait = max(self.scheduler.seconds_until(cost), 1.0)
+            logger.warning(f"Keepa API 429: tokens_left={data.get('tokensLeft')}, retry in {wait:.1f}s")
+            return None, wait
 
-            return data
+        try:
+            response.raise_for_status()
         except httpx.HTTPStatusError as e:
             logger.error(f"Keepa API error: {e.response.status_code} - {e.response.text}")
             raise
-        except Exception as e:
-            logger.error(f"Keepa API request failed: {e}")
-            raise
+
+        # トークン残量をログ
+        logger.info(
+            f"Keepa API: tokens_left={data.get('tokensLeft', '?')}, "
+            f"consumed={data.get('tokensConsumed', '?')}, "
+            f"refill_rate={data.get('refillRate', '?')}/min"
+        )
+        return data, 0.0
+
+    def _request(self, endpoint: str, params: dict, cost: int = KEEPA_TOKENS_PER_ASIN) -> dict:
+        """
+        APIリクエストを実行
+
+        Args:
+            cost: 想定消費トークン数（トークン残量が足りるまで待機）
+        """
+        params["key"] = self.api_key
+        url = f"{self.BASE_URL}/{endpoint}"
+
+        for attempt in range(KEEPA_MAX_RETRIES + 1):
+            if self.scheduler.is_known:
+                self.scheduler.acquire(cost)
+            else:
+                self._wait_for_rate_limit()
+
+            try:
+                response = self._client.get(url, params=params)
+            except Exception as e:
+                logger.error(f"Keepa API request failed: {e}")
+                raise
+
+            data, wait = self._handle_response(response, attempt, cost)
+            if data is not None:
+                return data
+            time.sleep(wait)
+
+    @staticmethod
+    def _product_params(asins: list[str], domain: int, stats: int, offers: int) -> dict:
+        """Request Productsのパラメータ"""
+        if len(asins) > KEEPA_MAX_ASINS_PER_REQUEST:
+            raise ValueError(f"Max {KEEPA_MAX_ASINS_PER_REQUEST} ASINs per request")
+
+        params = {
+            "domain": domain,
+            "asin": ",".join(asins),
+            "stats": stats,
+        }
+
+        if offers > 0:
+            params["offers"] = offers
+        return params
 
     def get_products(
         self,
@@ -109,20 +341,9 @@ class KeepaClient:
         if not asins:
             return []
 
-        if len(asins) > 100:
-            raise ValueError("Max 100 ASINs per request")
-
-        params = {
-            "domain": domain,
-            "asin": ",".join(asins),
-            "stats": stats,
-        }
-
-        if offers > 0:
-            params["offers"] = offers
-
-        data = self._request("product", params)
-        return data.get("products", [])
+        params = self._product_params(asins, domain, stats, offers)
+        data = self._request("product", params, cost=len(asins) * KEEPA_TOKENS_PER_ASIN)
+        return data.get("products") or []
 
     def get_product(
         self,
@@ -145,6 +366,86 @@ class KeepaClient:
         self.close()
 
 
+class AsyncKeepaClient(KeepaClient):
+    """
+    Keepa APIクライアント（httpx.AsyncClient）
+
+    トークン残量モデル・共有バケットはKeepaClientと同じものを使い、待機はasyncio.sleepで行う。
+    イベントループ内で生成・使用すること
+    """
+
+    def _create_http_client(self):
+        return httpx.AsyncClient(timeout=30.0)
+
+    async def _wait_for_rate_limit(self):
+        """レート制限を遵守（全ワーカー共有）"""
+        await get_rate_limiter("keepa", "request", rate=self.rate_limit).acquire_async()
+
+    async def _request(self, endpoint: str, params: dict, cost: int = KEEPA_TOKENS_PER_ASIN) -> dict:
+        """APIリクエストを実行（KeepaClient._requestの非同期版）"""
+        params["key"] = self.api_key
+        url = f"{self.BASE_URL}/{endpoint}"
+
+        for attempt in range(KEEPA_MAX_RETRIES + 1):
+            if self.scheduler.is_known:
+                await self.scheduler.acquire_async(cost)
+            else:
+                await self._wait_for_rate_limit()
+
+            try:
+                response = await self._client.get(url, params=params)
+            except Exception as e:
+                logger.error(f"Keepa API request failed: {e}")
+                raise
+
+            data, wait = self._handle_response(response, attempt, cost)
+            if data is not None:
+                return data
+            await asyncio.sleep(wait)
+
+    async def get_products(
+        self,
+        asins: list[str],
+        domain: int = KEEPA_DOMAIN_JP,
+        stats: int = 180,
+        offers: int = 0,
+    ) -> list[dict]:
+        """複数ASINの商品情報を取得（最大100件）"""
+        if not asins:
+            return []
+
+        params = self._product_params(asins, domain, stats, offers)
+        data = await self._request("product", params, cost=len(asins) * KEEPA_TOKENS_PER_ASIN)
+        return data.get("products") or []
+
+    async def get_product(
+        self,
+        asin: str,
+        domain: int = KEEPA_DOMAIN_JP,
+        stats: int = 180,
+    ) -> Optional[dict]:
+        """単一ASINの商品情報を取得"""
+        products = await self.get_products([asin], domain, stats)
+        return products[0] if products else None
+
+    def close(self):
+        """
+        クライアントを閉じる（イベントループ外から呼ぶ場合）
+
+        イベントループ内では aclose を使うこと
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.aclose())
+            return
+        raise RuntimeError("AsyncKeepaClient.close() called inside an event loop; use aclose()")
+
+    async def aclose(self):
+        """クライアントを閉じる"""
+        await self._client.aclose()
+
+
 class KeepaService:
     """Keepaデータ取得・解析サービス"""
 
@@ -159,47 +460,70 @@ class KeepaService:
     CSV_COUNT_USED = 12  # Count of used offers
     CSV_COUNT_NEW_FBA = 18  # Count of new FBA offers
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache: Optional[ApiCacheStore] = None):
         self.db = db
+        self.cache = cache or ApiCacheStore(db)
         self.client = KeepaClient(
             api_key=settings.keepa_api_key,
             rate_limit=settings.rate_limit_keepa,
         )
+        # *_async メソッドの初回呼び出し時にイベントループ内で生成
+        self.async_client: Optional[AsyncKeepaClient] = None
+
+    def _get_async_client(self) -> AsyncKeepaClient:
+        if self.async_client is None:
+            self.async_client = AsyncKeepaClient(
+                api_key=settings.keepa_api_key,
+                rate_limit=settings.rate_limit_keepa,
+            )
+        return self.async_client
+
+    def _split_cached(self, asins: list[str], cache_key, use_cache: bool) -> tuple[dict[str, Any], list[str]]:
+        """
+        キャッシュのヒット分とミス分に分ける（ネガティブキャッシュのASINはどちらにも含めない）
+
+        Args:
+            cache_key: ASIN → キャッシュキーの関数
+
+        Returns:
+            ({asin: キャッシュのデータ}, ミスしたASINリスト)
+        """
+        found = {}
+        misses = []
+
+        if use_cache:
+            self.cache.prefetch(cache_key(asin) for asin in asins)
+
+        for asin in dict.fromkeys(asins):
+            cached = self.cache.get(cache_key(asin)) if use_cache else None
+            if cached is NOT_FOUND:
+                continue
+            if cached is not None:
+                found[asin] = cached
+            else:
+                misses.append(asin)
+        return found, misses
 
     def _get_cache(self, asin: str) -> Optional[dict]:
         """キャッシュからデータを取得"""
-        cache_key = f"keepa_product_{asin}"
-        cache = (
-            self.db.query(ApiCache)
-            .filter(
-                ApiCache.cache_key == cache_key,
-                ApiCache.expires_at > datetime.utcnow(),
-            )
-            .first()
-        )
-        if cache:
-            logger.debug(f"Cache hit: {cache_key}")
-            return cache.response_data
-        return None
+        return self.cache.get(keepa_cache_key(asin))
 
     def _set_cache(self, asin: str, data: dict):
         """キャッシュにデータを保存"""
-        cache_key = f"keepa_product_{asin}"
-        expires_at = datetime.utcnow() + timedelta(seconds=settings.cache_ttl_seconds)
-
-        # 既存キャッシュを削除
-        self.db.query(ApiCache).filter(ApiCache.cache_key == cache_key).delete()
-
-        cache = ApiCache(
-            cache_key=cache_key,
-            api_type="KEEPA",
-            request_params={"asin": asin},
-            response_data=data,
-            fetched_at=datetime.utcnow(),
-            expires_at=expires_at,
+        self.cache.set(keepa_cache_key(asin), "KEEPA", data, {"asin": asin})
+
+    def _set_not_found(self, asin: str):
+        """Keepaに該当商品が無いことをキャッシュ（ネガティブキャッシュ）"""
+        self.cache.set_not_found(keepa_cache_key(asin), "KEEPA", {"asin": asin})
+
+    def _set_parsed_cache(self, asin: str, parsed: dict):
+        """解析済みデータをキャッシュに保存"""
+        self.cache.set(
+            keepa_parsed_cache_key(asin),
+            "KEEPA_PARSED",
+            parsed,
+            {"asin": asin, "parser_version": KEEPA_PARSER_VERSION},
         )
-        self.db.add(cache)
-        self.db.commit()
 
     def fetch_product(self, asin: str, use_cache: bool = True) -> Optional[dict]:
         """
@@ -210,18 +534,227 @@ class KeepaService:
         """
         if use_cache:
             cached = self._get_cache(asin)
-            if cached:
+            if cached is NOT_FOUND:
+                return None
+            if cached is not None:
                 return cached
 
         if not settings.keepa_api_key:
             logger.warning("Keepa API key not configured")
             return None
 
-        product = self.client.get_product(asin)
-        if product:
+        def fetch() -> Optional[dict]:
+            product = self.client.get_product(asin)
+            if product:
+                self._set_cache(asin, product)
+            else:
+                self._set_not_found(asin)
+            return product
+
+        # 他ワーカーが同じASINを取得中ならその結果を使う
+        return self.cache.fetch_one(keepa_cache_key(asin), fetch)
+
+    def fetch_products(self, asins: list[str], use_cache: bool = True) -> dict[str, dict]:
+        """
+        複数ASINの商品情報をまとめて取得（キャッシュ対応）
+
+        キャッシュミス分のみを最大100件ずつKeepaへ問い合わせる
+        （トークン残量が少ない場合はバッチを小さくする）
+
+        Returns:
+            {asin: Keepa product data}（取得できなかったASINは含まない）
+        """
+        products, misses = self._split_cached(asins, keepa_cache_key, use_cache)
+        if not misses:
+            return products
+
+        if not settings.keepa_api_key:
+            logger.warning("Keepa API key not configured")
+            return products
+
+        # 他ワーカーが取得中のASINはその結果を待つ（同じASINでトークンを二重に消費しない）
+        asins_by_key = {keepa_cache_key(asin): asin for asin in misses}
+        fetched = self.cache.fetch_coalesced(
+            list(asins_by_key),
+            lambda keys: self._request_products([asins_by_key[key] for key in keys]),
+        )
+        for key, product in fetched.items():
+            products[asins_by_key[key]] = product
+
+        return products
+
+    def _request_products(self, asins: list[str]) -> dict[str, dict]:
+        """
+        Keepaに問い合わせてキャッシュに保存
+
+        Returns:
+            {cache_key: Keepa product data}
+        """
+        fetched = {}
+        start = 0
+        while start < len(asins):
+            # トークン残量に合わせてバッチサイズを決める
+            size = self.client.scheduler.max_batch_size()
+            chunk = asins[start:start + size]
+            start += size
+            fetched.update(self._store_products(chunk, self.client.get_products(chunk)))
+        return fetched
+
+    def _store_products(self, asins: list[str], products: list[dict]) -> dict[str, dict]:
+        """
+        取得した商品情報をキャッシュに保存（レスポンスに含まれなかったASINはKeepa未登録）
+
+        Returns:
+            {cache_key: Keepa product data}
+        """
+        fetched = {}
+        for product in products:
+            asin = product.get('asin')
+            if not asin:
+                continue
             self._set_cache(asin, product)
+            fetched[keepa_cache_key(asin)] = product
+
+        for asin in asins:
+            if keepa_cache_key(asin) not in fetched:
+                self._set_not_found(asin)
+        return fetched
 
-        return product
+    def fetch_parsed_product(self, asin: str, use_cache: bool = True) -> Optional[dict]:
+        """
+        解析済みの商品情報を取得（キャッシュ対応）
+
+        Returns:
+            parse_productの出力（時系列は直近KEEPA_HISTORY_DAYS日分） or None
+        """
+        return self.fetch_parsed_products([asin], use_cache).get(asin)
+
+    def fetch_parsed_products(self, asins: list[str], use_cache: bool = True) -> dict[str, dict]:
+        """
+        複数ASINの解析済み商品情報をまとめて取得（キャッシュ対応）
+
+        解析済みキャッシュのミス分のみ生データを取得（生データのキャッシュ → Keepa）して解析し、
+        結果を解析済みキャッシュに保存する。パーサーのバージョンを上げた場合も
+        生データのキャッシュから再解析するだけでトークンは消費しない。
+
+        Returns:
+            {asin: 解析済みデータ}（取得できなかったASINは含まない）
+        """
+        parsed_products, misses = self._split_cached(asins, keepa_parsed_cache_key, use_cache)
+        if not misses:
+            return parsed_products
+
+        # 解析・保存も他ワーカーと重複しないようにまとめる
+        asins_by_key = {keepa_parsed_cache_key(asin): asin for asin in misses}
+        fetched = self.cache.fetch_coalesced(
+            list(asins_by_key),
+            lambda keys: self._parse_and_cache([asins_by_key[key] for key in keys], use_cache),
+        )
+        for key, parsed in fetched.items():
+            parsed_products[asins_by_key[key]] = parsed
+
+        return parsed_products
+
+    def _parse_and_cache(self, asins: list[str], use_cache: bool) -> dict[str, dict]:
+        """
+        生データを取得・解析して解析済みキャッシュに保存
+
+        Returns:
+            {cache_key: 解析済みデータ}
+        """
+        return self._parse_products(asins, self.fetch_products(asins, use_cache))
+
+    def _parse_products(self, asins: list[str], products: dict[str, dict]) -> dict[str, dict]:
+        """
+        生データを解析して解析済みキャッシュに保存
+
+        Returns:
+            {cache_key: 解析済みデータ}
+        """
+        fetched = {}
+        for asin in asins:
+            product = products.get(asin)
+            if product is None:
+                # Keepa未登録と確定したASINのみネガティブキャッシュ（エラー等は次回再取得）
+                if self._get_cache(asin) is NOT_FOUND:
+                    self.cache.set_not_found(
+                        keepa_parsed_cache_key(asin),
+                        "KEEPA_PARSED",
+                        {"asin": asin, "parser_version": KEEPA_PARSER_VERSION},
+                    )
+                continue
+
+            parsed = self.parse_product(product)
+            self._set_parsed_cache(asin, parsed)
+            fetched[keepa_parsed_cache_key(asin)] = parsed
+        return fetched
+
+    # ========== 非同期版（RESEARCH_WORKER_MODE=async） ==========
+
+    async def fetch_products_async(self, asins: list[str], use_cache: bool = True) -> dict[str, dict]:
+        """
+        fetch_productsの非同期版（Keepaへの問い合わせ・取得中の待機でイベントループを止めない）
+
+        キャッシュの読み書きは cache.run_db で実行する
+        """
+        products, misses = await self.cache.run_db(self._split_cached, asins, keepa_cache_key, use_cache)
+        if not misses:
+            return products
+
+        if not settings.keepa_api_key:
+            logger.warning("Keepa API key not configured")
+            return products
+
+        asins_by_key = {keepa_cache_key(asin): asin for asin in misses}
+
+        async def request(keys: list[str]) -> dict[str, dict]:
+            return await self._request_products_async([asins_by_key[key] for key in keys])
+
+        fetched = await self.cache.fetch_coalesced_async(list(asins_by_key), request)
+        for key, product in fetched.items():
+            products[asins_by_key[key]] = product
+
+        return products
+
+    async def _request_products_async(self, asins: list[str]) -> dict[str, dict]:
+        """_request_productsの非同期版"""
+        client = self._get_async_client()
+        fetched = {}
+        start = 0
+        while start < len(asins):
+            size = client.scheduler.max_batch_size()
+            chunk = asins[start:start + size]
+            start += size
+            products = await client.get_products(chunk)
+            fetched.update(await self.cache.run_db(self._store_products, chunk, products))
+        return fetched
+
+    async def fetch_parsed_products_async(self, asins: list[str], use_cache: bool = True) -> dict[str, dict]:
+        """fetch_parsed_productsの非同期版（キャッシュの読み書きは cache.run_db で実行）"""
+        parsed_products, misses = await self.cache.run_db(
+            self._split_cached, asins, keepa_parsed_cache_key, use_cache
+        )
+        if not misses:
+            return parsed_products
+
+        asins_by_key = {keepa_parsed_cache_key(asin): asin for asin in misses}
+
+        async def parse_and_cache(keys: list[str]) -> dict[str, dict]:
+            requested = [asins_by_key[key] for key in keys]
+            products = await self.fetch_products_async(requested, use_cache)
+            return await self.cache.run_db(self._parse_products, requested, products)
+
+        fetched = await self.cache.fetch_coalesced_async(list(asins_by_key), parse_and_cache)
+        for key, parsed in fetched.items():
+            parsed_products[asins_by_key[key]] = parsed
+
+        return parsed_products
+
+    async def aclose(self):
+        """リソースを解放（非同期クライアントを含む）"""
+        self.close()
+        if self.async_client is not None:
+            await self.async_client.aclose()
 
     def parse_product(self, product: dict) -> dict:
         """
@@ -242,8 +775,8 @@ class KeepaService:
                 'sales_est_180': int,
                 'seller_count': int,
                 'fba_seller_count': int,
-                'price_history': list,
-                'rank_history': list,
+                'price_history': {'minutes': list, 'values': list},  # 直近KEEPA_HISTORY_DAYS日分
+                'rank_history': {'minutes': list, 'values': list},
             }
         """
         result = {
@@ -260,8 +793,8 @@ class KeepaService:
             'sales_est_180': None,
             'seller_count': None,
             'fba_seller_count': None,
-            'price_history': [],
-            'rank_history': [],
+            'price_history': {'minutes': [], 'values': []},
+            'rank_history': {'minutes': [], 'values': []},
         }
 
         if not product:
@@ -350,52 +883,73 @@ class KeepaService:
     def _parse_csv(self, csv_data: list) -> dict:
         """CSV時系列データを解析"""
         result = {
-            'price_history': [],
-            'rank_history': [],
+            'price_history': {'minutes': [], 'values': []},
+            'rank_history': {'minutes': [], 'values': []},
         }
 
         # New FBA価格の推移
         if len(csv_data) > self.CSV_NEW_FBA:
             fba_prices = csv_data[self.CSV_NEW_FBA]
             if fba_prices:
-                result['price_history'] = self._parse_time_series(fba_prices)
+                result['price_history'] = self._parse_time_series(fba_prices, KEEPA_HISTORY_DAYS)
 
         # ランキングの推移
         if len(csv_data) > self.CSV_SALES_RANK:
             ranks = csv_data[self.CSV_SALES_RANK]
             if ranks:
-                result['rank_history'] = self._parse_time_series(ranks)
+                result['rank_history'] = self._parse_time_series(ranks, KEEPA_HISTORY_DAYS)
 
         return result
 
-    def _parse_time_series(self, data: list) -> list[dict]:
+    def _parse_time_series(self, data: list, days: Optional[int] = None) -> dict:
         """
         Keepa時系列データを解析
 
-        Keepa CSVは [time1, value1, time2, value2, ...] 形式
-        """
-        if not data or len(data) < 2:
-            return []
-
-        result = []
-        for i in range(0, len(data) - 1, 2):
-            keepa_time = data[i]
-            value = data[i + 1]
-
-            if keepa_time is None or value is None:
-                continue
-
-            # -1 は値なし
-            if value == -1:
-                continue
-
-            dt = keepa_time_to_datetime(keepa_time)
-            result.append({
-                'date': dt.date().isoformat(),
-                'value': value,
-            })
+        Keepa CSVは [time1, value1, time2, value2, ...] 形式。
+        値なし（-1）を除き、最新の点の日を含む直近days日分の点を集約せずに列形式で返す。
+        日の途中では切らないため、保存時に1日1点へ集約すると
+        全期間を集約してから直近days日を取るのと同じ結果になる。
+        末尾から必要な範囲だけを切り出して解析し、足りなければ範囲を広げる
 
-        return result
+        Returns:
+            {'minutes': [Keepa時間, ...], 'values': [値, ...]}
+        """
+        pair_count = len(data) // 2 if data else 0
+        window = days * 2 if days else pair_count
+        while True:
+            start = max(pair_count - window, 0)
+            minutes, values = self._parse_pairs(data[start * 2:pair_count * 2])
+            if not days or start == 0:
+                break
+            # 範囲の先頭が対象期間より前の日なら、対象期間の点はすべて範囲内
+            if minutes and minutes[0] // MINUTES_PER_DAY <= minutes[-1] // MINUTES_PER_DAY - days:
+                break
+            window *= 2
+
+        if days and minutes:
+            first_day = minutes[-1] // MINUTES_PER_DAY - days + 1
+            first = bisect.bisect_left(minutes, first_day * MINUTES_PER_DAY)
+            minutes, values = minutes[first:], values[first:]
+        return {'minutes': minutes, 'values': values}
+
+    def _parse_pairs(self, data: list) -> tuple[list, list]:
+        """[time, value, ...] を (N, 2) の配列として解析し、値なし（-1）を除いた (時間列, 値列) を返す"""
+        try:
+            pairs = np.asarray(data, dtype=np.int64).reshape(-1, 2)
+        except (TypeError, ValueError):
+            # None混在・奇数長の場合は欠けた組を除いてから変換
+            pairs = np.array(
+                [
+                    (data[i], data[i + 1])
+                    for i in range(0, len(data) - 1, 2)
+                    if data[i] is not None and data[i + 1] is not None
+                ],
+                dtype=np.int64,
+            ).reshape(-1, 2)
+
+        # -1 は値なし
+        pairs = pairs[pairs[:, 1] != -1]
+        return pairs[:, 0].tolist(), pairs[:, 1].tolist()
 
     def close(self):
         """リソースを解放"""
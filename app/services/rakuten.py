@@ -11,11 +11,13 @@ v1.0で使用するAPI:
 3. 最安（商品+送料-ポイント）を採用
 
 レート制限: 1 rps
+
+非同期ワーカー（RESEARCH_WORKER_MODE=async）は AsyncRakutenClient（httpx.AsyncClient）と
+find_matching_items_async を使う
 """
+import asyncio
 import logging
-import time
 import re
-from datetime import datetime, timedelta
 from typing import Optional, List
 from urllib.parse import urlencode
 
@@ -23,8 +25,9 @@ import httpx
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models.cache import ApiCache
+from app.services.api_cache import NOT_FOUND, ApiCacheStore
 from app.models.rakuten_candidate import RakutenCandidate
+from app.services.rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -37,6 +40,17 @@ def normalize_model_number(model: str) -> str:
     return re.sub(r'[\s\-_]', '', model.upper())
 
 
+def rakuten_cache_keys(jan_code: Optional[str], model_number: Optional[str]) -> list[str]:
+    """JAN/型番検索のキャッシュキー（find_matching_itemsが参照するもの）"""
+    keys = []
+    if jan_code and len(jan_code) >= 8:
+        keys.append(f"rakuten_jan_{jan_code}")
+    normalized = normalize_model_number(model_number)
+    if normalized and len(normalized) >= 3:
+        keys.append(f"rakuten_model_{normalized}")
+    return keys
+
+
 class RakutenClient:
     """楽天API クライアント"""
 
@@ -46,28 +60,28 @@ class RakutenClient:
     def __init__(self, app_id: str, rate_limit: float = 1.0):
         self.app_id = app_id
         self.rate_limit = rate_limit
-        self._last_request_time = 0.0
-        self._client = httpx.Client(timeout=30.0)
+        # 楽天のレート制限はアプリIDごと（製品検索・市場商品検索で共有）
+        self._limiter = get_rate_limiter("rakuten", "default", rate=rate_limit)
+        self._client = self._create_http_client()
+
+    def _create_http_client(self):
+        return httpx.Client(timeout=30.0)
 
     def _wait_for_rate_limit(self):
-        """レート制限を遵守"""
-        if self.rate_limit <= 0:
-            return
-        min_interval = 1.0 / self.rate_limit
-        elapsed = time.time() - self._last_request_time
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-        self._last_request_time = time.time()
+        """レート制限を遵守（全ワーカー共有）"""
+        self._limiter.acquire()
+
+    def _request_params(self, params: dict) -> dict:
+        params["applicationId"] = self.app_id
+        params["format"] = "json"
+        return params
 
     def _request(self, url: str, params: dict) -> dict:
         """APIリクエストを実行"""
         self._wait_for_rate_limit()
 
-        params["applicationId"] = self.app_id
-        params["format"] = "json"
-
         try:
-            response = self._client.get(url, params=params)
+            response = self._client.get(url, params=self._request_params(params))
             response.raise_for_status()
             return response.json()
         except httpx.HTTPStatusError as e:
@@ -77,6 +91,38 @@ class RakutenClient:
             logger.error(f"Rakuten API request failed: {e}")
             raise
 
+    @staticmethod
+    def _extract_product(data: dict) -> Optional[dict]:
+        products = data.get("Products", [])
+        if products:
+            return products[0].get("Product", {})
+        return None
+
+    @staticmethod
+    def _search_items_params(
+        keyword: str,
+        hits: int,
+        sort: str,
+        min_price: Optional[int],
+        max_price: Optional[int],
+    ) -> dict:
+        params = {
+            "keyword": keyword,
+            "hits": min(hits, 30),
+            "sort": sort,
+        }
+
+        if min_price:
+            params["minPrice"] = min_price
+        if max_price:
+            params["maxPrice"] = max_price
+        return params
+
+    @staticmethod
+    def _extract_items(data: dict) -> List[dict]:
+        items = data.get("Items", [])
+        return [item.get("Item", {}) for item in items]
+
     def search_product(self, product_code: str) -> Optional[dict]:
         """
         製品検索API: JANコードで製品を検索
@@ -93,11 +139,7 @@ class RakutenClient:
         }
 
         try:
-            data = self._request(self.PRODUCT_SEARCH_URL, params)
-            products = data.get("Products", [])
-            if products:
-                return products[0].get("Product", {})
-            return None
+            return self._extract_product(self._request(self.PRODUCT_SEARCH_URL, params))
         except Exception as e:
             logger.warning(f"Product search failed for {product_code}: {e}")
             return None
@@ -109,6 +151,7 @@ class RakutenClient:
         sort: str = "+itemPrice",  # 価格昇順
         min_price: int = None,
         max_price: int = None,
+        raise_on_error: bool = False,
     ) -> List[dict]:
         """
         市場商品検索API: キーワードで商品を検索
@@ -117,39 +160,113 @@ class RakutenClient:
             keyword: 検索キーワード（JAN/型番/商品名）
             hits: 取得件数（最大30）
             sort: ソート順（+itemPrice=価格昇順）
+            raise_on_error: Trueの場合、APIエラーを空リストにせず送出（ヒットなしと区別する）
 
         Returns:
             商品リスト
         """
+        params = self._search_items_params(keyword, hits, sort, min_price, max_price)
+
+        try:
+            return self._extract_items(self._request(self.ICHIBA_SEARCH_URL, params))
+        except Exception as e:
+            logger.warning(f"Item search failed for {keyword}: {e}")
+            if raise_on_error:
+                raise
+            return []
+
+    def close(self):
+        """クライアントを閉じる"""
+        self._client.close()
+
+
+class AsyncRakutenClient(RakutenClient):
+    """
+    楽天API クライアント（httpx.AsyncClient）
+
+    レートリミッタはRakutenClientと共有し、待機はasyncio.sleepで行う。
+    イベントループ内で生成・使用すること
+    """
+
+    def _create_http_client(self):
+        return httpx.AsyncClient(timeout=30.0)
+
+    async def _wait_for_rate_limit(self):
+        """レート制限を遵守（全ワーカー共有）"""
+        await self._limiter.acquire_async()
+
+    async def _request(self, url: str, params: dict) -> dict:
+        """APIリクエストを実行"""
+        await self._wait_for_rate_limit()
+
+        try:
+            response = await self._client.get(url, params=self._request_params(params))
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Rakuten API error: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Rakuten API request failed: {e}")
+            raise
+
+    async def search_product(self, product_code: str) -> Optional[dict]:
+        """製品検索API: JANコードで製品を検索"""
         params = {
-            "keyword": keyword,
-            "hits": min(hits, 30),
-            "sort": sort,
+            "productCode": product_code,
+            "hits": 1,
         }
 
-        if min_price:
-            params["minPrice"] = min_price
-        if max_price:
-            params["maxPrice"] = max_price
+        try:
+            return self._extract_product(await self._request(self.PRODUCT_SEARCH_URL, params))
+        except Exception as e:
+            logger.warning(f"Product search failed for {product_code}: {e}")
+            return None
+
+    async def search_items(
+        self,
+        keyword: str,
+        hits: int = 30,
+        sort: str = "+itemPrice",
+        min_price: int = None,
+        max_price: int = None,
+        raise_on_error: bool = False,
+    ) -> List[dict]:
+        """市場商品検索API: キーワードで商品を検索"""
+        params = self._search_items_params(keyword, hits, sort, min_price, max_price)
 
         try:
-            data = self._request(self.ICHIBA_SEARCH_URL, params)
-            items = data.get("Items", [])
-            return [item.get("Item", {}) for item in items]
+            return self._extract_items(await self._request(self.ICHIBA_SEARCH_URL, params))
         except Exception as e:
             logger.warning(f"Item search failed for {keyword}: {e}")
+            if raise_on_error:
+                raise
             return []
 
     def close(self):
+        """
+        クライアントを閉じる（イベントループ外から呼ぶ場合）
+
+        イベントループ内では aclose を使うこと
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.aclose())
+            return
+        raise RuntimeError("AsyncRakutenClient.close() called inside an event loop; use aclose()")
+
+    async def aclose(self):
         """クライアントを閉じる"""
-        self._client.close()
+        await self._client.aclose()
 
 
 class RakutenService:
     """楽天データ取得・マッチングサービス"""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache: Optional[ApiCacheStore] = None):
         self.db = db
+        self.cache = cache or ApiCacheStore(db)
         self.client = RakutenClient(
             app_id=settings.rakuten_app_id,
             rate_limit=settings.rate_limit_rakuten,
@@ -157,38 +274,24 @@ class RakutenService:
         self.point_rate_total = (
             settings.default_point_rate_normal + settings.default_point_rate_spu
         )
+        # *_async メソッドの初回呼び出し時にイベントループ内で生成
+        self.async_client: Optional[AsyncRakutenClient] = None
+
+    def _get_async_client(self) -> AsyncRakutenClient:
+        if self.async_client is None:
+            self.async_client = AsyncRakutenClient(
+                app_id=settings.rakuten_app_id,
+                rate_limit=settings.rate_limit_rakuten,
+            )
+        return self.async_client
 
     def _get_cache(self, cache_key: str, api_type: str) -> Optional[dict]:
         """キャッシュからデータを取得"""
-        cache = (
-            self.db.query(ApiCache)
-            .filter(
-                ApiCache.cache_key == cache_key,
-                ApiCache.expires_at > datetime.utcnow(),
-            )
-            .first()
-        )
-        if cache:
-            logger.debug(f"Cache hit: {cache_key}")
-            return cache.response_data
-        return None
+        return self.cache.get(cache_key)
 
     def _set_cache(self, cache_key: str, api_type: str, data: dict, params: dict = None):
         """キャッシュにデータを保存"""
-        expires_at = datetime.utcnow() + timedelta(seconds=settings.cache_ttl_seconds)
-
-        self.db.query(ApiCache).filter(ApiCache.cache_key == cache_key).delete()
-
-        cache = ApiCache(
-            cache_key=cache_key,
-            api_type=api_type,
-            request_params=params,
-            response_data=data,
-            fetched_at=datetime.utcnow(),
-            expires_at=expires_at,
-        )
-        self.db.add(cache)
-        self.db.commit()
+        self.cache.set(cache_key, api_type, data, params)
 
     def find_matching_items(
         self,
@@ -215,36 +318,77 @@ class RakutenService:
                 'candidates': [...],
             }
         """
-        point_rate = point_rate or self.point_rate_total
-        result = {
-            'match_type': 'NONE',
-            'chosen_item': None,
-            'candidates': [],
-        }
-
-        candidates = []
+        candidates, match_type = [], 'NONE'
 
         # 1. JAN検索
         if jan_code and len(jan_code) >= 8:
-            jan_items = self._search_by_jan(jan_code)
-            for item in jan_items:
-                item['_match_type'] = 'JAN'
-                item['_match_value'] = jan_code
-            candidates.extend(jan_items)
-            if jan_items:
-                result['match_type'] = 'JAN'
+            candidates, match_type = self._tag_candidates(self._search_by_jan(jan_code), 'JAN', jan_code)
 
         # 2. 型番検索（JANで見つからない場合のみ）
-        if not candidates and model_number:
-            normalized = normalize_model_number(model_number)
-            if normalized and len(normalized) >= 3:
-                model_items = self._search_by_model(normalized, model_number)
-                for item in model_items:
-                    item['_match_type'] = 'MODEL'
-                    item['_match_value'] = model_number
-                candidates.extend(model_items)
-                if model_items:
-                    result['match_type'] = 'MODEL'
+        normalized = normalize_model_number(model_number)
+        if not candidates and normalized and len(normalized) >= 3:
+            candidates, match_type = self._tag_candidates(
+                self._search_by_model(normalized, model_number), 'MODEL', model_number
+            )
+
+        return self._choose_candidate(candidates, match_type, job_id, asin, point_rate)
+
+    async def find_matching_items_async(
+        self,
+        jan_code: Optional[str],
+        model_number: Optional[str],
+        job_id: str,
+        asin: str,
+        point_rate: float = None,
+    ) -> dict:
+        """
+        find_matching_itemsの非同期版（楽天への問い合わせでイベントループを止めない）
+
+        キャッシュの読み書き・候補の保存は cache.run_db で実行する
+        """
+        candidates, match_type = [], 'NONE'
+
+        if jan_code and len(jan_code) >= 8:
+            candidates, match_type = self._tag_candidates(
+                await self._search_by_jan_async(jan_code), 'JAN', jan_code
+            )
+
+        normalized = normalize_model_number(model_number)
+        if not candidates and normalized and len(normalized) >= 3:
+            candidates, match_type = self._tag_candidates(
+                await self._search_by_model_async(normalized, model_number), 'MODEL', model_number
+            )
+
+        return await self.cache.run_db(self._choose_candidate, candidates, match_type, job_id, asin, point_rate)
+
+    @staticmethod
+    def _tag_candidates(items: List[dict], match_type: str, match_value: str) -> tuple[List[dict], str]:
+        """
+        検索結果にマッチ種別を付ける
+
+        Returns:
+            (候補リスト, マッチタイプ（ヒットなしは'NONE'）)
+        """
+        for item in items:
+            item['_match_type'] = match_type
+            item['_match_value'] = match_value
+        return items, (match_type if items else 'NONE')
+
+    def _choose_candidate(
+        self,
+        candidates: List[dict],
+        match_type: str,
+        job_id: str,
+        asin: str,
+        point_rate: Optional[float],
+    ) -> dict:
+        """候補を処理して最安を決定し、候補をDBに保存（find_matching_itemsの戻り値を返す）"""
+        point_rate = point_rate or self.point_rate_total
+        result = {
+            'match_type': match_type,
+            'chosen_item': None,
+            'candidates': [],
+        }
 
         if not candidates:
             result['match_type'] = 'NONE'
@@ -267,27 +411,113 @@ class RakutenService:
 
         return result
 
-    def _search_by_jan(self, jan_code: str) -> List[dict]:
+    def _get_cached_search(self, cache_key: str) -> Optional[List[dict]]:
+        """検索結果のキャッシュ（ヒットなしのネガティブキャッシュは[]、キャッシュなしはNone）"""
+        cached = self._get_cache(cache_key, "RAKUTEN_SEARCH")
+        if cached is NOT_FOUND:
+            return []
+        return cached
+
+    def _search_by_jan(self, jan_code: str, use_cache: bool = True) -> List[dict]:
         """JANコードで商品を検索"""
         cache_key = f"rakuten_jan_{jan_code}"
-        cached = self._get_cache(cache_key, "RAKUTEN_SEARCH")
-        if cached:
+        if use_cache:
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+
+        # 他ワーカーが同じJANを検索中ならその結果を使う
+        return self.cache.fetch_one(cache_key, lambda: self._request_by_jan(cache_key, jan_code)) or []
+
+    async def _search_by_jan_async(self, jan_code: str) -> List[dict]:
+        """_search_by_janの非同期版"""
+        cache_key = f"rakuten_jan_{jan_code}"
+        cached = await self.cache.run_db(self._get_cached_search, cache_key)
+        if cached is not None:
             return cached
 
-        items = self.client.search_items(jan_code, hits=30)
-        self._set_cache(cache_key, "RAKUTEN_SEARCH", items, {"jan": jan_code})
+        async def request() -> List[dict]:
+            try:
+                items = await self._get_async_client().search_items(jan_code, hits=30, raise_on_error=True)
+            except Exception:
+                return []
+            return await self.cache.run_db(self._store_jan_result, cache_key, jan_code, items)
+
+        return await self.cache.fetch_one_async(cache_key, request) or []
+
+    def _request_by_jan(self, cache_key: str, jan_code: str) -> List[dict]:
+        """楽天APIでJAN検索してキャッシュに保存（ヒットなしはネガティブキャッシュ）"""
+        try:
+            items = self.client.search_items(jan_code, hits=30, raise_on_error=True)
+        except Exception:
+            # APIエラーはキャッシュしない（次回再検索）
+            return []
+
+        return self._store_jan_result(cache_key, jan_code, items)
+
+    def _store_jan_result(self, cache_key: str, jan_code: str, items: List[dict]) -> List[dict]:
+        """JAN検索の結果をキャッシュに保存"""
+        if items:
+            self._set_cache(cache_key, "RAKUTEN_SEARCH", items, {"jan": jan_code})
+        else:
+            self.cache.set_not_found(cache_key, "RAKUTEN_SEARCH", {"jan": jan_code})
         return items
 
-    def _search_by_model(self, normalized_model: str, original_model: str) -> List[dict]:
+    def _search_by_model(
+        self,
+        normalized_model: str,
+        original_model: str,
+        use_cache: bool = True,
+    ) -> List[dict]:
         """型番で商品を検索（正規化後の完全一致のみ）"""
         cache_key = f"rakuten_model_{normalized_model}"
-        cached = self._get_cache(cache_key, "RAKUTEN_SEARCH")
-        if cached:
+        if use_cache:
+            cached = self._get_cached_search(cache_key)
+            if cached is not None:
+                return cached
+
+        # 他ワーカーが同じ型番を検索中ならその結果を使う
+        return self.cache.fetch_one(
+            cache_key, lambda: self._request_by_model(cache_key, normalized_model, original_model)
+        ) or []
+
+    async def _search_by_model_async(self, normalized_model: str, original_model: str) -> List[dict]:
+        """_search_by_modelの非同期版"""
+        cache_key = f"rakuten_model_{normalized_model}"
+        cached = await self.cache.run_db(self._get_cached_search, cache_key)
+        if cached is not None:
             return cached
 
+        async def request() -> List[dict]:
+            try:
+                items = await self._get_async_client().search_items(original_model, hits=30, raise_on_error=True)
+            except Exception:
+                return []
+            return await self.cache.run_db(
+                self._store_model_result, cache_key, normalized_model, original_model, items
+            )
+
+        return await self.cache.fetch_one_async(cache_key, request) or []
+
+    def _request_by_model(self, cache_key: str, normalized_model: str, original_model: str) -> List[dict]:
+        """楽天APIで型番検索してキャッシュに保存（ヒットなしはネガティブキャッシュ）"""
         # 元の型番で検索
-        items = self.client.search_items(original_model, hits=30)
+        try:
+            items = self.client.search_items(original_model, hits=30, raise_on_error=True)
+        except Exception:
+            # APIエラーはキャッシュしない（次回再検索）
+            return []
+
+        return self._store_model_result(cache_key, normalized_model, original_model, items)
 
+    def _store_model_result(
+        self,
+        cache_key: str,
+        normalized_model: str,
+        original_model: str,
+        items: List[dict],
+    ) -> List[dict]:
+        """型番検索の結果を型番の一致でフィルタしてキャッシュに保存"""
         # 正規化後の完全一致でフィルタ（商品名に型番が含まれるか）
         matched = []
         for item in items:
@@ -297,7 +527,10 @@ class RakutenService:
             if normalized_model in normalized_name:
                 matched.append(item)
 
-        self._set_cache(cache_key, "RAKUTEN_SEARCH", matched, {"model": original_model})
+        if matched:
+            self._set_cache(cache_key, "RAKUTEN_SEARCH", matched, {"model": original_model})
+        else:
+            self.cache.set_not_found(cache_key, "RAKUTEN_SEARCH", {"model": original_model})
         return matched
 
     def _process_item(self, item: dict, point_rate: float) -> dict:
@@ -352,7 +585,7 @@ class RakutenService:
         candidates: List[dict],
         match_type: str,
     ):
-        """候補をDBに保存"""
+        """候補をDBに保存（コミットは呼び出し側）"""
         # 既存候補を削除
         self.db.query(RakutenCandidate).filter(
             RakutenCandidate.job_id == job_id,
@@ -381,12 +614,16 @@ class RakutenService:
             )
             self.db.add(rc)
 
-        self.db.commit()
-
     def close(self):
         """リソースを解放"""
         self.client.close()
 
+    async def aclose(self):
+        """リソースを解放（非同期クライアントを含む）"""
+        self.close()
+        if self.async_client is not None:
+            await self.async_client.aclose()
+
 
 def get_rakuten_service(db: Session) -> RakutenService:
     """RakutenServiceのファクトリ関数"""
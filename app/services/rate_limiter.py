@@ -0,0 +1,223 @@
+"""
+APIレート制限（トークンバケット）
+
+API種別 + 操作ごとのトークンバケットをRedis上で共有し、
+アイテム・RQワーカー・ホストをまたいでレート制限を遵守する。
+Redisに接続できない場合はプロセス内のバケットで制御する。
+非同期ワーカー（RESEARCH_WORKER_MODE=async）は acquire_async で待機する（イベントループを止めない）。
+
+キー: ratelimit:{api}:{operation}
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+from app.config import get_settings
+from app.database import get_redis
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# 予約型トークンバケット
+# トークンを先に差し引き、不足分が補充されるまでの待機秒数を返す（負の残量 = 予約済み）
+# 時刻はRedisサーバーのTIMEを使い、ホスト間の時計ずれの影響を受けない
+RESERVE_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', key, 'tokens', 'ts', 'rate', 'capacity')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+-- レスポンスから同期された値があればそちらを優先
+rate = tonumber(state[3]) or rate
+capacity = tonumber(state[4]) or capacity
+
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+tokens = tokens - cost
+
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+
+redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', key, math.ceil(capacity / rate + wait) + 60)
+return tostring(wait)
+"""
+
+# APIレスポンスで判明した実際の残量・補充速度でバケットを上書き
+SYNC_SCRIPT = """
+local key = KEYS[1]
+local tokens = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+redis.call('HSET', key, 'tokens', tokens, 'ts', now, 'rate', rate, 'capacity', capacity)
+redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+return 1
+"""
+
+# 補充速度のみ更新（x-amzn-RateLimit-Limit 等）
+SET_RATE_SCRIPT = """
+local key = KEYS[1]
+redis.call('HSET', key, 'rate', ARGV[1])
+redis.call('EXPIRE', key, 3600)
+return 1
+"""
+
+
+class TokenBucket:
+    """プロセス内トークンバケット（スレッドセーフ）"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Args:
+            rate: 補充速度（tokens / second）。0以下は制限なし
+            capacity: バケット容量（バースト）
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """costトークンを予約し、実行可能になるまでの待機秒数を返す"""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+            self._tokens -= cost
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """costトークン分を取得（必要なら待機）。待機した秒数を返す"""
+        wait = self.reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, cost: float = 1.0) -> float:
+        """acquireの非同期版（待機中も他のリクエストを進められる）。待機した秒数を返す"""
+        wait = self.reserve(cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def sync(self, tokens: float, rate: Optional[float] = None, capacity: Optional[float] = None):
+        """APIレスポンスで判明した残量・補充速度で状態を上書き"""
+        with self._lock:
+            if rate is not None and rate > 0:
+                self.rate = rate
+            if capacity is not None and capacity > 0:
+                self.capacity = capacity
+            self._tokens = min(self.capacity, tokens)
+            self._updated_at = time.monotonic()
+
+    def set_rate(self, rate: float):
+        """補充速度のみ更新（残量は維持）"""
+        if rate <= 0:
+            return
+        with self._lock:
+            self.rate = rate
+
+
+class RedisTokenBucket(TokenBucket):
+    """Redis共有トークンバケット（全ワーカーで1つのバケットを共有）"""
+
+    def __init__(self, redis: Redis, key: str, rate: float, capacity: float = 1.0):
+        super().__init__(rate, capacity)
+        self.key = key
+        self._redis = redis
+        self._reserve = redis.register_script(RESERVE_SCRIPT)
+        self._sync = redis.register_script(SYNC_SCRIPT)
+        self._set_rate = redis.register_script(SET_RATE_SCRIPT)
+        self._fallback_logged = False
+
+    def _log_fallback(self, e: Exception):
+        if not self._fallback_logged:
+            logger.warning(f"Rate limiter {self.key}: Redis unavailable, using local bucket ({e})")
+            self._fallback_logged = True
+
+    def reserve(self, cost: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+
+        try:
+            wait = float(self._reserve(keys=[self.key], args=[self.rate, self.capacity, cost]))
+            self._fallback_logged = False
+            return wait
+        except RedisError as e:
+            self._log_fallback(e)
+            return super().reserve(cost)
+
+    def sync(self, tokens: float, rate: Optional[float] = None, capacity: Optional[float] = None):
+        super().sync(tokens, rate, capacity)
+        try:
+            self._sync(keys=[self.key], args=[min(self.capacity, tokens), self.rate, self.capacity])
+        except RedisError as e:
+            self._log_fallback(e)
+
+    def set_rate(self, rate: float):
+        if rate <= 0 or rate == self.rate:
+            return
+        super().set_rate(rate)
+        try:
+            self._set_rate(keys=[self.key], args=[rate])
+        except RedisError as e:
+            self._log_fallback(e)
+
+
+_limiters: dict[tuple[str, str], TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    api: str,
+    operation: str = "default",
+    rate: float = 1.0,
+    capacity: float = 1.0,
+) -> TokenBucket:
+    """
+    API種別 + 操作ごとのレートリミッタを取得（プロセス内で共有）
+
+    Args:
+        api: API種別（keepa / sp_api / rakuten）
+        operation: 操作名（getItemOffers 等）
+        rate: requests per second
+        capacity: バースト
+    """
+    key = (api, operation)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            if settings.rate_limit_backend == "redis":
+                limiter = RedisTokenBucket(get_redis(), f"ratelimit:{api}:{operation}", rate, capacity)
+            else:
+                limiter = TokenBucket(rate, capacity)
+            _limiters[key] = limiter
+        return limiter
@@ -2,23 +2,25 @@
 Amazon SP-API クライアント
 
 v1.0で使用するAPI:
-- Product Pricing API: getItemOffers（最安FBA価格）
-- Product Fees API: getMyFeesEstimateForASIN（手数料計算）
+- Product Pricing API: getItemOffers / getItemOffersBatch（最安FBA価格）
+- Product Fees API: getMyFeesEstimateForASIN / getMyFeesEstimates（手数料計算）
 - Catalog Items API: getCatalogItem（JAN/型番補完）
 - Listings Restrictions API: getListingsRestrictions（出品制限）
 
-レート制限: 1 rps / burst 2
+レート制限: 操作ごとのUsage Plan（rate / burst）をSettingsで設定
+x-amzn-RateLimit-Limit ヘッダーが返ってきた場合はその値に追従する
 """
 import logging
-import time
-from datetime import datetime, timedelta
+import threading
+from functools import lru_cache
 from typing import Optional, Any
 from decimal import Decimal
 
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
-from app.models.cache import ApiCache
+from app.services.api_cache import NOT_FOUND, ApiCacheStore
+from app.services.rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -26,12 +28,31 @@ settings = get_settings()
 # SP-API ライブラリ
 try:
     from sp_api.api import Products, ProductFees, CatalogItems, ListingsRestrictions
-    from sp_api.base import Marketplaces, SellingApiException
+    from sp_api.base import Marketplaces, SellingApiException, SellingApiNotFoundException
     SP_API_AVAILABLE = True
 except ImportError:
     SP_API_AVAILABLE = False
     logger.warning("python-amazon-sp-api not available")
 
+# バッチ操作（getItemOffersBatch / getMyFeesEstimates）の1リクエスト最大件数
+SP_API_BATCH_SIZE = 20
+
+# 操作ごとのレート制限: operation -> (requests per second, burst)
+SP_API_OPERATION_LIMITS = {
+    "getItemOffers": (settings.sp_api_rate_get_item_offers, settings.sp_api_burst_get_item_offers),
+    "getMyFeesEstimateForASIN": (settings.sp_api_rate_get_fees_estimate, settings.sp_api_burst_get_fees_estimate),
+    "getCatalogItem": (settings.sp_api_rate_get_catalog_item, settings.sp_api_burst_get_catalog_item),
+    "getListingsRestrictions": (
+        settings.sp_api_rate_get_listings_restrictions,
+        settings.sp_api_burst_get_listings_restrictions,
+    ),
+    "getItemOffersBatch": (
+        settings.sp_api_rate_get_item_offers_batch,
+        settings.sp_api_burst_get_item_offers_batch,
+    ),
+    "getMyFeesEstimates": (settings.sp_api_rate_get_fees_estimates, settings.sp_api_burst_get_fees_estimates),
+}
+
 
 class SpApiClient:
     """SP-API クライアント（レート制限対応）"""
@@ -51,83 +72,99 @@ class SpApiClient:
         }
         self.marketplace = getattr(Marketplaces, "JP", None)
         self.rate_limit = rate_limit
-        self._last_request_time = 0.0
-
-    def _wait_for_rate_limit(self):
-        """レート制限を遵守"""
-        if self.rate_limit <= 0:
+        # APIクライアントはHTTP接続を保持するため使い回す
+        self._apis: dict[str, Any] = {}
+        self._apis_lock = threading.Lock()
+
+    def _get_limiter(self, operation: str):
+        """操作ごとのレートリミッタ（未定義の操作は rate_limit / burst 1）"""
+        rate, burst = SP_API_OPERATION_LIMITS.get(operation, (self.rate_limit, 1))
+        return get_rate_limiter("sp_api", operation, rate=rate, capacity=burst)
+
+    def _wait_for_rate_limit(self, operation: str = "default"):
+        """レート制限を遵守（操作ごと・全ワーカー共有）"""
+        self._get_limiter(operation).acquire()
+
+    def _update_rate_limit(self, operation: str, response):
+        """レスポンスの x-amzn-RateLimit-Limit ヘッダーでレートを更新"""
+        rate_limit = getattr(response, "rate_limit", None)
+        if not rate_limit:
             return
-        min_interval = 1.0 / self.rate_limit
-        elapsed = time.time() - self._last_request_time
-        if elapsed < min_interval:
-            time.sleep(min_interval - elapsed)
-        self._last_request_time = time.time()
+        try:
+            self._get_limiter(operation).set_rate(float(rate_limit))
+        except (TypeError, ValueError):
+            logger.debug(f"Invalid x-amzn-RateLimit-Limit for {operation}: {rate_limit}")
+
+    def _get_api(self, api_class):
+        """APIクライアントを取得（初回のみ生成し、以降は使い回す）"""
+        with self._apis_lock:
+            api = self._apis.get(api_class.__name__)
+            if api is None:
+                # LWAアクセストークンはライブラリがプロセス内でキャッシュする（AccessTokenClientのTTLCache）
+                api = api_class(
+                    credentials=self.credentials,
+                    marketplace=self.marketplace,
+                )
+                self._apis[api_class.__name__] = api
+            return api
 
     def _get_products_api(self):
         """Product Pricing APIクライアント"""
-        return Products(credentials=self.credentials, marketplace=self.marketplace)
+        return self._get_api(Products)
 
     def _get_fees_api(self):
         """Product Fees APIクライアント"""
-        return ProductFees(credentials=self.credentials, marketplace=self.marketplace)
+        return self._get_api(ProductFees)
 
     def _get_catalog_api(self):
         """Catalog Items APIクライアント"""
-        return CatalogItems(credentials=self.credentials, marketplace=self.marketplace)
+        return self._get_api(CatalogItems)
 
     def _get_restrictions_api(self):
         """Listings Restrictions APIクライアント"""
-        return ListingsRestrictions(credentials=self.credentials, marketplace=self.marketplace)
+        return self._get_api(ListingsRestrictions)
+
+
+@lru_cache
+def get_sp_api_client() -> SpApiClient:
+    """ワーカープロセス内で共有するSP-APIクライアント"""
+    return SpApiClient(
+        refresh_token=settings.sp_api_refresh_token,
+        lwa_app_id=settings.sp_api_client_id,
+        lwa_client_secret=settings.sp_api_client_secret,
+        marketplace=settings.sp_api_marketplace_id,
+        rate_limit=settings.rate_limit_sp_api,
+    )
+
+
+def sp_api_cache_keys(asin: str) -> list[str]:
+    """ASINだけで決まるSP-APIキャッシュキー（手数料は価格が決まってから）"""
+    return [
+        f"sp_api_offers_{asin}",
+        f"sp_api_catalog_{asin}",
+        f"sp_api_restrictions_{asin}",
+    ]
 
 
 class SpApiService:
     """SP-APIデータ取得サービス"""
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache: Optional[ApiCacheStore] = None):
         self.db = db
+        self.cache = cache or ApiCacheStore(db)
         if not SP_API_AVAILABLE:
             self.client = None
             return
 
-        self.client = SpApiClient(
-            refresh_token=settings.sp_api_refresh_token,
-            lwa_app_id=settings.sp_api_client_id,
-            lwa_client_secret=settings.sp_api_client_secret,
-            marketplace=settings.sp_api_marketplace_id,
-            rate_limit=settings.rate_limit_sp_api,
-        )
+        self.client = get_sp_api_client()
 
     def _get_cache(self, cache_key: str, api_type: str) -> Optional[dict]:
         """キャッシュからデータを取得"""
-        cache = (
-            self.db.query(ApiCache)
-            .filter(
-                ApiCache.cache_key == cache_key,
-                ApiCache.expires_at > datetime.utcnow(),
-            )
-            .first()
-        )
-        if cache:
-            logger.debug(f"Cache hit: {cache_key}")
-            return cache.response_data
-        return None
+        return self.cache.get(cache_key)
 
     def _set_cache(self, cache_key: str, api_type: str, data: dict, params: dict = None):
         """キャッシュにデータを保存"""
-        expires_at = datetime.utcnow() + timedelta(seconds=settings.cache_ttl_seconds)
-
-        self.db.query(ApiCache).filter(ApiCache.cache_key == cache_key).delete()
-
-        cache = ApiCache(
-            cache_key=cache_key,
-            api_type=api_type,
-            request_params=params,
-            response_data=data,
-            fetched_at=datetime.utcnow(),
-            expires_at=expires_at,
-        )
-        self.db.add(cache)
-        self.db.commit()
+        self.cache.set(cache_key, api_type, data, params)
 
     def get_item_offers(self, asin: str, use_cache: bool = True) -> Optional[dict]:
         """
@@ -145,17 +182,23 @@ class SpApiService:
 
         if use_cache:
             cached = self._get_cache(cache_key, "SP_API_PRICING")
-            if cached:
+            if cached is not None:
                 return cached
 
         if not self.client:
             logger.warning("SP-API client not configured")
             return None
 
+        # 他ワーカーが同じキーを取得中ならその結果を使う
+        return self.cache.fetch_one(cache_key, lambda: self._request_item_offers(asin, cache_key))
+
+    def _request_item_offers(self, asin: str, cache_key: str) -> Optional[dict]:
+        """getItemOffersを呼び出してキャッシュに保存"""
         try:
-            self.client._wait_for_rate_limit()
+            self.client._wait_for_rate_limit("getItemOffers")
             products_api = self.client._get_products_api()
             response = products_api.get_item_offers(asin=asin, item_condition="New")
+            self.client._update_rate_limit("getItemOffers", response)
 
             result = self._parse_offers(response.payload)
             self._set_cache(cache_key, "SP_API_PRICING", result, {"asin": asin})
@@ -165,6 +208,87 @@ class SpApiService:
             logger.error(f"SP-API get_item_offers error for {asin}: {e}")
             return None
 
+    def get_item_offers_batch(self, asins: list[str], use_cache: bool = True) -> dict[str, dict]:
+        """
+        複数ASINのオファー情報をまとめて取得（getItemOffersBatch、最大20件/リクエスト）
+
+        Returns:
+            {asin: get_item_offers と同じ形式}（取得できなかったASINは含まない）
+        """
+        results = {}
+        misses = []
+
+        if use_cache:
+            self.cache.prefetch(f"sp_api_offers_{asin}" for asin in asins)
+
+        for asin in dict.fromkeys(asins):
+            cached = self._get_cache(f"sp_api_offers_{asin}", "SP_API_PRICING") if use_cache else None
+            if cached is not None:
+                results[asin] = cached
+            else:
+                misses.append(asin)
+
+        if not misses:
+            return results
+
+        if not self.client:
+            logger.warning("SP-API client not configured")
+            return results
+
+        # 他ワーカーが取得中のキーはその結果を待つ
+        requests_by_key = {f"sp_api_offers_{asin}": asin for asin in misses}
+        fetched = self.cache.fetch_coalesced(
+            list(requests_by_key),
+            lambda keys: self._request_item_offers_batch([requests_by_key[key] for key in keys]),
+        )
+        for key, result in fetched.items():
+            results[requests_by_key[key]] = result
+
+        return results
+
+    def _request_item_offers_batch(self, asins: list[str]) -> dict[str, dict]:
+        """
+        getItemOffersBatchを呼び出してキャッシュに保存
+
+        Returns:
+            {cache_key: 結果}
+        """
+        fetched = {}
+        for start in range(0, len(asins), SP_API_BATCH_SIZE):
+            chunk = asins[start:start + SP_API_BATCH_SIZE]
+            requests_ = [
+                {
+                    "uri": f"/products/pricing/v0/items/{asin}/offers",
+                    "method": "GET",
+                    "MarketplaceId": settings.sp_api_marketplace_id,
+                    "ItemCondition": "New",
+                }
+                for asin in chunk
+            ]
+
+            try:
+                self.client._wait_for_rate_limit("getItemOffersBatch")
+                products_api = self.client._get_products_api()
+                response = products_api.get_item_offers_batch(requests_=requests_)
+                self.client._update_rate_limit("getItemOffersBatch", response)
+            except Exception as e:
+                logger.error(f"SP-API get_item_offers_batch error for {len(chunk)} ASINs: {e}")
+                continue
+
+            for entry in (response.payload or {}).get('responses', []):
+                status = entry.get('status', {}).get('statusCode')
+                body_payload = entry.get('body', {}).get('payload') or {}
+                asin = entry.get('request', {}).get('Asin') or body_payload.get('ASIN')
+                if status != 200 or not asin:
+                    # 個別に失敗したASINは単発APIで再取得される
+                    continue
+
+                result = self._parse_offers(body_payload)
+                self._set_cache(f"sp_api_offers_{asin}", "SP_API_PRICING", result, {"asin": asin})
+                fetched[f"sp_api_offers_{asin}"] = result
+
+        return fetched
+
     def _parse_offers(self, payload: dict) -> dict:
         """オファー情報を解析"""
         result = {
@@ -243,15 +367,20 @@ class SpApiService:
 
         if use_cache:
             cached = self._get_cache(cache_key, "SP_API_FEES")
-            if cached:
+            if cached is not None:
                 return cached
 
         if not self.client:
             logger.warning("SP-API client not configured")
             return None
 
+        # 他ワーカーが同じキーを取得中ならその結果を使う
+        return self.cache.fetch_one(cache_key, lambda: self._request_fees_estimate(asin, price, cache_key))
+
+    def _request_fees_estimate(self, asin: str, price: int, cache_key: str) -> Optional[dict]:
+        """getMyFeesEstimateForASINを呼び出してキャッシュに保存"""
         try:
-            self.client._wait_for_rate_limit()
+            self.client._wait_for_rate_limit("getMyFeesEstimateForASIN")
             fees_api = self.client._get_fees_api()
 
             # リクエストボディ
@@ -270,6 +399,7 @@ class SpApiService:
             }
 
             response = fees_api.get_my_fees_estimate_for_asin(asin=asin, body=body)
+            self.client._update_rate_limit("getMyFeesEstimateForASIN", response)
             result = self._parse_fees(response.payload)
             self._set_cache(cache_key, "SP_API_FEES", result, {"asin": asin, "price": price})
             return result
@@ -278,6 +408,101 @@ class SpApiService:
             logger.error(f"SP-API get_fees_estimate error for {asin}: {e}")
             return None
 
+    def get_fees_estimates_batch(
+        self,
+        asin_prices: list[tuple[str, int]],
+        use_cache: bool = True,
+    ) -> dict[tuple[str, int], dict]:
+        """
+        複数ASINの手数料見積もりをまとめて取得（getMyFeesEstimates、最大20件/リクエスト）
+
+        Args:
+            asin_prices: [(ASIN, 販売価格（円）), ...]
+
+        Returns:
+            {(asin, price): get_fees_estimate と同じ形式}（取得できなかった分は含まない）
+        """
+        results = {}
+        misses = []
+
+        if use_cache:
+            self.cache.prefetch(f"sp_api_fees_{asin}_{price}" for asin, price in asin_prices)
+
+        for asin, price in dict.fromkeys(asin_prices):
+            cached = self._get_cache(f"sp_api_fees_{asin}_{price}", "SP_API_FEES") if use_cache else None
+            if cached is not None:
+                results[(asin, price)] = cached
+            else:
+                misses.append((asin, price))
+
+        if not misses:
+            return results
+
+        if not self.client:
+            logger.warning("SP-API client not configured")
+            return results
+
+        # 他ワーカーが取得中のキーはその結果を待つ
+        requests_by_key = {f"sp_api_fees_{asin}_{price}": (asin, price) for asin, price in misses}
+        fetched = self.cache.fetch_coalesced(
+            list(requests_by_key),
+            lambda keys: self._request_fees_estimates_batch([requests_by_key[key] for key in keys]),
+        )
+        for key, result in fetched.items():
+            results[requests_by_key[key]] = result
+
+        return results
+
+    def _request_fees_estimates_batch(self, asin_prices: list[tuple[str, int]]) -> dict[str, dict]:
+        """
+        getMyFeesEstimatesを呼び出してキャッシュに保存
+
+        Returns:
+            {cache_key: 結果}
+        """
+        fetched = {}
+        for start in range(0, len(asin_prices), SP_API_BATCH_SIZE):
+            chunk = asin_prices[start:start + SP_API_BATCH_SIZE]
+            estimate_requests = [
+                {
+                    "id_type": "ASIN",
+                    "id_value": asin,
+                    "identifier": f"{asin}_{price}",
+                    "price": price,
+                    "currency": "JPY",
+                    "is_fba": True,
+                    "marketplace_id": settings.sp_api_marketplace_id,
+                }
+                for asin, price in chunk
+            ]
+
+            try:
+                self.client._wait_for_rate_limit("getMyFeesEstimates")
+                fees_api = self.client._get_fees_api()
+                response = fees_api.get_my_fees_estimates(estimate_requests=estimate_requests)
+                self.client._update_rate_limit("getMyFeesEstimates", response)
+            except Exception as e:
+                logger.error(f"SP-API get_fees_estimates_batch error for {len(chunk)} ASINs: {e}")
+                continue
+
+            payload = response.payload
+            estimates = payload if isinstance(payload, list) else (payload or {}).get('payload', [])
+            requested = {f"{asin}_{price}": (asin, price) for asin, price in chunk}
+            for estimate in estimates:
+                identifier = estimate.get('FeesEstimateIdentifier', {}).get('SellerInputIdentifier')
+                key = requested.get(identifier)
+                if estimate.get('Status') != 'Success' or not key:
+                    continue
+
+                asin, price = key
+                result = self._parse_fees({'FeesEstimateResult': estimate})
+                self._set_cache(
+                    f"sp_api_fees_{asin}_{price}", "SP_API_FEES", result, {"asin": asin, "price": price}
+                )
+                fetched[f"sp_api_fees_{asin}_{price}"] = result
+
+        return fetched
+
     def _parse_fees(self, payload: dict) -> dict:
         """手数料情報を解析"""
         result = {
@@ -333,25 +558,39 @@ class SpApiService:
 
         if use_cache:
             cached = self._get_cache(cache_key, "SP_API_CATALOG")
-            if cached:
+            if cached is NOT_FOUND:
+                return None
+            if cached is not None:
                 return cached
 
         if not self.client:
             logger.warning("SP-API client not configured")
             return None
 
+        # 他ワーカーが同じキーを取得中ならその結果を使う
+        return self.cache.fetch_one(cache_key, lambda: self._request_catalog_item(asin, cache_key))
+
+    def _request_catalog_item(self, asin: str, cache_key: str) -> Optional[dict]:
+        """getCatalogItemを呼び出してキャッシュに保存"""
         try:
-            self.client._wait_for_rate_limit()
+            self.client._wait_for_rate_limit("getCatalogItem")
             catalog_api = self.client._get_catalog_api()
             response = catalog_api.get_catalog_item(
                 asin=asin,
                 includedData=["attributes", "identifiers", "summaries"],
             )
+            self.client._update_rate_limit("getCatalogItem", response)
 
             result = self._parse_catalog(response.payload)
             self._set_cache(cache_key, "SP_API_CATALOG", result, {"asin": asin})
             return result
 
+        except SellingApiNotFoundException:
+            # カタログに無いASIN（ネガティブキャッシュ）
+            logger.info(f"SP-API catalog item not found: {asin}")
+            self.cache.set_not_found(cache_key, "SP_API_CATALOG", {"asin": asin})
+            return None
+
         except Exception as e:
             logger.error(f"SP-API get_catalog_item error for {asin}: {e}")
             return None
@@ -418,21 +657,27 @@ class SpApiService:
 
         if use_cache:
             cached = self._get_cache(cache_key, "SP_API_RESTRICTIONS")
-            if cached:
+            if cached is not None:
                 return cached
 
         if not self.client:
             logger.warning("SP-API client not configured")
             return None
 
+        # 他ワーカーが同じキーを取得中ならその結果を使う
+        return self.cache.fetch_one(cache_key, lambda: self._request_listing_restrictions(asin, cache_key))
+
+    def _request_listing_restrictions(self, asin: str, cache_key: str) -> Optional[dict]:
+        """getListingsRestrictionsを呼び出してキャッシュに保存"""
         try:
-            self.client._wait_for_rate_limit()
+            self.client._wait_for_rate_limit("getListingsRestrictions")
             restrictions_api = self.client._get_restrictions_api()
             response = restrictions_api.get_listings_restrictions(
                 asin=asin,
                 sellerId="",  # 自分のセラーID（設定から取得が必要）
                 marketplaceIds=[settings.sp_api_marketplace_id],
             )
+            self.client._update_rate_limit("getListingsRestrictions", response)
 
             result = self._parse_restrictions(response.payload)
             self._set_cache(cache_key, "SP_API_RESTRICTIONS", result, {"asin": asin})
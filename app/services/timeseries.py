@@ -0,0 +1,139 @@
+"""
+時系列データの圧縮保存・読み込み
+
+TIMESERIES_STORAGE=packed の場合、時系列を research_timeseries_packed に
+job_id + ASIN + メトリクスごとに1行で保存する。
+
+data列は (keepa_minute, value) の組を int32 リトルエンディアンで並べたもの。
+先頭の組は絶対値、以降は直前の組との差分（1日1点・90日分で720バイト）。
+読み込みはNumPyで一括復元する（TimeseriesService.get_series、API: GET /api/items/{item_id}/timeseries）。
+
+保存前に downsample_daily で1日1点に集約する（集約方法はメトリクスごとに設定）。
+"""
+import logging
+from datetime import datetime
+from typing import Optional, Sequence, get_args
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import DailyAggregation, get_settings
+from app.models.timeseries import ResearchTimeseries, ResearchTimeseriesPacked
+from app.services.keepa import MINUTES_PER_DAY, datetime_to_keepa_time
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+# 1日1点への集約方法
+DAILY_AGGREGATIONS = get_args(DailyAggregation)
+
+# 保存するメトリクスごとの集約方法（値はSettingsで検証済み）
+DAILY_AGGREGATION_BY_METRIC = {
+    "PRICE": settings.timeseries_daily_agg_price,
+    "RANK": settings.timeseries_daily_agg_rank,
+}
+
+
+def downsample_daily(minutes: Sequence[int], values: Sequence[int], how: str) -> tuple[list, list]:
+    """
+    時系列を1日1点に集約（時刻の昇順が前提）
+
+    Args:
+        minutes: Keepa時間の列
+        values: 値の列
+        how: min / max / last / mean（meanは整数に丸める）
+
+    Returns:
+        (各日の0時のKeepa時間の列, 集約値の列)
+    """
+    if how not in DAILY_AGGREGATIONS:
+        raise ValueError(f"Unknown daily aggregation: {how}")
+    if not len(minutes):
+        return [], []
+
+    days = np.asarray(minutes, dtype=np.int64) // MINUTES_PER_DAY
+    series = np.asarray(values, dtype=np.int64)
+    # 各日の先頭位置
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    if how == "min":
+        daily = np.minimum.reduceat(series, starts)
+    elif how == "max":
+        daily = np.maximum.reduceat(series, starts)
+    elif how == "last":
+        daily = series[np.r_[starts[1:] - 1, len(series) - 1]]
+    else:
+        counts = np.diff(np.r_[starts, len(series)])
+        daily = np.rint(np.add.reduceat(series, starts) / counts).astype(np.int64)
+    return (days[starts] * MINUTES_PER_DAY).tolist(), daily.tolist()
+
+
+def pack_series(minutes: Sequence[int], values: Sequence[int]) -> bytes:
+    """(keepa_minute, value) の列をint32差分列のバイト列に変換"""
+    if len(minutes) != len(values):
+        raise ValueError("minutes and values must have the same length")
+    if not len(minutes):
+        return b""
+
+    pairs = np.column_stack((np.asarray(minutes, dtype=np.int64), np.asarray(values, dtype=np.int64)))
+    deltas = np.diff(pairs, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    if deltas.min() < -2**31 or deltas.max() >= 2**31:
+        raise ValueError("timeseries delta out of int32 range")
+    return deltas.astype("<i4").tobytes()
+
+
+def unpack_series(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """int32差分列のバイト列を (keepa_minute列, value列) のint64配列に復元"""
+    pairs = np.frombuffer(data, dtype="<i4").reshape(-1, 2).astype(np.int64).cumsum(axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class TimeseriesService:
+
+    @staticmethod
+    def get_series(
+        db: Session,
+        job_id: str,
+        asin: str,
+        metric: str,
+    ) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """
+        時系列を (keepa_minute列, value列) で取得
+
+        圧縮保存があれば1行読むだけで復元する。無ければ行単位のテーブルから組み立てる
+
+        Returns:
+            (keepa_minute列, value列) or None（データなし）
+        """
+        packed = (
+            db.query(ResearchTimeseriesPacked.data)
+            .filter(
+                ResearchTimeseriesPacked.job_id == job_id,
+                ResearchTimeseriesPacked.asin == asin,
+                ResearchTimeseriesPacked.metric == metric,
+            )
+            .first()
+        )
+        if packed is not None:
+            return unpack_series(packed.data)
+
+        rows = (
+            db.query(ResearchTimeseries.recorded_date, ResearchTimeseries.value)
+            .filter(
+                ResearchTimeseries.job_id == job_id,
+                ResearchTimeseries.asin == asin,
+                ResearchTimeseries.metric == metric,
+                ResearchTimeseries.value.isnot(None),
+            )
+            .order_by(ResearchTimeseries.recorded_date)
+            .all()
+        )
+        if not rows:
+            return None
+
+        minutes = [
+            datetime_to_keepa_time(datetime.combine(recorded_date, datetime.min.time()))
+            for recorded_date, _ in rows
+        ]
+        values = [value for _, value in rows]
+        return np.asarray(minutes, dtype=np.int64), np.asarray(values, dtype=np.int64)
@@ -0,0 +1,325 @@
+"""
+非同期ワーカー（asyncioによるリサーチジョブの処理）
+
+1スレッドのイベントループで多数のアイテムを同時に処理し、各APIのクォータ
+（共有トークンバケット）いっぱいまでリクエストを並行させる。
+リクエストごとにスレッドを持たないため、数千件のASINでも1プロセスで処理できる。
+
+- Keepa・楽天: httpx.AsyncClient（AsyncKeepaClient / AsyncRakutenClient）
+- SP-API: ライブラリ（python-amazon-sp-api）が同期のため少数のスレッドで実行する。
+  スレッドはそれぞれ自分のセッション・キャッシュ（読み込み用）を持ち、アイテムには触れず取得結果だけを返す。
+  キャッシュのL3への書き込みはスレッドでは行わず、ジョブのキャッシュへ渡してジョブのトランザクションで反映する
+  （SP-APIスレッドが未コミットのジョブのトランザクションのロックを待ち、ジョブがSP-APIの結果を待つ、を防ぐ）
+- ジョブのセッションを使う処理（アイテムの更新・時系列・楽天候補の保存・キャッシュの読み書き・
+  ItemUnitOfWorkのコミット）はすべて1本のDBスレッドで実行し、イベントループはDBの待ちで止まらない。
+  イベントループ側はアイテムに触れず、DBスレッドから受け取った値（ASIN・JAN等）だけでAPIを呼ぶ
+- 処理中のアイテムをコミットのたびに期限切れにしないよう、実行中はセッションを
+  expire_on_commit=False にする（コミット後の再読み込みのSELECTを発生させない）
+
+RESEARCH_WORKER_MODE=async の場合に run_research_items（process_research_chunk → run_claimed_items）から使う。
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.item import ResearchItem
+from app.models.job import ResearchJob
+from app.services.api_cache import ApiCacheStore
+from app.services.calculator import ProfitCalculator
+from app.services.keepa import KeepaService, KEEPA_MAX_ASINS_PER_REQUEST
+from app.services.rakuten import RakutenService, rakuten_cache_keys
+from app.services.sp_api import SP_API_BATCH_SIZE, SpApiService
+from app.workers.pipeline import StageContext, workers_for_rate
+from app.workers.tasks import (
+    apply_rakuten_result,
+    apply_sp_api_data,
+    lookup_sp_api_data,
+    prefetch_sp_api_batch,
+    screen_keepa_parsed,
+)
+from app.workers.unit_of_work import ItemUnitOfWork
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class AsyncResearchRunner:
+    """
+    リサーチジョブの非同期実行
+
+    Keepaは100件ずつ順に取得し（トークン制のため1本ずつで足りる）、1次通過分の2次確定を
+    20件ずつタスクとして投入してすぐ次のKeepaバッチへ進む。
+    楽天への問い合わせは同時に ASYNC_MAX_IN_FLIGHT 件まで（実際の間隔はレートリミッタが決める）
+    """
+
+    def __init__(self, db: Session, job: ResearchJob, cache: ApiCacheStore):
+        self.db = db
+        self.job = job
+        self.job_id = job.job_id
+        self.point_rate = float(job.point_rate_total)
+        self.cache = cache
+        self.uow = ItemUnitOfWork(db, job.job_id, cache=cache)
+        self.keepa = KeepaService(db, cache=cache)
+        self.rakuten = RakutenService(db, cache=cache)
+        self.processed = 0
+
+        # SP-APIスレッドごとのセッション・キャッシュ
+        self._sp_api_local = threading.local()
+        self._sp_api_contexts: list[StageContext] = []
+        self._sp_api_contexts_lock = threading.Lock()
+
+    def run(self, items: list[ResearchItem]) -> int:
+        """
+        アイテムをイベントループで処理し、コミットまで完了させる
+
+        Returns:
+            処理件数
+        """
+        if not items:
+            return 0
+
+        expire_on_commit = self.db.expire_on_commit
+        self.db.expire_on_commit = False
+        try:
+            return asyncio.run(self._run(items))
+        finally:
+            self.db.expire_on_commit = expire_on_commit
+
+    async def _run(self, items: list[ResearchItem]) -> int:
+        self._in_flight = asyncio.Semaphore(max(settings.async_max_in_flight, 1))
+        # ジョブのセッションを使う処理はすべてこのスレッドで実行（セッションはスレッドセーフではない）
+        db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-db")
+        self.cache.db_executor = db_executor
+        self._sp_api_pool = ThreadPoolExecutor(
+            max_workers=workers_for_rate(
+                settings.sp_api_rate_get_listings_restrictions, settings.async_sp_api_threads
+            ),
+            thread_name_prefix="async-sp-api",
+        )
+
+        tasks = []
+        try:
+            for start in range(0, len(items), KEEPA_MAX_ASINS_PER_REQUEST):
+                passed_items = await self._screen_keepa(items[start:start + KEEPA_MAX_ASINS_PER_REQUEST])
+                for sp_start in range(0, len(passed_items), SP_API_BATCH_SIZE):
+                    batch = passed_items[sp_start:sp_start + SP_API_BATCH_SIZE]
+                    tasks.append(asyncio.create_task(self._second_stage(batch)))
+
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            self._sp_api_pool.shutdown(wait=True)
+            await self.keepa.aclose()
+            await self.rakuten.aclose()
+            try:
+                # 残ったSP-APIスレッドのキャッシュ書き込みがこのトランザクションのロックを待たないよう先にコミット
+                try:
+                    await self.cache.run_db(self.uow.commit)
+                finally:
+                    await self.cache.run_db(self._close_sp_api_contexts)
+            finally:
+                self.cache.db_executor = None
+                db_executor.shutdown(wait=True)
+
+        return self.processed
+
+    async def _screen_keepa(self, chunk: list[ResearchItem]) -> list[ResearchItem]:
+        """
+        1次スクリーニング: Keepaをまとめて取得
+
+        Returns:
+            2次確定に進むitemリスト
+        """
+        asins = await self.cache.run_db(self._start_keepa_batch, chunk)
+
+        try:
+            parsed_products = await self.keepa.fetch_parsed_products_async(asins)
+        except Exception as e:
+            logger.error(f"Keepa batch error: {e}")
+            await self.cache.run_db(self._fail_keepa_batch, chunk, e)
+            return []
+
+        return await self.cache.run_db(self._screen_parsed, chunk, parsed_products)
+
+    async def _second_stage(self, batch: list[ResearchItem]):
+        """2次確定: SP-API（スレッド）→ 楽天・利益計算（アイテムごとに並行）"""
+        requests = await self.cache.run_db(self._sp_api_requests, batch)
+        loop = asyncio.get_running_loop()
+        try:
+            sp_api_data, cache_writes = await loop.run_in_executor(
+                self._sp_api_pool, self._lookup_sp_api, requests
+            )
+        except Exception as e:
+            # SP-APIエラーは致命的ではない（続行）
+            logger.warning(f"SP-API batch error: {e}")
+            sp_api_data = {}
+        else:
+            await self.cache.run_db(self.cache.add_pending_writes, *cache_writes)
+
+        await asyncio.gather(*(
+            self._finish_item(item, sp_api_data.get(asin))
+            for item, (asin, _, _) in zip(batch, requests)
+        ))
+
+    async def _finish_item(self, item: ResearchItem, sp_api_data: Optional[dict]):
+        """SP-APIの反映 → 楽天検索 → 利益計算・判定"""
+        async with self._in_flight:
+            keys = await self.cache.run_db(self._apply_sp_api, item, sp_api_data)
+            if keys is None:
+                return
+            asin, jan_code, model_number = keys
+
+            try:
+                result = await self.rakuten.find_matching_items_async(
+                    jan_code=jan_code,
+                    model_number=model_number,
+                    job_id=self.job_id,
+                    asin=asin,
+                    point_rate=self.point_rate,
+                )
+            except Exception as e:
+                logger.warning(f"Rakuten error for {asin}: {e}")
+                result = None
+
+            await self.cache.run_db(self._complete_item, item, result)
+
+    # ========== ジョブのセッションを使う処理（DBスレッドで実行） ==========
+
+    def _start_keepa_batch(self, chunk: list[ResearchItem]) -> list[str]:
+        """1次スクリーニングの開始（処理中にしてASINを返す）"""
+        for item in chunk:
+            item.process_status = "PROCESSING"
+        return [item.asin for item in chunk]
+
+    def _fail_keepa_batch(self, chunk: list[ResearchItem], error: Exception):
+        """Keepaの取得に失敗したバッチを失敗にする"""
+        for item in chunk:
+            item.process_status = "FAILED"
+            item.fail_reason = str(error)[:500]
+        self.uow.item_done(len(chunk))
+
+    def _screen_parsed(self, chunk: list[ResearchItem], parsed_products: dict[str, dict]) -> list[ResearchItem]:
+        """取得済みのKeepaデータで1次スクリーニング（時系列の保存・楽天検索キーの先読みを含む）"""
+        passed_items, screened = screen_keepa_parsed(self.keepa, chunk, self.job, parsed_products)
+        self.processed += screened
+
+        # 楽天検索キーはKeepaでJAN/型番が判明してから先読み
+        self.cache.prefetch(
+            key
+            for item in passed_items
+            for key in rakuten_cache_keys(item.jan_code, item.model_number)
+        )
+
+        self.uow.item_done(len(chunk) - len(passed_items))
+        return passed_items
+
+    @staticmethod
+    def _sp_api_requests(batch: list[ResearchItem]) -> list[tuple[str, Optional[int], bool]]:
+        """SP-APIスレッドに渡す (ASIN, 取得済みの最安FBA価格, カタログ情報が必要か) のリスト"""
+        return [
+            (item.asin, item.amazon_price_fba_lowest, not item.jan_code or not item.model_number)
+            for item in batch
+        ]
+
+    def _apply_sp_api(
+        self,
+        item: ResearchItem,
+        sp_api_data: Optional[dict],
+    ) -> Optional[tuple[str, Optional[str], Optional[str]]]:
+        """
+        SP-APIのデータを反映し、楽天検索に使う値を返す
+
+        Returns:
+            (ASIN, JANコード, 型番) / None（失敗としてアイテムの処理を終えた）
+        """
+        try:
+            if sp_api_data:
+                apply_sp_api_data(item, sp_api_data)
+            return item.asin, item.jan_code, item.model_number
+        except Exception as e:
+            self._fail_item(item, e)
+            self.uow.item_done()
+            return None
+
+    def _complete_item(self, item: ResearchItem, rakuten_result: Optional[dict]):
+        """楽天の結果の反映 → 利益計算・判定（rakuten_resultがNoneなら楽天エラー）"""
+        try:
+            if rakuten_result is None:
+                item.rakuten_match_type = 'UNKNOWN'
+            else:
+                apply_rakuten_result(item, rakuten_result)
+
+            calculator = ProfitCalculator(self.job)
+            calculator.calculate_and_evaluate(item)
+
+            item.process_status = "SUCCESS"
+            item.fetched_at = datetime.utcnow()
+            self.processed += 1
+        except Exception as e:
+            self._fail_item(item, e)
+
+        self.uow.item_done()
+
+    @staticmethod
+    def _fail_item(item: ResearchItem, error: Exception):
+        logger.error(f"Error processing ASIN {item.asin}: {error}")
+        item.process_status = "FAILED"
+        item.fail_reason = str(error)[:500]
+
+    # ========== SP-API（スレッドで実行） ==========
+
+    def _sp_api_context(self) -> StageContext:
+        """このスレッドのセッション・キャッシュ"""
+        context = getattr(self._sp_api_local, "context", None)
+        if context is None:
+            db = SessionLocal()
+            context = StageContext(db, ApiCacheStore(db, buffer_writes=True, auto_flush=False))
+            self._sp_api_local.context = context
+            with self._sp_api_contexts_lock:
+                self._sp_api_contexts.append(context)
+        return context
+
+    def _lookup_sp_api(
+        self,
+        requests: list[tuple[str, Optional[int], bool]],
+    ) -> tuple[dict[str, dict], tuple[list[dict], Iterable[str]]]:
+        """
+        SP-APIのデータを取得（オファー・手数料は20件ずつまとめて先に取得）
+
+        Args:
+            requests: [(ASIN, 取得済みの最安FBA価格, カタログ情報が必要か), ...]
+
+        Returns:
+            ({asin: lookup_sp_api_dataの結果}, ジョブのキャッシュへ渡す書き込み（take_pending_writes）)
+        """
+        context = self._sp_api_context()
+        sp_api = SpApiService(context.db, cache=context.cache)
+        prefetch_sp_api_batch(context.db, [asin for asin, _, _ in requests], cache=context.cache)
+
+        results = {}
+        for asin, price, need_catalog in requests:
+            try:
+                results[asin] = lookup_sp_api_data(sp_api, asin, price, need_catalog)
+            except Exception as e:
+                logger.warning(f"SP-API error for {asin}: {e}")
+        return results, context.cache.take_pending_writes()
+
+    def _close_sp_api_contexts(self):
+        """SP-APIスレッドのセッションを閉じる（エラーで渡せなかったキャッシュ書き込みはここで反映）"""
+        for context in self._sp_api_contexts:
+            try:
+                context.finish()
+            except Exception as e:
+                logger.error(f"SP-API cache flush failed: {e}")
+            finally:
+                context.close()
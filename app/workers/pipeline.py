@@ -0,0 +1,364 @@
+"""
+ステージ型パイプライン（リサーチジョブの並行処理）
+
+Keepa 1次スクリーニング → SP-API → 楽天 → 利益計算・判定 → 保存 の各段が
+上限つきキューとワーカースレッドを持ち、アイテムを流れ作業で処理する。
+楽天の応答を待つ間もKeepa・SP-APIのクォータを使えるため、ジョブ全体の所要時間は
+各APIの所要時間の合計ではなく、最も遅いAPIの所要時間に近づく。
+
+- 各スレッドは自分のセッション・キャッシュ（ApiCacheStore）を持つ
+- アイテム・ジョブはセッションから切り離して（expunge）段の間で受け渡し、
+  保存段（呼び出し元スレッド）だけがメインのセッションに戻してまとめてコミットする
+- レート制限は共有トークンバケット（rate_limiter）が全スレッド・全ワーカーで守る
+
+RESEARCH_WORKER_MODE=pipeline の場合に run_research_items（process_research_chunk → run_claimed_items）から使う。
+"""
+import logging
+import math
+import queue
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models.item import ResearchItem
+from app.models.job import ResearchJob
+from app.services.api_cache import ApiCacheStore
+from app.services.calculator import ProfitCalculator
+from app.services.keepa import KeepaService, KEEPA_MAX_ASINS_PER_REQUEST
+from app.services.sp_api import SP_API_BATCH_SIZE
+from app.workers.tasks import (
+    fetch_rakuten_data,
+    fetch_sp_api_data,
+    prefetch_sp_api_batch,
+    screen_keepa_batch,
+)
+from app.workers.unit_of_work import ItemUnitOfWork
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# ワーカー数の自動設定: 1リクエストの想定所要秒数（rate × この秒数 = 同時に待つリクエスト数）
+PIPELINE_REQUEST_SECONDS = 2.0
+
+# キューの受け渡しで中断を確認する間隔（秒）
+PIPELINE_POLL_SECONDS = 0.5
+
+# 段の終了を下流に伝える目印
+_DONE = object()
+
+
+def workers_for_rate(rate: float, configured: int = 0) -> int:
+    """段のワーカー数（設定が0ならAPIのレート制限から決める）"""
+    if configured > 0:
+        return configured
+    if rate <= 0:
+        return 1
+    return max(1, math.ceil(rate * PIPELINE_REQUEST_SECONDS))
+
+
+class PipelineAborted(Exception):
+    """保存段の失敗等でパイプラインを中断した"""
+
+
+class PipelineStage:
+    """パイプラインの1段（上限つきキュー + ワーカースレッド）"""
+
+    def __init__(
+        self,
+        pipeline: "ResearchPipeline",
+        name: str,
+        workers: int,
+        handler: Callable,
+        on_finished: Callable[[], None],
+        uses_db: bool = True,
+    ):
+        """
+        Args:
+            handler: handler(context, work) 1件（またはバッチ）分の処理
+            on_finished: 全ワーカーの終了後に呼ぶ（下流へ終了を伝える）
+            uses_db: ワーカーごとにセッション・キャッシュを持つか
+        """
+        self.pipeline = pipeline
+        self.name = name
+        self.workers = workers
+        self.handler = handler
+        self.on_finished = on_finished
+        self.uses_db = uses_db
+        self.queue: queue.Queue = queue.Queue(maxsize=settings.pipeline_queue_size)
+        self._threads: list[threading.Thread] = []
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._running = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, work):
+        self.pipeline.put(self.queue, work)
+
+    def close(self):
+        """全ワーカーに終了を伝える"""
+        for _ in range(self.workers):
+            self.put(_DONE)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        db = SessionLocal() if self.uses_db else None
+        cache = ApiCacheStore(db, buffer_writes=True) if db is not None else None
+        context = StageContext(db, cache)
+        try:
+            while True:
+                work = self.pipeline.get(self.queue)
+                if work is _DONE:
+                    break
+                try:
+                    self.handler(context, work)
+                except PipelineAborted:
+                    raise
+                except Exception as e:
+                    self.pipeline.fail(work, e)
+            context.finish()
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            logger.error(f"Pipeline stage {self.name} failed: {e}")
+            self.pipeline.abort()
+        finally:
+            context.close()
+            with self._lock:
+                self._running -= 1
+                last = self._running == 0
+            if last and not self.pipeline.aborted:
+                try:
+                    self.on_finished()
+                except PipelineAborted:
+                    pass
+
+
+class StageContext:
+    """ワーカースレッドごとのセッション・キャッシュ・APIクライアント"""
+
+    def __init__(self, db: Optional[Session], cache: Optional[ApiCacheStore]):
+        self.db = db
+        self.cache = cache
+        self.keepa: Optional[KeepaService] = None
+        self.uow: Optional[ItemUnitOfWork] = None
+
+    def finish(self):
+        """ためた書き込みを反映"""
+        if self.uow is not None:
+            self.uow.commit()
+        if self.cache is not None:
+            self.cache.flush()
+            self.cache.flush_access_times()
+
+    def close(self):
+        if self.keepa is not None:
+            self.keepa.close()
+        if self.db is not None:
+            self.db.close()
+
+
+class ResearchPipeline:
+    """
+    リサーチジョブのステージ型パイプライン
+
+    段とワーカー数:
+        Keepa: 1（100件ずつのバッチ取得。トークンはKeepaの応答に追従）
+        SP-API: getListingsRestrictions（1件ごとに呼ぶ操作）のレートから自動
+        楽天: RATE_LIMIT_RAKUTEN から自動
+        利益計算・判定: 1（APIなし）
+        保存: 呼び出し元スレッド（ItemUnitOfWorkでまとめてコミット）
+    """
+
+    def __init__(self, db: Session, job: ResearchJob):
+        self.db = db
+        self.job = job
+        self._failed = 0
+        self._failed_lock = threading.Lock()
+        self._abort = threading.Event()
+        self._persist: queue.Queue = queue.Queue(maxsize=settings.pipeline_queue_size)
+
+        self.calculate = PipelineStage(
+            self, "calculate", 1, self._calculate,
+            on_finished=lambda: self.put(self._persist, _DONE),
+            uses_db=False,
+        )
+        self.rakuten = PipelineStage(
+            self, "rakuten",
+            workers_for_rate(settings.rate_limit_rakuten, settings.pipeline_rakuten_workers),
+            self._match_rakuten,
+            on_finished=self.calculate.close,
+        )
+        self.sp_api = PipelineStage(
+            self, "sp_api",
+            workers_for_rate(settings.sp_api_rate_get_listings_restrictions, settings.pipeline_sp_api_workers),
+            self._enrich_sp_api,
+            on_finished=self.rakuten.close,
+        )
+        self.keepa = PipelineStage(self, "keepa", 1, self._screen_keepa, on_finished=self.sp_api.close)
+        self.stages = [self.keepa, self.sp_api, self.rakuten, self.calculate]
+
+    @property
+    def aborted(self) -> bool:
+        return self._abort.is_set()
+
+    def abort(self):
+        self._abort.set()
+
+    def put(self, q: queue.Queue, work):
+        """上限つきキューへ投入（中断されたら諦める）"""
+        while True:
+            if self.aborted:
+                raise PipelineAborted()
+            try:
+                q.put(work, timeout=PIPELINE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, q: queue.Queue):
+        """キューから取得（中断されたら諦める）"""
+        while True:
+            if self.aborted:
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=PIPELINE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+
+    def count_failed(self, count: int):
+        with self._failed_lock:
+            self._failed += count
+
+    def fail(self, work, error: Exception):
+        """段の処理に失敗したアイテムをFAILEDにして保存段へ"""
+        items = work if isinstance(work, list) else [work]
+        self.count_failed(len(items))
+        for item in items:
+            logger.error(f"Error processing ASIN {item.asin}: {error}")
+            item.process_status = "FAILED"
+            item.fail_reason = str(error)[:500]
+            self.put(self._persist, item)
+
+    def run(self, items: list[ResearchItem]) -> int:
+        """
+        アイテムをパイプラインで処理し、保存まで完了させる
+
+        Returns:
+            処理件数（段の処理中に例外で失敗したアイテムを除く）
+        """
+        if not items:
+            return 0
+
+        # 段の間で受け渡すため、アイテム・ジョブをセッションから切り離す
+        # （先読み等のコミットで期限切れになった属性は切り離し後に読めないため、1クエリで読み直す）
+        self.db.refresh(self.job)
+        item_ids = [inspect(item).identity[0] for item in items]
+        self.db.query(ResearchItem).filter(ResearchItem.id.in_(item_ids)).populate_existing().all()
+        for item in items:
+            self.db.expunge(item)
+        self.db.expunge(self.job)
+
+        for stage in self.stages:
+            stage.start()
+
+        feeder = threading.Thread(target=self._feed, args=(items,), name="pipeline-feed", daemon=True)
+        feeder.start()
+
+        uow = ItemUnitOfWork(self.db, self.job.job_id)
+        try:
+            saved = self._save(uow)
+            uow.commit()
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            feeder.join()
+            for stage in self.stages:
+                stage.join()
+            # 続けて次のページを処理できるようジョブをセッションに戻す
+            self.db.add(self.job)
+        return saved - self._failed
+
+    def _feed(self, items: list[ResearchItem]):
+        try:
+            for start in range(0, len(items), KEEPA_MAX_ASINS_PER_REQUEST):
+                self.keepa.put(items[start:start + KEEPA_MAX_ASINS_PER_REQUEST])
+            self.keepa.close()
+        except PipelineAborted:
+            pass
+
+    def _save(self, uow: ItemUnitOfWork) -> int:
+        """
+        保存段: 切り離したアイテムをセッションに戻し、ItemUnitOfWorkでまとめてコミット
+
+        Returns:
+            保存件数
+        """
+        saved = 0
+        while True:
+            item = self.get(self._persist)
+            if item is _DONE:
+                return saved
+            self.db.add(item)
+            saved += 1
+            uow.item_done()
+
+    # ========== 各段の処理 ==========
+
+    def _screen_keepa(self, context: StageContext, chunk: list[ResearchItem]):
+        """1次スクリーニング: Keepaをまとめて取得（時系列・キャッシュはこの段で保存）"""
+        if context.keepa is None:
+            context.keepa = KeepaService(context.db, cache=context.cache)
+        passed_items, screened = screen_keepa_batch(context.keepa, chunk, self.job)
+        context.cache.flush()
+        # 通過・不合格のどちらでもないアイテムは取得・判定中の例外で失敗したもの
+        self.count_failed(len(chunk) - len(passed_items) - screened)
+
+        passed = set(id(item) for item in passed_items)
+        for item in chunk:
+            if id(item) not in passed:
+                self.put(self._persist, item)
+        for start in range(0, len(passed_items), SP_API_BATCH_SIZE):
+            self.sp_api.put(passed_items[start:start + SP_API_BATCH_SIZE])
+
+    def _enrich_sp_api(self, context: StageContext, batch: list[ResearchItem]):
+        """SP-API: オファー・手数料を20件ずつまとめて取得してから1件ずつ反映"""
+        prefetch_sp_api_batch(context.db, [item.asin for item in batch], cache=context.cache)
+        for item in batch:
+            fetch_sp_api_data(context.db, item, self.job, cache=context.cache)
+        context.cache.flush()
+
+        for item in batch:
+            self.rakuten.put(item)
+
+    def _match_rakuten(self, context: StageContext, item: ResearchItem):
+        """楽天: 検索・マッチング（候補はこの段のセッションでまとめてコミット）"""
+        if context.uow is None:
+            context.uow = ItemUnitOfWork(
+                context.db, self.job.job_id, cache=context.cache, progress_interval=math.inf
+            )
+        fetch_rakuten_data(context.db, item, self.job, cache=context.cache)
+        context.uow.item_done()
+        self.calculate.put(item)
+
+    def _calculate(self, context: StageContext, item: ResearchItem):
+        """利益計算・判定"""
+        calculator = ProfitCalculator(self.job)
+        calculator.calculate_and_evaluate(item)
+
+        item.process_status = "SUCCESS"
+        item.fetched_at = datetime.utcnow()
+        self.put(self._persist, item)
@@ -4,45 +4,239 @@ RQタスク定義
 2次確定: SP-API + 楽天
 """
 import logging
-from datetime import datetime, date
+from collections import defaultdict
+from datetime import datetime, timedelta
 from typing import Optional
 
-from redis import Redis
 from rq import Queue
+from rq.job import Dependency, Job
 
 from app.config import get_settings
-from app.database import SessionLocal
+from app.database import SessionLocal, get_redis, upsert_statement
 from app.models.job import ResearchJob
 from app.models.item import ResearchItem
-from app.models.timeseries import ResearchTimeseries
+from app.models.timeseries import ResearchTimeseries, ResearchTimeseriesPacked
+from app.models.cache import ApiCache
 from app.services.job_service import JobService
-from app.services.keepa import KeepaService
-from app.services.sp_api import SpApiService
-from app.services.rakuten import RakutenService
+from app.services.api_cache import (
+    CACHE_REFRESH_QUEUE,
+    ApiCacheStore,
+    evict_least_recently_used,
+    sweep_expired,
+)
+from app.services.keepa import (
+    KeepaService,
+    KEEPA_MAX_ASINS_PER_REQUEST,
+    keepa_minutes_to_dates,
+    keepa_parsed_cache_key,
+)
+from app.services.sp_api import SpApiService, SP_API_BATCH_SIZE, sp_api_cache_keys
+from app.services.rakuten import RakutenService, normalize_model_number, rakuten_cache_keys
 from app.services.calculator import ProfitCalculator, calculate_rakuten_cost
+from app.services.timeseries import DAILY_AGGREGATION_BY_METRIC, downsample_daily, pack_series
+from app.workers.unit_of_work import ItemUnitOfWork
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 # Redis接続
-redis_conn = Redis.from_url(settings.redis_url)
+redis_conn = get_redis()
 research_queue = Queue("research", connection=redis_conn)
+# キャッシュの再取得・掃除（researchより低優先度）
+cache_queue = Queue(CACHE_REFRESH_QUEUE, connection=redis_conn)
+
+# キャッシュ掃除ジョブの多重登録防止キー
+CACHE_SWEEPER_KEY = "apicache:sweeper"
+
+# 1次スクリーニング（Keepa）のバッチサイズ
+KEEPA_BATCH_SIZE = KEEPA_MAX_ASINS_PER_REQUEST
+
+# 時系列の保存: 1文あたりの行数（INSERT ... ON DUPLICATE KEY UPDATE）
+TIMESERIES_UPSERT_CHUNK_SIZE = 1000
+
+# 保存する時系列: (metric, 解析済みKeepaデータのキー)
+TIMESERIES_METRICS = (("PRICE", "price_history"), ("RANK", "rank_history"))
 
 
 def enqueue_research_job(job_id: str) -> str:
-    """リサーチジョブをキューに追加"""
+    """
+    リサーチジョブをキューに追加
+
+    fan_out_research_job が処理待ちアイテムをチャンクに分けて各ワーカーへ配り、
+    最後のチャンクの完了後に finalize_research_job が集計・ステータスを確定する
+    """
     job = research_queue.enqueue(
-        process_research_job,
+        fan_out_research_job,
         job_id,
-        job_timeout="1h",
+        job_timeout="10m",
         result_ttl=86400,
     )
+    schedule_cache_sweeper()
     return job.id
 
 
+def schedule_cache_sweeper() -> None:
+    """キャッシュ掃除ジョブが動いていなければ登録（以降は掃除ジョブ自身が次回を予約）"""
+    interval = settings.cache_sweep_interval_seconds
+    if redis_conn.set(CACHE_SWEEPER_KEY, 1, nx=True, ex=interval * 2):
+        cache_queue.enqueue(sweep_api_cache, job_timeout="1h", result_ttl=interval)
+
+
+def fan_out_research_job(job_id: str) -> dict:
+    """
+    リサーチジョブをチャンク（JOB_CHUNK_SIZE件）に分けてキューに追加
+
+    チャンクは処理待ちアイテムのid範囲で表し、チャンクごとに process_research_chunk を登録する。
+    全チャンクの終了（失敗を含む）後に finalize_research_job が実行される
+    """
+    db = SessionLocal()
+    try:
+        job = JobService.update_job_status(db, job_id, "RUNNING")
+        if not job:
+            return {"error": f"Job {job_id} not found"}
+
+        # 前回の実行で異常終了したワーカーが確保したままのアイテムも対象にする
+        JobService.release_expired_claims(db, job_id)
+
+        chunk_jobs = []
+        for first_id, last_id in JobService.iter_pending_id_ranges(db, job_id, settings.job_chunk_size):
+            chunk_jobs.append(research_queue.enqueue(
+                process_research_chunk,
+                job_id,
+                first_id,
+                last_id,
+                job_timeout="1h",
+                result_ttl=86400,
+            ))
+
+        chunk_job_ids = [chunk_job.id for chunk_job in chunk_jobs]
+        research_queue.enqueue(
+            finalize_research_job,
+            job_id,
+            chunk_job_ids,
+            depends_on=Dependency(jobs=chunk_job_ids, allow_failure=True) if chunk_job_ids else None,
+            job_timeout="10m",
+            result_ttl=86400,
+        )
+
+        logger.info(f"Research job {job_id}: {len(chunk_jobs)} chunks")
+        return {"job_id": job_id, "chunks": len(chunk_jobs)}
+
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        JobService.update_job_status(db, job_id, "FAILED")
+        raise
+    finally:
+        db.close()
+
+
+def process_research_chunk(job_id: str, min_id: int, max_id: int) -> dict:
+    """
+    リサーチジョブの1チャンク（id範囲内の処理待ちアイテム）を処理
+
+    ジョブのステータスは変えない（集計・完了は finalize_research_job）
+    """
+    db = SessionLocal()
+    try:
+        job = JobService.get_job(db, job_id)
+        if not job:
+            return {"error": f"Job {job_id} not found"}
+
+        processed = run_claimed_items(db, job, min_id=min_id, max_id=max_id)
+
+        logger.info(f"Completed research chunk: {job_id} [{min_id}-{max_id}], processed: {processed}")
+        return {"job_id": job_id, "processed": processed}
+    finally:
+        db.close()
+
+
+def finalize_research_job(job_id: str, chunk_job_ids: list[str]) -> dict:
+    """
+    全チャンクの終了後にジョブの集計を更新し、ステータスを確定（失敗したチャンクがあればFAILED）
+
+    失敗・タイムアウトしたチャンクが確保したままのアイテムは、期限を待たずに処理待ちに戻す
+    （タイムアウト直後は確保の期限が残っているため、期限切れの解放だけでは処理待ちに戻らない）
+    """
+    chunk_jobs = Job.fetch_many(chunk_job_ids, connection=redis_conn)
+    failed = []
+    failed_ranges = []
+    for chunk_job_id, chunk_job in zip(chunk_job_ids, chunk_jobs):
+        if chunk_job is None or chunk_job.is_failed:
+            failed.append(chunk_job_id)
+        if chunk_job is not None and chunk_job.is_failed:
+            # process_research_chunk(job_id, min_id, max_id)
+            failed_ranges.append(chunk_job.args[1:3])
+
+    db = SessionLocal()
+    try:
+        for min_id, max_id in failed_ranges:
+            released = JobService.release_claims(db, job_id, min_id, max_id)
+            if released:
+                logger.warning(f"Research job {job_id}: released {released} items claimed by failed chunk [{min_id}-{max_id}]")
+        JobService.release_expired_claims(db, job_id)
+        JobService.update_job_counts(db, job_id)
+        status = "FAILED" if failed else "DONE"
+        JobService.update_job_status(db, job_id, status)
+
+        logger.info(f"Finalized research job: {job_id}, status: {status}, failed chunks: {len(failed)}")
+        return {"job_id": job_id, "status": status, "failed_chunks": failed}
+    finally:
+        db.close()
+
+
+def run_claimed_items(
+    db: SessionLocal,
+    job: ResearchJob,
+    min_id: Optional[int] = None,
+    max_id: Optional[int] = None,
+) -> int:
+    """
+    処理待ちアイテムをJOB_PAGE_SIZE件ずつ確保（JobService.claim_pending_items）して処理
+
+    確保はワーカー間で排他のため、同じジョブ・同じid範囲を複数のワーカーで処理しても重複しない
+
+    Returns:
+        処理件数
+    """
+    processed = 0
+    while True:
+        items = JobService.claim_pending_items(db, job.job_id, min_id=min_id, max_id=max_id)
+        if not items:
+            return processed
+        processed += run_research_items(db, job, items)
+
+
+def run_research_items(db: SessionLocal, job: ResearchJob, pending_items: list[ResearchItem]) -> int:
+    """
+    アイテムをRESEARCH_WORKER_MODEの方式で処理
+
+    Returns:
+        処理件数
+    """
+    # 対象アイテムのキャッシュを先読み（以降は真のミスのみDB/APIへ）
+    # キャッシュのDB書き込みはまとめて反映
+    cache = ApiCacheStore(db, buffer_writes=True)
+    cache.prefetch(job_cache_keys(pending_items))
+
+    try:
+        if settings.research_worker_mode == "pipeline":
+            # pipelineはtasksの各処理を段として使うためここで読み込む
+            from app.workers.pipeline import ResearchPipeline
+
+            return ResearchPipeline(db, job).run(pending_items)
+        if settings.research_worker_mode == "async":
+            from app.workers.async_worker import AsyncResearchRunner
+
+            return AsyncResearchRunner(db, job, cache).run(pending_items)
+        return process_items_in_batches(db, job, pending_items, cache)
+    finally:
+        cache.flush()
+        cache.flush_access_times()
+
+
 def process_research_job(job_id: str) -> dict:
     """
-    リサーチジョブを処理
+    リサーチジョブを1つのワーカーでまとめて処理（分割前に登録されたジョブ用）
     1次スクリーニング: Keepa取得
     2次確定: SP-API + 楽天
     """
@@ -55,19 +249,9 @@ def process_research_job(job_id: str) -> dict:
 
         logger.info(f"Starting research job: {job_id}")
 
-        # 処理待ちアイテムを取得
-        pending_items = JobService.get_pending_items(db, job_id, limit=1000)
-
-        processed = 0
-        for item in pending_items:
-            try:
-                process_single_item(db, item, job)
-                processed += 1
-            except Exception as e:
-                logger.error(f"Error processing ASIN {item.asin}: {e}")
-                item.process_status = "FAILED"
-                item.fail_reason = str(e)[:500]
-                db.commit()
+        # 処理待ちアイテムをJOB_PAGE_SIZE件ずつ確保して処理
+        JobService.release_expired_claims(db, job_id)
+        processed = run_claimed_items(db, job)
 
         # 集計更新
         JobService.update_job_counts(db, job_id)
@@ -86,44 +270,191 @@ def process_research_job(job_id: str) -> dict:
         db.close()
 
 
-def process_single_item(db: SessionLocal, item: ResearchItem, job: ResearchJob) -> None:
+def process_items_in_batches(
+    db: SessionLocal,
+    job: ResearchJob,
+    pending_items: list[ResearchItem],
+    cache: ApiCacheStore,
+) -> int:
     """
-    単一ASINの処理
-    1次: Keepaでランキング/販売数を取得（スクリーニング）
-    2次: SP-API + 楽天 + 利益計算
+    Keepaバッチ（100件）ごとに1次スクリーニング → 2次確定を順に処理
+
+    Returns:
+        処理件数
     """
-    item.process_status = "PROCESSING"
-    db.commit()
+    # アイテム更新・時系列・候補・キャッシュはJOB_COMMIT_BATCH_SIZE件ごとにまとめてコミット
+    uow = ItemUnitOfWork(db, job.job_id, cache=cache)
 
+    processed = 0
+    keepa_service = KeepaService(db, cache=cache)
     try:
-        # ========== 1次スクリーニング: Keepa ==========
-        keepa_service = KeepaService(db)
-        try:
-            keepa_data = fetch_keepa_data(keepa_service, item, job)
-        finally:
-            keepa_service.close()
+        for start in range(0, len(pending_items), KEEPA_BATCH_SIZE):
+            chunk = pending_items[start:start + KEEPA_BATCH_SIZE]
+
+            # 1次スクリーニング: Keepaをまとめて取得（コミットはuowに任せる）
+            passed_items, screened = screen_keepa_batch(keepa_service, chunk, job, commit=False)
+            processed += screened
+            uow.item_done(len(chunk) - len(passed_items))
+
+            # 楽天検索キーはKeepaでJAN/型番が判明してから先読み
+            cache.prefetch(
+                key
+                for item in passed_items
+                for key in rakuten_cache_keys(item.jan_code, item.model_number)
+            )
+
+            # 2次確定: 1次通過分のみ（SP-APIは20件ずつまとめて取得）
+            for sp_start in range(0, len(passed_items), SP_API_BATCH_SIZE):
+                sp_batch = passed_items[sp_start:sp_start + SP_API_BATCH_SIZE]
+                prefetch_sp_api_batch(db, [item.asin for item in sp_batch], cache=cache)
+
+                for item in sp_batch:
+                    try:
+                        process_second_stage(db, item, job, cache=cache, commit=False)
+                        processed += 1
+                    except Exception as e:
+                        logger.error(f"Error processing ASIN {item.asin}: {e}")
+                        item.process_status = "FAILED"
+                        item.fail_reason = str(e)[:500]
+                    uow.item_done()
+
+        uow.commit()
+    finally:
+        keepa_service.close()
+    return processed
+
 
-        # Keepaデータがない場合はスキップ
-        if not keepa_data:
+def job_cache_keys(items: list[ResearchItem]) -> list[str]:
+    """ASINだけで決まるキャッシュキー（Keepa / SP-API）"""
+    keys = []
+    for item in items:
+        keys.append(keepa_parsed_cache_key(item.asin))
+        keys.extend(sp_api_cache_keys(item.asin))
+    return keys
+
+
+def screen_keepa_batch(
+    keepa_service: KeepaService,
+    items: list[ResearchItem],
+    job: ResearchJob,
+    commit: bool = True,
+) -> tuple[list[ResearchItem], int]:
+    """
+    複数ASINの1次スクリーニング
+    Keepaを最大100件ずつまとめて取得し、各itemに反映して判定する
+
+    commit=False の場合はコミットしない（ItemUnitOfWork等の呼び出し側でコミット）
+
+    Returns:
+        (2次確定に進むitemリスト, 1次で処理完了した件数)
+    """
+    db = keepa_service.db
+    for item in items:
+        item.process_status = "PROCESSING"
+    if commit:
+        db.commit()
+
+    try:
+        parsed_products = keepa_service.fetch_parsed_products([item.asin for item in items])
+    except Exception as e:
+        logger.error(f"Keepa batch error: {e}")
+        for item in items:
             item.process_status = "FAILED"
-            item.fail_reason = "Keepa data not available"
-            db.commit()
-            return
-
-        # 1次スクリーニング: ランキング・販売数チェック
-        if not pass_first_screening(item, job):
-            item.process_status = "SUCCESS"
-            item.pass_status = "FAIL"
-            item.pass_fail_reasons = ["1次スクリーニング不合格（ランキング/販売数）"]
-            item.fetched_at = datetime.utcnow()
+            item.fail_reason = str(e)[:500]
+        if commit:
             db.commit()
-            return
+        return [], 0
+
+    result = screen_keepa_parsed(keepa_service, items, job, parsed_products)
+    if commit:
+        db.commit()
+    return result
+
+
+def screen_keepa_parsed(
+    keepa_service: KeepaService,
+    items: list[ResearchItem],
+    job: ResearchJob,
+    parsed_products: dict[str, dict],
+) -> tuple[list[ResearchItem], int]:
+    """
+    取得済み（解析済み）Keepaデータで複数ASINを1次スクリーニング（コミットは呼び出し側）
+
+    Returns:
+        (2次確定に進むitemリスト, 1次で処理完了した件数)
+    """
+    passed_items = []
+    screened = 0
+    # 時系列はバッチ分をまとめて保存
+    timeseries: list[dict] = []
+    for item in items:
+        try:
+            if screen_keepa_item(item, job, parsed_products.get(item.asin), timeseries):
+                passed_items.append(item)
+            else:
+                screened += 1
+        except Exception as e:
+            logger.error(f"Error processing {item.asin}: {e}")
+            item.process_status = "FAILED"
+            item.fail_reason = str(e)[:500]
+
+    upsert_timeseries(keepa_service.db, timeseries)
+    return passed_items, screened
+
+
+def screen_keepa_item(
+    item: ResearchItem,
+    job: ResearchJob,
+    parsed: Optional[dict],
+    timeseries: list[dict],
+) -> bool:
+    """
+    取得済み（解析済み）Keepaデータで単一ASINを1次スクリーニング
+    時系列は保存せずtimeseriesに行を追加する（apply_keepa_data参照）
+
+    Returns:
+        True: 2次確定に進む
+        False: 1次で処理完了（Keepaデータなし or 不合格）
+    """
+    keepa_data = apply_keepa_data(item, job, parsed, timeseries)
+
+    # Keepaデータがない場合はスキップ
+    if not keepa_data:
+        item.process_status = "FAILED"
+        item.fail_reason = "Keepa data not available"
+        return False
+
+    # 1次スクリーニング: ランキング・販売数チェック
+    if not pass_first_screening(item, job):
+        item.process_status = "SUCCESS"
+        item.pass_status = "FAIL"
+        item.pass_fail_reasons = ["1次スクリーニング不合格（ランキング/販売数）"]
+        item.fetched_at = datetime.utcnow()
+        return False
+
+    return True
+
+
+def process_second_stage(
+    db: SessionLocal,
+    item: ResearchItem,
+    job: ResearchJob,
+    cache: Optional[ApiCacheStore] = None,
+    commit: bool = True,
+) -> None:
+    """
+    1次スクリーニング通過後の処理
+    2次: SP-API + 楽天 + 利益計算
 
+    SP-API・楽天の反映はコミットせず、完了/失敗時にまとめてコミットする
+    （commit=False の場合は呼び出し側でコミット）
+    """
+    try:
         # ========== 2次確定: SP-API ==========
-        fetch_sp_api_data(db, item, job)
+        fetch_sp_api_data(db, item, job, cache=cache)
 
         # ========== 楽天検索 ==========
-        fetch_rakuten_data(db, item, job)
+        fetch_rakuten_data(db, item, job, cache=cache)
 
         # ========== 利益計算・判定 ==========
         calculator = ProfitCalculator(job)
@@ -132,83 +463,157 @@ def process_single_item(db: SessionLocal, item: ResearchItem, job: ResearchJob)
         # 完了
         item.process_status = "SUCCESS"
         item.fetched_at = datetime.utcnow()
-        db.commit()
+        if commit:
+            db.commit()
 
     except Exception as e:
         logger.error(f"Error processing {item.asin}: {e}")
         item.process_status = "FAILED"
         item.fail_reason = str(e)[:500]
-        db.commit()
+        if commit:
+            db.commit()
         raise
 
 
-def fetch_sp_api_data(db: SessionLocal, item: ResearchItem, job: ResearchJob) -> None:
+def prefetch_sp_api_batch(
+    db: SessionLocal,
+    asins: list[str],
+    cache: Optional[ApiCacheStore] = None,
+) -> None:
     """
-    SP-APIからデータを取得してitemに反映
-    - 最安FBA価格
-    - 手数料見積もり
-    - 出品制限
+    SP-APIのオファー・手数料を最大20件ずつまとめて取得し、キャッシュに載せる
+    以降の fetch_sp_api_data はキャッシュを参照する（バッチで取れなかった分のみ単発API）
     """
-    sp_api = SpApiService(db)
+    sp_api = SpApiService(db, cache=cache)
 
     try:
-        # 1. オファー情報（最安FBA価格）
-        offers = sp_api.get_item_offers(item.asin)
-        if offers:
-            item.amazon_price_fba_lowest = offers.get('fba_lowest_price')
-            if offers.get('fba_seller_count'):
-                item.fba_seller_count = offers.get('fba_seller_count')
-            if offers.get('seller_count'):
-                item.seller_count = offers.get('seller_count')
+        offers = sp_api.get_item_offers_batch(asins)
 
-        # 2. 手数料見積もり（価格がある場合のみ）
-        if item.amazon_price_fba_lowest:
-            fees = sp_api.get_fees_estimate(item.asin, item.amazon_price_fba_lowest)
-            if fees:
-                item.amazon_fee_referral = fees.get('referral_fee')
-                item.amazon_fee_fba = fees.get('fba_fee')
-                item.amazon_fee_other = fees.get('other_fee')
-                item.amazon_fee_total = fees.get('total_fee')
-                # 入金価格計算
-                item.amazon_payout = item.amazon_price_fba_lowest - (item.amazon_fee_total or 0)
+        asin_prices = [
+            (asin, result['fba_lowest_price'])
+            for asin, result in offers.items()
+            if result.get('fba_lowest_price')
+        ]
+        if asin_prices:
+            sp_api.get_fees_estimates_batch(asin_prices)
 
-        # 3. カタログ情報（JAN/型番補完）
-        if not item.jan_code or not item.model_number:
-            catalog = sp_api.get_catalog_item(item.asin)
-            if catalog:
-                if not item.jan_code:
-                    item.jan_code = catalog.get('ean')
-                if not item.model_number:
-                    item.model_number = catalog.get('model_number') or catalog.get('part_number')
-                if not item.title:
-                    item.title = catalog.get('title')
-                if not item.brand:
-                    item.brand = catalog.get('brand')
+    except Exception as e:
+        logger.warning(f"SP-API batch error: {e}")
+        # バッチ失敗時は単発APIで取得するため続行
 
-        # 4. 出品制限
-        restrictions = sp_api.get_listing_restrictions(item.asin)
-        if restrictions:
-            if restrictions.get('has_restriction') is True:
-                item.flag_listing_restriction = True
-                item.flag_listing_restriction_status = 'AUTO'
-            elif restrictions.get('has_restriction') is False:
-                item.flag_listing_restriction = False
-                item.flag_listing_restriction_status = 'AUTO'
-            else:
-                item.flag_listing_restriction_status = 'UNKNOWN'
 
-        db.commit()
+def fetch_sp_api_data(
+    db: SessionLocal,
+    item: ResearchItem,
+    job: ResearchJob,
+    cache: Optional[ApiCacheStore] = None,
+) -> None:
+    """
+    SP-APIからデータを取得してitemに反映（コミットは呼び出し側）
+    - 最安FBA価格
+    - 手数料見積もり
+    - 出品制限
+    """
+    sp_api = SpApiService(db, cache=cache)
+
+    try:
+        data = lookup_sp_api_data(
+            sp_api,
+            item.asin,
+            item.amazon_price_fba_lowest,
+            need_catalog=not item.jan_code or not item.model_number,
+        )
+        apply_sp_api_data(item, data)
 
     except Exception as e:
         logger.warning(f"SP-API error for {item.asin}: {e}")
         # SP-APIエラーは致命的ではない（続行）
 
 
-def fetch_rakuten_data(db: SessionLocal, item: ResearchItem, job: ResearchJob) -> None:
+def lookup_sp_api_data(
+    sp_api: SpApiService,
+    asin: str,
+    price: Optional[int],
+    need_catalog: bool,
+) -> dict:
+    """
+    SP-APIからASINのデータを取得（itemには触れない）
+
+    Args:
+        price: 取得済みの最安FBA価格（オファーが取れなかった場合の手数料見積もりに使う）
+        need_catalog: カタログ情報（JAN/型番補完）を取得するか
+
+    Returns:
+        {'offers': ..., 'fees': ..., 'catalog': ..., 'restrictions': ...}（取得しなかったものはNone）
     """
-    楽天からデータを取得してitemに反映
+    # 1. オファー情報（最安FBA価格）
+    offers = sp_api.get_item_offers(asin)
+    if offers:
+        price = offers.get('fba_lowest_price')
+
+    return {
+        'offers': offers,
+        # 2. 手数料見積もり（価格がある場合のみ）
+        'fees': sp_api.get_fees_estimate(asin, price) if price else None,
+        # 3. カタログ情報（JAN/型番補完）
+        'catalog': sp_api.get_catalog_item(asin) if need_catalog else None,
+        # 4. 出品制限
+        'restrictions': sp_api.get_listing_restrictions(asin),
+    }
+
+
+def apply_sp_api_data(item: ResearchItem, data: dict) -> None:
+    """lookup_sp_api_dataの結果をitemに反映"""
+    offers = data.get('offers')
+    if offers:
+        item.amazon_price_fba_lowest = offers.get('fba_lowest_price')
+        if offers.get('fba_seller_count'):
+            item.fba_seller_count = offers.get('fba_seller_count')
+        if offers.get('seller_count'):
+            item.seller_count = offers.get('seller_count')
+
+    fees = data.get('fees')
+    if fees and item.amazon_price_fba_lowest:
+        item.amazon_fee_referral = fees.get('referral_fee')
+        item.amazon_fee_fba = fees.get('fba_fee')
+        item.amazon_fee_other = fees.get('other_fee')
+        item.amazon_fee_total = fees.get('total_fee')
+        # 入金価格計算
+        item.amazon_payout = item.amazon_price_fba_lowest - (item.amazon_fee_total or 0)
+
+    catalog = data.get('catalog')
+    if catalog:
+        if not item.jan_code:
+            item.jan_code = catalog.get('ean')
+        if not item.model_number:
+            item.model_number = catalog.get('model_number') or catalog.get('part_number')
+        if not item.title:
+            item.title = catalog.get('title')
+        if not item.brand:
+            item.brand = catalog.get('brand')
+
+    restrictions = data.get('restrictions')
+    if restrictions:
+        if restrictions.get('has_restriction') is True:
+            item.flag_listing_restriction = True
+            item.flag_listing_restriction_status = 'AUTO'
+        elif restrictions.get('has_restriction') is False:
+            item.flag_listing_restriction = False
+            item.flag_listing_restriction_status = 'AUTO'
+        else:
+            item.flag_listing_restriction_status = 'UNKNOWN'
+
+
+def fetch_rakuten_data(
+    db: SessionLocal,
+    item: ResearchItem,
+    job: ResearchJob,
+    cache: Optional[ApiCacheStore] = None,
+) -> None:
     """
-    rakuten = RakutenService(db)
+    楽天からデータを取得してitemに反映（コミットは呼び出し側）
+    """
+    rakuten = RakutenService(db, cache=cache)
 
     try:
         point_rate = float(job.point_rate_total)
@@ -220,44 +625,48 @@ def fetch_rakuten_data(db: SessionLocal, item: ResearchItem, job: ResearchJob) -
             asin=item.asin,
             point_rate=point_rate,
         )
-
-        # マッチタイプ
-        item.rakuten_match_type = result.get('match_type', 'NONE')
-
-        # 最安候補
-        chosen = result.get('chosen_item')
-        if chosen:
-            item.rakuten_item_name = chosen.get('item_name')
-            item.rakuten_shop_name = chosen.get('shop_name')
-            item.rakuten_item_url = chosen.get('item_url')
-            item.rakuten_price = chosen.get('price')
-            item.rakuten_shipping = chosen.get('shipping')
-            item.rakuten_shipping_status = chosen.get('shipping_status', 'UNKNOWN')
-            item.rakuten_point = chosen.get('point_amount')
-            item.rakuten_cost_gross = chosen.get('gross_cost')
-            item.rakuten_cost_net = chosen.get('net_cost')
-
-        db.commit()
+        apply_rakuten_result(item, result)
 
     except Exception as e:
         logger.warning(f"Rakuten error for {item.asin}: {e}")
         item.rakuten_match_type = 'UNKNOWN'
-        db.commit()
     finally:
         rakuten.close()
 
 
-def fetch_keepa_data(keepa_service: KeepaService, item: ResearchItem, job: ResearchJob) -> Optional[dict]:
+def apply_rakuten_result(item: ResearchItem, result: dict) -> None:
+    """find_matching_itemsの結果をitemに反映"""
+    # マッチタイプ
+    item.rakuten_match_type = result.get('match_type', 'NONE')
+
+    # 最安候補
+    chosen = result.get('chosen_item')
+    if chosen:
+        item.rakuten_item_name = chosen.get('item_name')
+        item.rakuten_shop_name = chosen.get('shop_name')
+        item.rakuten_item_url = chosen.get('item_url')
+        item.rakuten_price = chosen.get('price')
+        item.rakuten_shipping = chosen.get('shipping')
+        item.rakuten_shipping_status = chosen.get('shipping_status', 'UNKNOWN')
+        item.rakuten_point = chosen.get('point_amount')
+        item.rakuten_cost_gross = chosen.get('gross_cost')
+        item.rakuten_cost_net = chosen.get('net_cost')
+
+
+def apply_keepa_data(
+    item: ResearchItem,
+    job: ResearchJob,
+    parsed: Optional[dict],
+    timeseries: list[dict],
+) -> Optional[dict]:
     """
-    Keepaからデータを取得してitemに反映
+    解析済みのKeepaデータをitemに反映
+
+    時系列はtimeseriesに行を追加する（呼び出し側でまとめて保存）
     """
-    product = keepa_service.fetch_product(item.asin)
-    if not product:
+    if not parsed:
         return None
 
-    # データを解析
-    parsed = keepa_service.parse_product(product)
-
     # itemに反映
     item.title = parsed.get('title')
     item.brand = parsed.get('brand')
@@ -273,39 +682,72 @@ def fetch_keepa_data(keepa_service: KeepaService, item: ResearchItem, job: Resea
     item.seller_count = parsed.get('seller_count')
     item.fba_seller_count = parsed.get('fba_seller_count')
 
-    # 時系列データを保存
-    save_timeseries(keepa_service.db, job.job_id, item.asin, parsed)
+    # 時系列データ（保存は呼び出し側）
+    timeseries.extend(timeseries_rows(job.job_id, item.asin, parsed))
 
     return parsed
 
 
-def save_timeseries(db: SessionLocal, job_id: str, asin: str, parsed: dict):
-    """時系列データをDBに保存"""
-    # 価格推移
-    for entry in parsed.get('price_history', [])[-90:]:  # 直近90件
-        ts = ResearchTimeseries(
-            job_id=job_id,
-            asin=asin,
-            metric="PRICE",
-            recorded_date=date.fromisoformat(entry['date']),
-            value=entry['value'],
-            source="KEEPA",
-        )
-        db.merge(ts)
-
-    # ランキング推移
-    for entry in parsed.get('rank_history', [])[-90:]:
-        ts = ResearchTimeseries(
-            job_id=job_id,
-            asin=asin,
-            metric="RANK",
-            recorded_date=date.fromisoformat(entry['date']),
-            value=entry['value'],
-            source="KEEPA",
+def timeseries_rows(job_id: str, asin: str, parsed: dict) -> list[dict]:
+    """
+    解析済みKeepaデータから時系列の行を作成
+
+    メトリクスごとの集約方法（TIMESERIES_DAILY_AGG_*）で1日1点にまとめてから保存する。
+    解析済みデータは直近KEEPA_HISTORY_DAYS日分の全点（日の途中で切らない）なので、集約後も各日は全点の集約値
+    TIMESERIES_STORAGE=packed の場合はメトリクスごとに1行（research_timeseries_packed）
+    """
+    packed = settings.timeseries_storage == "packed"
+    now = datetime.utcnow()
+    rows = []
+    for metric, key in TIMESERIES_METRICS:
+        series = parsed.get(key) or {}
+        minutes, values = downsample_daily(
+            series.get('minutes', []),
+            series.get('values', []),
+            DAILY_AGGREGATION_BY_METRIC[metric],
         )
-        db.merge(ts)
+        if not minutes:
+            continue
+
+        if packed:
+            rows.append({
+                "job_id": job_id,
+                "asin": asin,
+                "metric": metric,
+                "point_count": len(minutes),
+                "data": pack_series(minutes, values),
+                "source": "KEEPA",
+                "created_at": now,
+            })
+            continue
+
+        for recorded_date, value in zip(keepa_minutes_to_dates(minutes), values):
+            rows.append({
+                "job_id": job_id,
+                "asin": asin,
+                "metric": metric,
+                "recorded_date": recorded_date,
+                "value": value,
+                "source": "KEEPA",
+                "created_at": now,
+            })
+    return rows
+
+
+def upsert_timeseries(db: SessionLocal, rows: list[dict]):
+    """
+    時系列の行をまとめて保存（コミットは呼び出し側）
 
-    db.commit()
+    uk_timeseries（job_id, asin, metric, recorded_date）が重複する行は値を上書きする（再実行しても同じ結果）。
+    TIMESERIES_STORAGE=packed の場合は uk_timeseries_packed（job_id, asin, metric）で上書き
+    """
+    if settings.timeseries_storage == "packed":
+        model, update_columns = ResearchTimeseriesPacked, ("point_count", "data", "source")
+    else:
+        model, update_columns = ResearchTimeseries, ("value", "source")
+
+    for start in range(0, len(rows), TIMESERIES_UPSERT_CHUNK_SIZE):
+        db.execute(upsert_statement(model, rows[start:start + TIMESERIES_UPSERT_CHUNK_SIZE], update_columns))
 
 
 def pass_first_screening(item: ResearchItem, job: ResearchJob) -> bool:
@@ -339,3 +781,98 @@ def pass_first_screening(item: ResearchItem, job: ResearchJob) -> bool:
         return False
 
     return True
+
+
+def refresh_stale_cache(cache_keys: list[str]) -> dict:
+    """
+    期限切れキャッシュの再取得（低優先度キュー cache_refresh）
+
+    キャッシュ行のapi_type / request_paramsから取得方法を決め、
+    各APIのバッチ取得・共有レートリミッタを通して再取得する。
+    既に他で更新済みのキーはスキップする。
+    """
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ApiCache.api_type, ApiCache.request_params)
+            .filter(
+                ApiCache.cache_key.in_(cache_keys),
+                ApiCache.expires_at <= datetime.utcnow(),
+            )
+            .all()
+        )
+        params_by_type = defaultdict(list)
+        for api_type, params in rows:
+            if params:
+                params_by_type[api_type].append(params)
+
+        cache = ApiCacheStore(db, buffer_writes=True)
+        refreshed = 0
+
+        if params_by_type["KEEPA_PARSED"] or params_by_type["KEEPA"]:
+            keepa_service = KeepaService(db, cache=cache)
+            try:
+                # 解析済みの再取得で生データも更新される
+                parsed_asins = [p["asin"] for p in params_by_type["KEEPA_PARSED"]]
+                raw_asins = [p["asin"] for p in params_by_type["KEEPA"] if p["asin"] not in parsed_asins]
+                refreshed += len(keepa_service.fetch_parsed_products(parsed_asins, use_cache=False))
+                refreshed += len(keepa_service.fetch_products(raw_asins, use_cache=False))
+            except Exception as e:
+                logger.warning(f"Keepa cache refresh error: {e}")
+            finally:
+                keepa_service.close()
+
+        sp_api = SpApiService(db, cache=cache)
+        try:
+            asins = [p["asin"] for p in params_by_type["SP_API_PRICING"]]
+            refreshed += len(sp_api.get_item_offers_batch(asins, use_cache=False))
+            asin_prices = [(p["asin"], p["price"]) for p in params_by_type["SP_API_FEES"]]
+            refreshed += len(sp_api.get_fees_estimates_batch(asin_prices, use_cache=False))
+            for p in params_by_type["SP_API_CATALOG"]:
+                refreshed += sp_api.get_catalog_item(p["asin"], use_cache=False) is not None
+            for p in params_by_type["SP_API_RESTRICTIONS"]:
+                refreshed += sp_api.get_listing_restrictions(p["asin"], use_cache=False) is not None
+        except Exception as e:
+            logger.warning(f"SP-API cache refresh error: {e}")
+
+        if params_by_type["RAKUTEN_SEARCH"]:
+            rakuten = RakutenService(db, cache=cache)
+            try:
+                for p in params_by_type["RAKUTEN_SEARCH"]:
+                    if "jan" in p:
+                        rakuten._search_by_jan(p["jan"], use_cache=False)
+                    else:
+                        rakuten._search_by_model(
+                            normalize_model_number(p["model"]), p["model"], use_cache=False
+                        )
+                    refreshed += 1
+            except Exception as e:
+                logger.warning(f"Rakuten cache refresh error: {e}")
+            finally:
+                rakuten.close()
+
+        cache.flush()
+        logger.info(f"Cache refresh: {refreshed}/{len(cache_keys)} entries refreshed")
+        return {"requested": len(cache_keys), "refreshed": refreshed}
+    finally:
+        db.close()
+
+
+def sweep_api_cache() -> dict:
+    """
+    api_cacheの定期掃除（低優先度キュー cache_refresh）
+
+    期限切れ行をチャンク単位で削除し、CACHE_MAX_ROWSを超えた分を
+    最終アクセスの古い順に削除する。終了後に次回を予約する（--with-scheduler が必要）。
+    """
+    interval = settings.cache_sweep_interval_seconds
+    db = SessionLocal()
+    try:
+        expired = sweep_expired(db)
+        evicted = evict_least_recently_used(db)
+        logger.info(f"API cache sweep: {expired} expired, {evicted} evicted")
+        return {"expired": expired, "evicted": evicted}
+    finally:
+        db.close()
+        redis_conn.set(CACHE_SWEEPER_KEY, 1, ex=interval * 2)
+        cache_queue.enqueue_in(timedelta(seconds=interval), sweep_api_cache, job_timeout="1h", result_ttl=interval)
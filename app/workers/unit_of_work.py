@@ -0,0 +1,63 @@
+"""
+リサーチジョブのDB書き込みのまとめ（unit of work）
+
+アイテム更新・時系列・楽天候補はセッションに載せたままにし、
+キャッシュはApiCacheStore(buffer_writes=True)にためておく。
+JOB_COMMIT_BATCH_SIZE件ごとにまとめて1トランザクションでコミットする。
+ジョブの集計（進捗表示）はJOB_PROGRESS_INTERVAL_SECONDSごとに反映する。
+"""
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.services.api_cache import ApiCacheStore
+from app.services.job_service import JobService
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class ItemUnitOfWork:
+    """N件ごとに1回コミットし、一定間隔でジョブの進捗を反映"""
+
+    def __init__(
+        self,
+        db: Session,
+        job_id: str,
+        cache: Optional[ApiCacheStore] = None,
+        commit_every: Optional[int] = None,
+        progress_interval: Optional[float] = None,
+    ):
+        self.db = db
+        self.job_id = job_id
+        self.cache = cache
+        self.commit_every = max(commit_every or settings.job_commit_batch_size, 1)
+        self.progress_interval = (
+            settings.job_progress_interval_seconds if progress_interval is None else progress_interval
+        )
+        self._pending = 0
+        self._last_progress = time.monotonic()
+
+    def item_done(self, count: int = 1):
+        """アイテムの処理完了を記録（commit_every件たまったらコミット）"""
+        self._pending += count
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """ためた書き込みを1トランザクションでコミット"""
+        try:
+            if self.cache is not None:
+                self.cache.flush(commit=False)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self._pending = 0
+
+        if time.monotonic() - self._last_progress >= self.progress_interval:
+            JobService.update_job_counts(self.db, self.job_id)
+            self._last_progress = time.monotonic()
@@ -0,0 +1,8 @@
+-- 物販リサーチアプリ DDL v1.1
+-- MySQL 8.0
+-- api_cache: 大きいレスポンスを圧縮してBLOBに保存
+
+ALTER TABLE api_cache
+    MODIFY COLUMN response_data JSON NULL COMMENT 'レスポンスデータ（非圧縮時）',
+    ADD COLUMN response_blob MEDIUMBLOB NULL COMMENT '圧縮レスポンスデータ（圧縮時）' AFTER response_data,
+    ADD COLUMN response_encoding VARCHAR(16) NOT NULL DEFAULT 'json' COMMENT 'json / json+zlib / json+zstd' AFTER response_blob;
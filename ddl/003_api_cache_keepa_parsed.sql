@@ -0,0 +1,6 @@
+-- 物販リサーチアプリ DDL v1.2
+-- MySQL 8.0
+-- api_cache: Keepa解析済みデータのキャッシュ種別を追加
+
+ALTER TABLE api_cache
+    MODIFY COLUMN api_type ENUM('KEEPA', 'KEEPA_PARSED', 'SP_API_FEES', 'SP_API_PRICING', 'SP_API_CATALOG', 'SP_API_RESTRICTIONS', 'RAKUTEN_PRODUCT', 'RAKUTEN_SEARCH') NOT NULL;
@@ -0,0 +1,7 @@
+-- 物販リサーチアプリ DDL v1.3
+-- MySQL 8.0
+-- api_cache: 行数上限を超えた分を最終アクセスの古い順に削除するための列
+
+ALTER TABLE api_cache
+    ADD COLUMN last_accessed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '最終アクセス日時' AFTER expires_at,
+    ADD INDEX idx_cache_last_accessed (last_accessed_at);
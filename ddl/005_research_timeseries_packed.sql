@@ -0,0 +1,20 @@
+-- 物販リサーチアプリ DDL v1.4
+-- MySQL 8.0
+-- research_timeseries_packed: 時系列をjob_id + ASIN + メトリクスごとに1行で保存（TIMESERIES_STORAGE=packed）
+
+CREATE TABLE IF NOT EXISTS research_timeseries_packed (
+    id                  BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_id              CHAR(36) NOT NULL,
+    asin                VARCHAR(20) NOT NULL,
+
+    metric              ENUM('PRICE', 'RANK', 'SELLER_COUNT', 'FBA_SELLER_COUNT') NOT NULL,
+    point_count         INT NOT NULL DEFAULT 0 COMMENT 'データ点数',
+    data                BLOB NOT NULL COMMENT '(keepa_minute, value)のint32差分列（リトルエンディアン）',
+    source              ENUM('KEEPA', 'SP_API', 'MANUAL') NOT NULL DEFAULT 'KEEPA',
+
+    created_at          DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uk_timeseries_packed (job_id, asin, metric),
+
+    CONSTRAINT fk_ts_packed_job FOREIGN KEY (job_id) REFERENCES research_job(job_id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,7 @@
+-- 物販リサーチアプリ DDL v1.5
+-- MySQL 8.0
+-- research_item: 処理待ちアイテムをid順にページ単位で読むためのインデックス
+-- （InnoDBのセカンダリインデックスは末尾に主キー(id)を含むため、job_id + process_status の等値条件で id順に読める）
+
+ALTER TABLE research_item
+    ADD INDEX idx_item_job_status (job_id, process_status);
@@ -0,0 +1,7 @@
+-- 物販リサーチアプリ DDL v1.6
+-- MySQL 8.0
+-- research_item: 複数ワーカーでの重複処理を防ぐためのアイテム確保（トークンと期限）
+
+ALTER TABLE research_item
+    ADD COLUMN claim_token CHAR(36) NULL COMMENT '確保したワーカーのトークン' AFTER fail_reason,
+    ADD COLUMN claimed_until DATETIME NULL COMMENT '確保の期限（過ぎたら処理待ちに戻す）' AFTER claim_token;
@@ -0,0 +1,243 @@
+"""
+テスト共通設定
+
+app.config は import 時に環境変数を読むため、app を import する前に
+テスト用のDB（一時ディレクトリのSQLite）・ローカルのレート制限を設定する
+"""
+import asyncio
+import os
+import tempfile
+from collections import Counter
+from types import SimpleNamespace
+
+_db_dir = tempfile.mkdtemp(prefix="research-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.sqlite')}"
+os.environ["RATE_LIMIT_BACKEND"] = "local"
+os.environ["CACHE_REDIS_ENABLED"] = "false"
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+import app.models  # noqa: E402,F401
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_busy_timeout(dbapi_conn, _record):
+    # 複数スレッドから同時に書き込むテストのため、ロック待ちで即エラーにしない
+    dbapi_conn.execute("PRAGMA busy_timeout=30000")
+
+
+@pytest.fixture
+def db():
+    """テーブルを作り直したセッション"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _sqlite_upsert(model, rows, update_columns):
+    """upsert_statement（MySQLの INSERT ... ON DUPLICATE KEY UPDATE）のSQLite版"""
+    stmt = sqlite_insert(model).values(rows)
+    return stmt.on_conflict_do_update(set_={column: stmt.excluded[column] for column in update_columns})
+
+
+@pytest.fixture
+def sqlite_upsert(monkeypatch):
+    """upsert_statement を使う処理をSQLiteで実行できるようにする"""
+    from app.services import api_cache
+    from app.workers import tasks
+
+    monkeypatch.setattr(api_cache, "upsert_statement", _sqlite_upsert)
+    monkeypatch.setattr(tasks, "upsert_statement", _sqlite_upsert)
+    return _sqlite_upsert
+
+
+# ========== 外部APIのスタブ（リサーチジョブの通し実行用） ==========
+
+def keepa_product(asin: str) -> dict:
+    """
+    ASINの番号で内容が決まるKeepaの商品
+
+    偶数: ランキング圏外（1次スクリーニング不合格） / 3の倍数: JANなし（型番で楽天検索）
+    """
+    number = int(asin[2:])
+    current = [0] * 19
+    current[3] = 999999 if number % 2 == 0 else 100
+    current[11] = 3
+    current[18] = 2
+    return {
+        "asin": asin,
+        "title": f"Product {asin}",
+        "eanList": [f"49{number:011d}"] if number % 3 else [],
+        "model": f"MD-{number}",
+        "stats": {"current": current, "salesRankDrops30": 20},
+        "csv": [None, None, None, [7000000, 5, 7001440, 6, 7002880, 7], None, None, None, None, None, None,
+                [7000000, 1500, 7002880, 1400]],
+    }
+
+
+def rakuten_item(keyword: str) -> dict:
+    return {
+        "itemCode": "shop:1",
+        "itemName": f"item {keyword}",
+        "itemUrl": "https://item.rakuten.co.jp/shop/1/",
+        "shopCode": "shop",
+        "shopName": "Shop",
+        "itemPrice": 1500,
+        "postageFlag": 0,
+    }
+
+
+def _sp_api_stub(calls: Counter):
+    def response(payload):
+        return SimpleNamespace(rate_limit=None, payload=payload)
+
+    def get_item_offers_batch(requests_):
+        calls["sp_api"] += 1
+        return response({"responses": [
+            {
+                "status": {"statusCode": 200},
+                "request": {"Asin": request["uri"].split("/")[-2]},
+                "body": {"payload": {"Offers": [
+                    {"IsFulfilledByAmazon": True, "ListingPrice": {"Amount": 3000}, "Shipping": {"Amount": 0}}
+                ]}},
+            }
+            for request in requests_
+        ]})
+
+    def get_my_fees_estimates(estimate_requests):
+        calls["sp_api"] += 1
+        return response([
+            {
+                "Status": "Success",
+                "FeesEstimateIdentifier": {"SellerInputIdentifier": request["identifier"]},
+                "FeesEstimate": {
+                    "TotalFeesEstimate": {"Amount": 600},
+                    "FeeDetailList": [{"FeeType": "ReferralFee", "FinalFee": {"Amount": 300}}],
+                },
+            }
+            for request in estimate_requests
+        ])
+
+    def get_catalog_item(asin, includedData):
+        calls["sp_api"] += 1
+        return response({"summaries": [{"itemName": asin}], "identifiers": []})
+
+    def get_listings_restrictions(**kwargs):
+        calls["sp_api"] += 1
+        return response({"restrictions": []})
+
+    def not_batched(**kwargs):
+        raise AssertionError("オファー・手数料はバッチで取得する")
+
+    return SimpleNamespace(
+        get_item_offers_batch=get_item_offers_batch,
+        get_my_fees_estimates=get_my_fees_estimates,
+        get_catalog_item=get_catalog_item,
+        get_listings_restrictions=get_listings_restrictions,
+        get_item_offers=not_batched,
+        get_my_fees_estimate_for_asin=not_batched,
+    )
+
+
+@pytest.fixture
+def research_apis(monkeypatch, sqlite_upsert):
+    """
+    Keepa・SP-API・楽天をスタブにする（同期・非同期の両クライアント）
+
+    - Keepa: ASINが「99」で終わる商品は応答に含めない（該当なし）
+    - 楽天: キーワードが「0」で終わる検索は0件
+    - レート制限では待たない・L1キャッシュは空から始める
+
+    Returns:
+        API別の呼び出し回数（Counter）
+    """
+    from app.services import api_cache, keepa, rakuten, sp_api
+
+    calls = Counter()
+
+    def get_products(self, asins, *args, **kwargs):
+        calls["keepa"] += 1
+        return [keepa_product(asin) for asin in asins if not asin.endswith("99")]
+
+    async def get_products_async(self, asins, *args, **kwargs):
+        await asyncio.sleep(0)
+        return get_products(self, asins)
+
+    def search_items(self, keyword, *args, **kwargs):
+        calls["rakuten"] += 1
+        return [] if keyword.endswith("0") else [rakuten_item(keyword)]
+
+    async def search_items_async(self, keyword, *args, **kwargs):
+        await asyncio.sleep(0)
+        return search_items(self, keyword)
+
+    sp_api_stub = _sp_api_stub(calls)
+    monkeypatch.setattr(keepa.settings, "keepa_api_key", "key")
+    monkeypatch.setattr(keepa.KeepaClient, "get_products", get_products)
+    monkeypatch.setattr(keepa.AsyncKeepaClient, "get_products", get_products_async)
+    monkeypatch.setattr(rakuten.RakutenClient, "search_items", search_items)
+    monkeypatch.setattr(rakuten.AsyncRakutenClient, "search_items", search_items_async)
+    monkeypatch.setattr(sp_api.SpApiClient, "_get_api", lambda self, api_class: sp_api_stub)
+    monkeypatch.setattr(sp_api.SpApiClient, "_wait_for_rate_limit", lambda self, operation="default": None)
+    api_cache._local_cache.clear()
+    yield calls
+    api_cache._local_cache.clear()
+
+
+# 通し実行の結果の比較で除く列（実行ごとに変わる値）
+_VOLATILE_COLUMNS = {"id", "job_id", "fetched_at", "created_at", "updated_at", "claim_token", "claimed_until"}
+
+
+def _rows(db, model, job_id: str) -> list[dict]:
+    columns = [column.key for column in model.__table__.columns if column.name not in _VOLATILE_COLUMNS]
+    rows = [
+        {column: getattr(row, column) for column in columns}
+        for row in db.query(model).filter(model.job_id == job_id)
+    ]
+    return sorted(rows, key=lambda row: [str(value) for value in row.values()])
+
+
+@pytest.fixture
+def run_research(db, research_apis, monkeypatch):
+    """
+    ASINを登録したジョブをRESEARCH_WORKER_MODEの方式で処理し、結果をまとめて返す
+
+    Returns:
+        run(mode, count) → (処理件数, {"items": [...], "timeseries": [...], "candidates": [...]})
+        各行は列名→値のdict。実行ごとに変わる列を除いてソート済み（方式間で比較できる）
+    """
+    from app.models import RakutenCandidate, ResearchItem, ResearchTimeseries
+    from app.schemas.job import JobCreate
+    from app.services.api_cache import _local_cache
+    from app.services.job_service import JobService
+    from app.workers import tasks
+
+    # SQLiteはDB単位のロックのため、段ごとのセッションが書き込むpipelineでは
+    # 未コミットの書き込みが他の段を待たせないよう1件ごとにコミットする
+    monkeypatch.setattr(tasks.settings, "job_commit_batch_size", 1)
+
+    def run(mode: str, count: int) -> tuple[int, dict]:
+        monkeypatch.setattr(tasks.settings, "research_worker_mode", mode)
+        # 方式ごとにAPIから取得する（前の実行のキャッシュを使わない）
+        _local_cache.clear()
+        db.query(app.models.ApiCache).delete()
+        db.commit()
+
+        job = JobService.create_job(db, JobCreate(asins=[f"B0{i:08d}" for i in range(count)]))
+        processed = tasks.run_claimed_items(db, job)
+
+        db.expire_all()
+        return processed, {
+            "items": _rows(db, ResearchItem, job.job_id),
+            "timeseries": _rows(db, ResearchTimeseries, job.job_id),
+            "candidates": _rows(db, RakutenCandidate, job.job_id),
+        }
+
+    return run
@@ -0,0 +1,414 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.services import api_cache
+from app.database import SessionLocal
+from app.models import ApiCache
+from app.services.api_cache import NOT_FOUND, ApiCacheStore, evict_least_recently_used, sweep_expired
+from app.workers import tasks
+
+
+def _sqlite_upsert(model, rows, update_columns):
+    stmt = sqlite_insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["cache_key"],
+        set_={column: stmt.excluded[column] for column in update_columns},
+    )
+
+
+@pytest.fixture
+def store(db, monkeypatch):
+    """L2（Redis）無効・L1は空のキャッシュ（MySQLのupsertはSQLiteの文に置き換え）"""
+    monkeypatch.setattr(api_cache, "upsert_statement", _sqlite_upsert)
+    refreshed = []
+    monkeypatch.setattr(api_cache, "enqueue_cache_refresh", refreshed.extend)
+    api_cache._local_cache.clear()
+    store = ApiCacheStore(db)
+    store.refreshed = refreshed
+    yield store
+    api_cache._local_cache.clear()
+
+
+def test_stale_local_entry_falls_through_to_fresher_tier(store):
+    store.set("key", "KEEPA", {"v": "new"})
+    # 別プロセスが持っていた古いL1（期限切れ・猶予期間内）
+    store.local.set("key", {"v": "old"}, time.time() - 60)
+
+    assert ApiCacheStore(store.db).get("key") == {"v": "new"}
+    assert store.refreshed == []
+    # 新しいデータがL1へ昇格している
+    assert store.local.get("key")[1] == {"v": "new"}
+
+
+def test_stale_entry_served_when_no_tier_is_fresher(store):
+    store.local.set("key", {"v": "old"}, time.time() - 60)
+
+    assert ApiCacheStore(store.db).get("key") == {"v": "old"}
+    assert store.refreshed == ["key"]
+
+
+def test_newest_stale_entry_wins(store):
+    store.set("key", "KEEPA", {"v": "older"}, ttl_seconds=1)
+    time.sleep(1.1)
+    store.local.set("key", {"v": "newer"}, time.time() - 0.01)
+
+    assert ApiCacheStore(store.db).get("key") == {"v": "newer"}
+    assert store.refreshed == ["key"]
+
+
+def test_coalesced_fetch_hands_off_uncommitted_value(store, monkeypatch):
+    """L2無効・L3未コミットでも、待機側は取得側の結果を読み、APIを呼ばない"""
+    monkeypatch.setattr(api_cache, "get_redis", lambda redis=fakeredis.FakeRedis(): redis)
+    fetching = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def owner():
+        db = SessionLocal()
+        owner_store = ApiCacheStore(db, buffer_writes=True)
+        # 別プロセスのワーカーに相当（L1を共有しない）
+        owner_store.local = api_cache.LruCache(100)
+
+        def fetch(keys):
+            calls.append("owner")
+            fetching.set()
+            release.wait(5)
+            for key in keys:
+                owner_store.set(key, "KEEPA", {"v": key})
+            return {key: {"v": key} for key in keys}
+
+        owner_store.fetch_coalesced(["key"], fetch)
+        db.close()
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    assert fetching.wait(5)
+
+    def waiter_fetch(keys):
+        calls.append("waiter")
+        return {}
+
+    # 待機側がロックの解放待ちに入ってから取得側を完了させる
+    threading.Timer(0.5, release.set).start()
+    waiter = ApiCacheStore(store.db)
+    result = waiter.fetch_coalesced(["key"], waiter_fetch)
+    thread.join()
+
+    assert result == {"key": {"v": "key"}}
+    assert calls == ["owner"]
+
+
+def test_flush_upserts_rows_in_cache_key_order(store, monkeypatch):
+    statements = []
+
+    def recording_upsert(model, rows, update_columns):
+        statements.append([row["cache_key"] for row in rows])
+        return _sqlite_upsert(model, rows, update_columns)
+
+    monkeypatch.setattr(api_cache, "upsert_statement", recording_upsert)
+    buffered = ApiCacheStore(store.db, buffer_writes=True)
+    for key in ("c", "a", "b"):
+        buffered.set(key, "KEEPA", {"v": key})
+    buffered.flush()
+
+    assert statements == [["a", "b", "c"]]
+
+
+def test_buffered_auto_flush_leaves_commit_to_caller(store, monkeypatch):
+    """buffer_writes時は件数上限での自動反映（書き込み・最終アクセス日時）でコミットしない"""
+    monkeypatch.setattr(api_cache.settings, "cache_write_batch_size", 2)
+    monkeypatch.setattr(api_cache, "ACCESS_FLUSH_SIZE", 2)
+    commits = []
+    event.listen(store.db, "after_commit", lambda session: commits.append(1))
+
+    buffered = ApiCacheStore(store.db, buffer_writes=True)
+    for key in ("a", "b", "c"):
+        buffered.set(key, "KEEPA", {"v": key})
+    buffered._loaded_keys.clear()
+    assert buffered.get("a") == {"v": "a"}
+    assert buffered.get("b") == {"v": "b"}
+    assert commits == []
+
+    buffered.flush()
+    assert commits == [1]
+
+
+def test_pending_writes_handed_to_another_store(store, monkeypatch):
+    """auto_flush=False のストアは書き込まず、取り出した書き込みを別のストアのセッションで反映する"""
+    monkeypatch.setattr(api_cache.settings, "cache_write_batch_size", 2)
+    monkeypatch.setattr(api_cache, "ACCESS_FLUSH_SIZE", 1)
+
+    reader = ApiCacheStore(SessionLocal(), buffer_writes=True, auto_flush=False)
+    try:
+        for key in ("a", "b", "c"):
+            reader.set(key, "SP_API", {"v": key})
+        reader._mark_accessed(["a"])
+        rows, accessed_keys = reader.take_pending_writes()
+    finally:
+        reader.db.close()
+
+    # 件数上限を超えても書き込んでいない
+    assert store.db.query(ApiCache).count() == 0
+    assert sorted(row["cache_key"] for row in rows) == ["a", "b", "c"]
+    assert set(accessed_keys) == {"a"}
+    assert reader.take_pending_writes() == ([], set())
+
+    writer = ApiCacheStore(store.db, buffer_writes=True)
+    writer.add_pending_writes(rows, accessed_keys)
+    writer.flush()
+
+    store.local.clear()
+    assert [ApiCacheStore(store.db).get(key) for key in ("a", "b", "c")] == [{"v": "a"}, {"v": "b"}, {"v": "c"}]
+
+
+def test_run_db_uses_db_executor(store):
+    """db_executorがあればセッションを使う処理はそのスレッドで実行（なければイベントループで直接実行）"""
+    def thread_name():
+        return threading.current_thread().name
+
+    async def run():
+        direct = await store.run_db(thread_name)
+        store.db_executor = executor
+        try:
+            return direct, await store.run_db(thread_name)
+        finally:
+            store.db_executor = None
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-db")
+    try:
+        direct, offloaded = asyncio.run(run())
+    finally:
+        executor.shutdown(wait=True)
+
+    assert direct == threading.current_thread().name
+    assert offloaded.startswith("async-db")
+
+
+def test_not_found_expires_on_negative_ttl(store, monkeypatch):
+    monkeypatch.setitem(api_cache.NEGATIVE_TTL_SECONDS, "KEEPA", 60)
+    store.set("found", "KEEPA", {"v": "found"})
+    store.set_not_found("missing", "KEEPA")
+
+    rows = {row.cache_key: row for row in store.db.query(ApiCache)}
+    assert rows["missing"].response_encoding == api_cache.ENCODING_NOT_FOUND
+    assert rows["missing"].expires_at - rows["missing"].fetched_at == timedelta(seconds=60)
+    assert rows["found"].expires_at - rows["found"].fetched_at == timedelta(seconds=api_cache.settings.cache_ttl_seconds)
+
+    assert ApiCacheStore(store.db).get("missing") is NOT_FOUND
+    assert store.refreshed == []
+
+
+def test_expired_not_found_is_refreshed(store, monkeypatch):
+    monkeypatch.setitem(api_cache.NEGATIVE_TTL_SECONDS, "KEEPA", 1)
+    store.set_not_found("missing", "KEEPA")
+    time.sleep(1.1)
+    store.local.clear()
+
+    # 負のTTLが過ぎたら再取得を予約する（期限切れ後の猶予期間内はNOT_FOUNDのまま返す）
+    assert ApiCacheStore(store.db).get("missing") is NOT_FOUND
+    assert store.refreshed == ["missing"]
+
+
+# ========== encode_payload / decode_payload ==========
+
+LARGE = {"products": [{"asin": f"B0{i:08d}", "title": "商品名" * 20} for i in range(50)]}
+SMALL = {"asin": "B000000001", "title": "商品名"}
+
+
+@pytest.mark.parametrize(
+    "compression, expected",
+    [
+        ("none", api_cache.ENCODING_JSON),
+        ("zlib", api_cache.ENCODING_ZLIB),
+        ("zstd", api_cache.ENCODING_ZSTD),
+    ],
+)
+def test_payload_round_trip(monkeypatch, compression, expected):
+    monkeypatch.setattr(api_cache.settings, "cache_compression", compression)
+
+    encoding, body = api_cache.encode_payload(LARGE)
+
+    assert encoding == expected
+    if expected != api_cache.ENCODING_JSON:
+        assert len(body) < len(json.dumps(LARGE, ensure_ascii=False))
+    assert api_cache.decode_payload(encoding, body) == LARGE
+
+
+def test_payload_below_threshold_stays_json(monkeypatch):
+    monkeypatch.setattr(api_cache.settings, "cache_compression", "zstd")
+    raw = json.dumps(SMALL, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    monkeypatch.setattr(api_cache.settings, "cache_compression_min_bytes", len(raw) + 1)
+
+    assert api_cache.encode_payload(SMALL) == (api_cache.ENCODING_JSON, raw)
+
+    monkeypatch.setattr(api_cache.settings, "cache_compression_min_bytes", len(raw))
+    assert api_cache.encode_payload(SMALL)[0] == api_cache.ENCODING_ZSTD
+
+
+def test_payload_falls_back_to_zlib_without_zstandard(monkeypatch):
+    monkeypatch.setattr(api_cache.settings, "cache_compression", "zstd")
+    monkeypatch.setattr(api_cache, "ZSTD_AVAILABLE", False)
+
+    encoding, body = api_cache.encode_payload(LARGE)
+
+    assert encoding == api_cache.ENCODING_ZLIB
+    assert api_cache.decode_payload(encoding, body) == LARGE
+
+
+def test_payload_not_found_round_trip():
+    assert api_cache.encode_payload(NOT_FOUND) == (api_cache.ENCODING_NOT_FOUND, b"")
+    assert api_cache.decode_payload(api_cache.ENCODING_NOT_FOUND, b"") is NOT_FOUND
+
+
+def test_compressed_entry_round_trips_through_l3(store, monkeypatch):
+    monkeypatch.setattr(api_cache.settings, "cache_compression", "zlib")
+    store.set("large", "KEEPA", LARGE)
+    store.set("small", "KEEPA", SMALL)
+
+    rows = {row.cache_key: row for row in store.db.query(ApiCache)}
+    # 大きいデータはBLOB列に圧縮、小さいデータはJSON列のまま
+    assert rows["large"].response_encoding == api_cache.ENCODING_ZLIB
+    assert rows["large"].response_data is None and rows["large"].response_blob
+    assert rows["small"].response_encoding == api_cache.ENCODING_JSON
+    assert rows["small"].response_data == SMALL and rows["small"].response_blob is None
+
+    store.local.clear()
+    reader = ApiCacheStore(store.db)
+    assert reader.get("large") == LARGE
+    assert reader.get("small") == SMALL
+
+
+# ========== sweep_expired / evict_least_recently_used ==========
+
+def _add_cache_rows(db, *rows):
+    """(cache_key, expires_at, last_accessed_at) の行を追加"""
+    for cache_key, expires_at, last_accessed_at in rows:
+        db.add(ApiCache(
+            cache_key=cache_key,
+            api_type="KEEPA",
+            response_data={"key": cache_key},
+            expires_at=expires_at,
+            last_accessed_at=last_accessed_at,
+        ))
+    db.commit()
+
+
+def _cache_keys(db) -> list[str]:
+    db.expire_all()
+    return sorted(row.cache_key for row in db.query(ApiCache.cache_key))
+
+
+def test_sweep_expired_deletes_only_expired_rows_in_chunks(db, monkeypatch):
+    monkeypatch.setattr(api_cache, "STALE_GRACE_SECONDS", 600)
+    now = datetime.utcnow()
+    _add_cache_rows(
+        db,
+        *[(f"expired-{i}", now - timedelta(seconds=601 + i), now) for i in range(5)],
+        # 猶予期間内（staleとして返せる）の行と有効な行は残す
+        ("stale", now - timedelta(seconds=300), now),
+        ("fresh", now + timedelta(hours=1), now),
+    )
+    commits = []
+    event.listen(db, "after_commit", commits.append)
+
+    assert sweep_expired(db, chunk_size=2) == 5
+
+    assert _cache_keys(db) == ["fresh", "stale"]
+    # 2件・2件・1件の3回に分けてコミット
+    assert len(commits) == 3
+
+
+def test_evict_least_recently_used_down_to_max_rows(db):
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=1)
+    _add_cache_rows(db, *[(f"key-{i}", expires_at, now - timedelta(minutes=i)) for i in range(6)])
+
+    assert evict_least_recently_used(db, max_rows=2, chunk_size=3) == 4
+
+    # 最終アクセスの新しい2件が残る
+    assert _cache_keys(db) == ["key-0", "key-1"]
+    assert evict_least_recently_used(db, max_rows=2) == 0
+    # 0は上限なし
+    assert evict_least_recently_used(db, max_rows=0) == 0
+    assert _cache_keys(db) == ["key-0", "key-1"]
+
+
+# ========== sweep_api_cache ==========
+
+class FakeCacheQueue:
+    """enqueue / enqueue_in した内容を記録するRQキュー"""
+
+    def __init__(self):
+        self.enqueued = []
+
+    def enqueue(self, func, **kwargs):
+        self.enqueued.append(SimpleNamespace(func=func, delay=None, kwargs=kwargs))
+
+    def enqueue_in(self, delay, func, **kwargs):
+        self.enqueued.append(SimpleNamespace(func=func, delay=delay, kwargs=kwargs))
+
+
+@pytest.fixture
+def cache_queue(monkeypatch):
+    queue = FakeCacheQueue()
+    monkeypatch.setattr(tasks, "cache_queue", queue)
+    monkeypatch.setattr(tasks, "redis_conn", fakeredis.FakeRedis())
+    monkeypatch.setattr(tasks.settings, "cache_sweep_interval_seconds", 60)
+    return queue
+
+
+def test_schedule_cache_sweeper_enqueues_once(cache_queue):
+    tasks.schedule_cache_sweeper()
+    tasks.schedule_cache_sweeper()
+
+    [job] = cache_queue.enqueued
+    assert job.func is tasks.sweep_api_cache
+    assert job.delay is None
+    assert tasks.redis_conn.ttl(tasks.CACHE_SWEEPER_KEY) == 120
+
+
+def test_sweep_api_cache_reschedules_itself(db, cache_queue, monkeypatch):
+    monkeypatch.setattr(api_cache, "STALE_GRACE_SECONDS", 0)
+    monkeypatch.setattr(api_cache.settings, "cache_max_rows", 1)
+    now = datetime.utcnow()
+    _add_cache_rows(
+        db,
+        ("expired", now - timedelta(seconds=1), now),
+        ("old", now + timedelta(hours=1), now - timedelta(minutes=1)),
+        ("new", now + timedelta(hours=1), now),
+    )
+
+    assert tasks.sweep_api_cache() == {"expired": 1, "evicted": 1}
+
+    assert _cache_keys(db) == ["new"]
+    [job] = cache_queue.enqueued
+    assert job.func is tasks.sweep_api_cache
+    assert job.delay == timedelta(seconds=60)
+    # 次回の実行まで schedule_cache_sweeper からの多重登録を防ぐ
+    assert tasks.redis_conn.get(tasks.CACHE_SWEEPER_KEY) == b"1"
+    tasks.schedule_cache_sweeper()
+    assert len(cache_queue.enqueued) == 1
+
+
+def test_sweep_api_cache_reschedules_after_error(cache_queue, monkeypatch):
+    def fail(db):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(tasks, "sweep_expired", fail)
+
+    with pytest.raises(RuntimeError):
+        tasks.sweep_api_cache()
+
+    [job] = cache_queue.enqueued
+    assert job.func is tasks.sweep_api_cache
+    assert job.delay == timedelta(seconds=60)
@@ -0,0 +1,58 @@
+import threading
+
+from sqlalchemy import event
+
+from app.schemas.job import JobCreate
+from app.services.api_cache import ApiCacheStore
+from app.services.job_service import JobService
+from app.workers.async_worker import AsyncResearchRunner
+
+# Keepaは100件ずつのため2バッチ。B000000099はKeepaに該当なし
+ITEM_COUNT = 105
+
+
+def test_async_matches_batch(run_research):
+    processed, result = run_research("async", ITEM_COUNT)
+
+    assert processed == ITEM_COUNT
+    assert len(result["timeseries"]) > 0
+    assert len(result["candidates"]) > 0
+    assert run_research("batch", ITEM_COUNT) == (processed, result)
+
+
+def test_async_runs_session_work_on_one_db_thread(db, research_apis, caplog):
+    job = JobService.create_job(db, JobCreate(asins=[f"B0{i:08d}" for i in range(ITEM_COUNT)]))
+    items = JobService.claim_pending_items(db, job.job_id)
+    cache = ApiCacheStore(db, buffer_writes=True)
+    runner = AsyncResearchRunner(db, job, cache)
+
+    threads = []
+    expire_on_commit = []
+
+    def record_thread(*args):
+        threads.append(threading.current_thread().name)
+
+    def record_commit(session):
+        record_thread()
+        expire_on_commit.append(session.expire_on_commit)
+
+    event.listen(db, "do_orm_execute", record_thread)
+    event.listen(db, "before_flush", record_thread)
+    event.listen(db, "after_commit", record_commit)
+    try:
+        assert runner.run(items) == ITEM_COUNT
+    finally:
+        event.remove(db, "do_orm_execute", record_thread)
+        event.remove(db, "before_flush", record_thread)
+        event.remove(db, "after_commit", record_commit)
+
+    # ジョブのセッションはイベントループのスレッドでは使わず、1本のDBスレッドだけで使う
+    assert len(set(threads)) == 1
+    assert threads[0].startswith("async-db")
+    # 実行中はコミットでアイテムを期限切れにせず、終了後は元の設定に戻す
+    assert expire_on_commit and not any(expire_on_commit)
+    assert db.expire_on_commit
+    assert cache.db_executor is None
+    # SP-APIスレッドはジョブのトランザクションのロックを待たない（キャッシュの書き込みはDBスレッドへ渡す）
+    assert research_apis["sp_api"] > 0
+    assert "SP-API batch error" not in caplog.text
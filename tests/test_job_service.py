@@ -0,0 +1,153 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.item import ResearchItem
+from app.schemas.job import JobCreate
+from app.services.job_service import JobService
+from app.workers import tasks
+
+
+@pytest.fixture
+def job(db):
+    return JobService.create_job(db, JobCreate(asins=[f"B00000000{i}" for i in range(6)]))
+
+
+def _statuses(db, job) -> list[str]:
+    db.expire_all()
+    items = db.query(ResearchItem).filter(ResearchItem.job_id == job.job_id).order_by(ResearchItem.id)
+    return [item.process_status for item in items]
+
+
+# ========== claim_pending_items ==========
+
+def test_claim_pending_items_in_id_order(db, job):
+    first = JobService.claim_pending_items(db, job.job_id, limit=4)
+    second = JobService.claim_pending_items(db, job.job_id, limit=4)
+
+    assert [item.asin for item in first] == [f"B00000000{i}" for i in range(4)]
+    assert [item.asin for item in second] == ["B000000004", "B000000005"]
+    # 確保済みのアイテムは再度確保されない
+    assert JobService.claim_pending_items(db, job.job_id) == []
+
+    assert {item.process_status for item in first + second} == {"PROCESSING"}
+    assert len({item.claim_token for item in first}) == 1
+    assert first[0].claim_token != second[0].claim_token
+    assert all(item.claimed_until > datetime.utcnow() for item in first)
+
+
+def test_claim_pending_items_within_id_range(db, job):
+    ids = [item.id for item in db.query(ResearchItem.id).order_by(ResearchItem.id)]
+
+    items = JobService.claim_pending_items(db, job.job_id, min_id=ids[2], max_id=ids[3])
+
+    assert [item.id for item in items] == ids[2:4]
+    assert _statuses(db, job) == ["PENDING", "PENDING", "PROCESSING", "PROCESSING", "PENDING", "PENDING"]
+
+
+# ========== release_expired_claims / release_claims ==========
+
+def test_release_expired_claims_only_releases_expired(db, job):
+    JobService.claim_pending_items(db, job.job_id, limit=2, lease_seconds=-1)
+    JobService.claim_pending_items(db, job.job_id, limit=2)
+
+    assert JobService.release_expired_claims(db, job.job_id) == 2
+    assert _statuses(db, job) == ["PENDING", "PENDING", "PROCESSING", "PROCESSING", "PENDING", "PENDING"]
+
+    # 戻したアイテムは再度確保できる
+    reclaimed = JobService.claim_pending_items(db, job.job_id, limit=2)
+    assert [item.asin for item in reclaimed] == ["B000000000", "B000000001"]
+
+
+def test_release_claims_ignores_lease(db, job):
+    items = JobService.claim_pending_items(db, job.job_id)
+    # 処理済みのアイテムは戻さない
+    items[0].process_status = "SUCCESS"
+    db.commit()
+
+    assert JobService.release_claims(db, job.job_id, items[0].id, items[3].id) == 3
+    assert _statuses(db, job) == ["SUCCESS", "PENDING", "PENDING", "PENDING", "PROCESSING", "PROCESSING"]
+
+    db.expire_all()
+    assert all(item.claim_token is None and item.claimed_until is None for item in items[1:4])
+
+
+# ========== finalize_research_job ==========
+
+def test_finalize_releases_claims_of_failed_chunks(db, job, monkeypatch):
+    ids = [item.id for item in db.query(ResearchItem.id).order_by(ResearchItem.id)]
+    # 2チャンクとも確保の期限内のまま終了（1つ目は成功、2つ目はタイムアウト）
+    JobService.claim_pending_items(db, job.job_id, lease_seconds=3600)
+    chunk_jobs = {
+        "ok": SimpleNamespace(is_failed=False, args=(job.job_id, ids[0], ids[2])),
+        "timeout": SimpleNamespace(is_failed=True, args=(job.job_id, ids[3], ids[5])),
+    }
+    monkeypatch.setattr(
+        tasks.Job, "fetch_many", lambda job_ids, connection: [chunk_jobs.get(job_id) for job_id in job_ids]
+    )
+
+    result = tasks.finalize_research_job(job.job_id, ["ok", "timeout", "expired"])
+
+    assert result["status"] == "FAILED"
+    assert result["failed_chunks"] == ["timeout", "expired"]
+    # 成功したチャンクの範囲は期限内の確保をそのまま残す
+    assert _statuses(db, job) == ["PROCESSING"] * 3 + ["PENDING"] * 3
+
+
+# ========== fan_out_research_job ==========
+
+class FakeQueue:
+    """enqueueした内容を記録するRQキュー"""
+
+    def __init__(self):
+        self.enqueued = []
+
+    def enqueue(self, func, *args, **kwargs):
+        job = SimpleNamespace(id=f"rq-{len(self.enqueued)}", func=func, args=args, kwargs=kwargs)
+        self.enqueued.append(job)
+        return job
+
+
+@pytest.fixture
+def research_queue(monkeypatch):
+    queue = FakeQueue()
+    monkeypatch.setattr(tasks, "research_queue", queue)
+    return queue
+
+
+def test_fan_out_enqueues_chunks_and_finalizer(db, job, research_queue, monkeypatch):
+    monkeypatch.setattr(tasks.settings, "job_chunk_size", 4)
+    ids = [item.id for item in db.query(ResearchItem.id).order_by(ResearchItem.id)]
+    # 前回の実行で期限切れになった確保も処理待ちに戻してから分割する
+    JobService.claim_pending_items(db, job.job_id, limit=1, lease_seconds=-1)
+
+    assert tasks.fan_out_research_job(job.job_id) == {"job_id": job.job_id, "chunks": 2}
+
+    *chunks, finalizer = research_queue.enqueued
+    assert [(chunk.func, chunk.args) for chunk in chunks] == [
+        (tasks.process_research_chunk, (job.job_id, ids[0], ids[3])),
+        (tasks.process_research_chunk, (job.job_id, ids[4], ids[5])),
+    ]
+    assert finalizer.func is tasks.finalize_research_job
+    assert finalizer.args == (job.job_id, ["rq-0", "rq-1"])
+    # 失敗したチャンクがあっても全チャンクの終了後に実行する
+    dependency = finalizer.kwargs["depends_on"]
+    assert dependency.dependencies == ["rq-0", "rq-1"]
+    assert dependency.allow_failure
+
+    assert _statuses(db, job) == ["PENDING"] * 6
+    assert JobService.get_job(db, job.job_id).status == "RUNNING"
+
+
+def test_fan_out_without_pending_items_enqueues_only_finalizer(db, job, research_queue):
+    for item in db.query(ResearchItem):
+        item.process_status = "SUCCESS"
+    db.commit()
+
+    assert tasks.fan_out_research_job(job.job_id) == {"job_id": job.job_id, "chunks": 0}
+
+    [finalizer] = research_queue.enqueued
+    assert finalizer.func is tasks.finalize_research_job
+    assert finalizer.args == (job.job_id, [])
+    assert finalizer.kwargs["depends_on"] is None
@@ -0,0 +1,214 @@
+import asyncio
+import random
+
+import pytest
+
+from app.services import api_cache
+from app.services.api_cache import NOT_FOUND
+from app.services.keepa import (
+    KEEPA_MAX_ASINS_PER_REQUEST,
+    AsyncKeepaClient,
+    MINUTES_PER_DAY,
+    KeepaClient,
+    KeepaService,
+    KeepaTokenScheduler,
+    get_keepa_scheduler,
+    keepa_cache_key,
+)
+
+
+def _scheduler(tokens_left=10, refill_rate=5, refill_in_ms=30000) -> KeepaTokenScheduler:
+    scheduler = KeepaTokenScheduler()
+    scheduler.update({"tokensLeft": tokens_left, "refillRate": refill_rate, "refillIn": refill_in_ms})
+    return scheduler
+
+
+# ========== KeepaTokenScheduler ==========
+
+def test_scheduler_unknown_until_first_response():
+    scheduler = KeepaTokenScheduler()
+    assert not scheduler.is_known
+    assert scheduler.estimate_tokens() is None
+    assert scheduler.seconds_until(100) == 0.0
+    assert scheduler.max_batch_size() == KEEPA_MAX_ASINS_PER_REQUEST
+
+
+def test_scheduler_ignores_response_without_tokens():
+    scheduler = KeepaTokenScheduler()
+    scheduler.update({"products": []})
+    assert not scheduler.is_known
+
+
+def test_scheduler_estimates_refills():
+    scheduler = _scheduler(tokens_left=10, refill_rate=5, refill_in_ms=30000)
+    observed = scheduler.observed_at
+
+    assert scheduler.estimate_tokens(observed + 1) == 10
+    # 30秒後に1回目、以降60秒ごとに補充
+    assert scheduler.estimate_tokens(observed + 30) == 15
+    assert scheduler.estimate_tokens(observed + 89) == 15
+    assert scheduler.estimate_tokens(observed + 90) == 20
+
+
+def test_scheduler_caps_tokens_at_one_hour_of_refills():
+    scheduler = _scheduler(tokens_left=290, refill_rate=5)
+    # 上限は refillRate × 60
+    assert scheduler.estimate_tokens(scheduler.observed_at + 3600) == 300
+
+
+def test_scheduler_seconds_until_enough_tokens():
+    scheduler = _scheduler(tokens_left=10, refill_rate=5, refill_in_ms=30000)
+    observed = scheduler.observed_at
+
+    assert scheduler.seconds_until(10, observed + 1) == 0.0
+    # 15まで: 1回目の補充（30秒後）
+    assert scheduler.seconds_until(15, observed + 1) == 29.0
+    # 20まで: 2回目の補充（90秒後）
+    assert scheduler.seconds_until(20, observed + 1) == 89.0
+    # 1回目の補充後は次の補充までの残り
+    assert scheduler.seconds_until(20, observed + 40) == 50.0
+
+
+def test_scheduler_cost_above_capacity_waits_for_full_bucket():
+    scheduler = _scheduler(tokens_left=0, refill_rate=1, refill_in_ms=0)
+    # 上限60トークンを超えるコストは満タン（60回の補充）になれば実行できる
+    assert scheduler.seconds_until(100, scheduler.observed_at) == scheduler.seconds_until(60, scheduler.observed_at)
+
+
+def test_scheduler_without_refill_waits_one_interval():
+    scheduler = _scheduler(tokens_left=0, refill_rate=0)
+    assert scheduler.seconds_until(1) == KeepaTokenScheduler.REFILL_INTERVAL
+
+
+def test_scheduler_reserve_deducts_tokens():
+    scheduler = _scheduler(tokens_left=10, refill_rate=5, refill_in_ms=60000)
+
+    assert scheduler._reserve(6) == 0.0
+    assert scheduler.tokens_left == 4
+    # 残り4では6トークンを予約できない
+    assert scheduler._reserve(6) > 0
+    assert scheduler.tokens_left == 4
+
+
+def test_scheduler_max_batch_size():
+    assert _scheduler(tokens_left=30).max_batch_size() == 30
+    assert _scheduler(tokens_left=500, refill_rate=20).max_batch_size() == KEEPA_MAX_ASINS_PER_REQUEST
+    # 残量がなければ補充1回分
+    assert _scheduler(tokens_left=0, refill_rate=5, refill_in_ms=60000).max_batch_size() == 5
+
+
+def test_scheduler_shared_between_clients():
+    first = KeepaClient(api_key="key")
+    second = KeepaClient(api_key="key")
+    try:
+        assert first.scheduler is second.scheduler is get_keepa_scheduler()
+    finally:
+        first.close()
+        second.close()
+
+
+# ========== AsyncKeepaClient.close / aclose ==========
+
+def test_async_client_close_outside_event_loop():
+    client = AsyncKeepaClient(api_key="key")
+    client.close()
+    assert client._client.is_closed
+
+
+def test_async_client_aclose_inside_event_loop():
+    async def run():
+        client = AsyncKeepaClient(api_key="key")
+        # ループ内の同期closeはawaitされないコルーチンを作らずにエラー
+        with pytest.raises(RuntimeError):
+            client.close()
+        await client.aclose()
+        return client
+
+    assert asyncio.run(run())._client.is_closed
+
+
+# ========== KeepaService._parse_pairs ==========
+
+def _parse_pairs_reference(data: list) -> tuple[list, list]:
+    """1点ずつ解析する素朴な実装（NumPy版の比較用）"""
+    minutes = []
+    values = []
+    for i in range(0, len(data) - 1, 2):
+        keepa_time, value = data[i], data[i + 1]
+        if keepa_time is None or value is None or value == -1:
+            continue
+        minutes.append(keepa_time)
+        values.append(value)
+    return minutes, values
+
+
+@pytest.fixture
+def service(db):
+    service = KeepaService(db)
+    yield service
+    service.close()
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [],
+        [7000000, 1980],
+        [7000000, 1980, 7000060, -1, 7000120, 1500],
+        [7000000, -1, 7000060, -1],
+        # 奇数長（末尾の時刻のみ）
+        [7000000, 1980, 7000060],
+        # None混在
+        [7000000, None, 7000060, 1500, None, 1600, 7000180, 1700],
+    ],
+)
+def test_parse_pairs_matches_reference(service, data):
+    assert service._parse_pairs(data) == _parse_pairs_reference(data)
+
+
+def test_parse_pairs_matches_reference_random(service):
+    rng = random.Random(0)
+    for _ in range(50):
+        data = []
+        minute = 7000000
+        for _ in range(rng.randrange(0, 200)):
+            minute += rng.randrange(1, 600)
+            data.extend((minute, rng.choice([-1, rng.randrange(0, 100000)])))
+        assert service._parse_pairs(data) == _parse_pairs_reference(data)
+
+
+def test_parse_time_series_keeps_whole_days(service):
+    # 6時間ごとの点を200日分（1日4点、値なしを含む）
+    data = []
+    for i in range(800):
+        data.extend((7000000 + i * 360, -1 if i % 7 == 0 else i))
+
+    parsed = service._parse_time_series(data, days=90)
+    expected_minutes, expected_values = _parse_pairs_reference(data)
+    first_day = expected_minutes[-1] // MINUTES_PER_DAY - 89
+    start = next(i for i, minute in enumerate(expected_minutes) if minute // MINUTES_PER_DAY >= first_day)
+
+    assert parsed == {"minutes": expected_minutes[start:], "values": expected_values[start:]}
+    assert len({minute // MINUTES_PER_DAY for minute in parsed["minutes"]}) == 90
+
+
+# ========== ネガティブキャッシュ ==========
+
+def test_asin_missing_from_response_is_negative_cached(db, research_apis):
+    # 「99」で終わるASINはKeepaの応答に含まれない（research_apisのスタブ）
+    first = KeepaService(db)
+    try:
+        assert set(first.fetch_products(["B000000001", "B000000099"])) == {"B000000001"}
+    finally:
+        first.close()
+    # 再問い合わせはL3（api_cache）のNOT_FOUNDを読む
+    api_cache._local_cache.clear()
+
+    second = KeepaService(db)
+    try:
+        assert second.cache.get(keepa_cache_key("B000000099")) is NOT_FOUND
+        assert second.fetch_products(["B000000099"]) == {}
+        assert second.fetch_product("B000000099") is None
+    finally:
+        second.close()
+    assert research_apis["keepa"] == 1
@@ -0,0 +1,105 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from app.models import ResearchItem
+from app.schemas.job import JobCreate
+from app.services.job_service import JobService
+from app.workers import pipeline
+from app.workers.pipeline import ResearchPipeline, workers_for_rate
+
+
+# ========== workers_for_rate ==========
+
+@pytest.mark.parametrize(
+    "rate, expected",
+    [
+        # 1リクエスト2秒なら、毎秒1件には2ワーカー
+        (1.0, 2),
+        (5.0, 10),
+        # 端数は切り上げ
+        (0.75, 2),
+        # 遅いレートでも最低1
+        (0.1, 1),
+        # レート制限なし
+        (0, 1),
+        (-1, 1),
+    ],
+)
+def test_workers_for_rate(monkeypatch, rate, expected):
+    monkeypatch.setattr(pipeline, "PIPELINE_REQUEST_SECONDS", 2.0)
+    assert workers_for_rate(rate) == expected
+
+
+def test_workers_for_rate_prefers_configured():
+    assert workers_for_rate(5.0, configured=3) == 3
+    assert workers_for_rate(0, configured=4) == 4
+    # 0以下は未設定扱い
+    assert workers_for_rate(5.0, configured=0) == 10
+
+
+# ========== ResearchPipeline（スタブのAPIで通し実行） ==========
+
+# Keepaは100件ずつのため2バッチ。B000000099はKeepaに該当なし
+ITEM_COUNT = 105
+
+
+def test_pipeline_matches_batch(run_research):
+    processed, result = run_research("pipeline", ITEM_COUNT)
+
+    assert processed == ITEM_COUNT
+    items = {item["asin"]: item for item in result["items"]}
+    assert Counter(item["process_status"] for item in items.values()) == {"SUCCESS": ITEM_COUNT - 1, "FAILED": 1}
+    assert items["B000000099"]["fail_reason"] == "Keepa data not available"
+    # 偶数は1次スクリーニングで不合格、奇数は2次確定（SP-API・楽天・利益計算）まで進む
+    assert items["B000000002"]["pass_fail_reasons"] == ["1次スクリーニング不合格（ランキング/販売数）"]
+    second_stage = [item for asin, item in items.items() if int(asin[2:]) % 2 and asin != "B000000099"]
+    assert all(item["amazon_price_fba_lowest"] == 3000 and item["rakuten_match_type"] for item in second_stage)
+    assert {row["asin"] for row in result["timeseries"]} == set(items) - {"B000000099"}
+    assert sorted(row["asin"] for row in result["candidates"]) == sorted(item["asin"] for item in second_stage)
+
+    # 段の間の受け渡し（切り離し・保存段での戻し）を経ても、1スレッドで処理した結果と同じ
+    assert run_research("batch", ITEM_COUNT) == (processed, result)
+
+
+def test_pipeline_stage_error_fails_only_that_item(run_research, monkeypatch):
+    fetch_rakuten_data = pipeline.fetch_rakuten_data
+
+    def failing_fetch_rakuten_data(db, item, job, cache=None):
+        if item.asin == "B000000003":
+            raise RuntimeError("rakuten stage error")
+        fetch_rakuten_data(db, item, job, cache=cache)
+
+    monkeypatch.setattr(pipeline, "fetch_rakuten_data", failing_fetch_rakuten_data)
+
+    processed, result = run_research("pipeline", ITEM_COUNT)
+
+    # 段の処理中に例外で失敗したアイテムは処理件数に含めない
+    assert processed == ITEM_COUNT - 1
+    items = {item["asin"]: item for item in result["items"]}
+    assert items["B000000003"]["process_status"] == "FAILED"
+    assert items["B000000003"]["fail_reason"] == "rakuten stage error"
+    assert items["B000000005"]["process_status"] == "SUCCESS"
+    assert Counter(item["process_status"] for item in items.values()) == {"SUCCESS": ITEM_COUNT - 2, "FAILED": 2}
+
+
+def test_pipeline_aborts_when_save_fails(db, research_apis, monkeypatch):
+    monkeypatch.setattr(pipeline.settings, "job_commit_batch_size", 1)
+    job = JobService.create_job(db, JobCreate(asins=[f"B0{i:08d}" for i in range(ITEM_COUNT)]))
+    items = JobService.claim_pending_items(db, job.job_id)
+
+    def failing_save(self, uow):
+        self.get(self._persist)
+        raise RuntimeError("save failed")
+
+    monkeypatch.setattr(ResearchPipeline, "_save", failing_save)
+
+    with pytest.raises(RuntimeError, match="save failed"):
+        ResearchPipeline(db, job).run(items)
+
+    # 全段のスレッドが中断して終了し、ジョブはセッションに戻っている
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("pipeline-")]
+    assert job in db
+    db.expire_all()
+    assert "SUCCESS" not in {item.process_status for item in db.query(ResearchItem)}
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from app.models import ApiCache
+from app.services import api_cache
+from app.services.api_cache import ENCODING_NOT_FOUND
+from app.services.rakuten import AsyncRakutenClient, RakutenService
+
+
+# ========== AsyncRakutenClient.close / aclose ==========
+
+def test_async_client_close_outside_event_loop():
+    client = AsyncRakutenClient(app_id="app")
+    client.close()
+    assert client._client.is_closed
+
+
+def test_async_client_aclose_inside_event_loop():
+    async def run():
+        client = AsyncRakutenClient(app_id="app")
+        with pytest.raises(RuntimeError):
+            client.close()
+        await client.aclose()
+        return client
+
+    assert asyncio.run(run())._client.is_closed
+
+
+# ========== ネガティブキャッシュ ==========
+
+def test_empty_search_result_is_negative_cached(db, research_apis):
+    # 「0」で終わるキーワードの検索は0件（research_apisのスタブ）
+    jan_code = "4900000000010"
+    for _ in range(2):
+        service = RakutenService(db)
+        try:
+            assert service._search_by_jan(jan_code) == []
+        finally:
+            service.close()
+        # 2回目はL3（api_cache）のNOT_FOUNDを読む
+        api_cache._local_cache.clear()
+
+    assert research_apis["rakuten"] == 1
+    row = db.query(ApiCache).filter(ApiCache.cache_key == f"rakuten_jan_{jan_code}").one()
+    assert row.response_encoding == ENCODING_NOT_FOUND
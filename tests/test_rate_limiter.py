@@ -0,0 +1,90 @@
+import fakeredis
+import pytest
+from redis import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from app.services.rate_limiter import RedisTokenBucket, TokenBucket
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeRedis()
+
+
+# ========== TokenBucket（プロセス内） ==========
+
+def test_local_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=2.0, capacity=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 4件目は1トークン補充（0.5秒）待ち、5件目はさらに0.5秒
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.01)
+
+
+def test_local_bucket_cost_above_one():
+    bucket = TokenBucket(rate=10.0, capacity=5)
+    assert bucket.reserve(5) == 0.0
+    assert bucket.reserve(10) == pytest.approx(1.0, abs=0.01)
+
+
+def test_local_bucket_without_rate_is_unlimited():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.reserve(100) == 0.0 for _ in range(10))
+
+
+def test_local_bucket_sync_overrides_state():
+    bucket = TokenBucket(rate=1.0, capacity=10)
+    bucket.sync(0, rate=4.0, capacity=20)
+
+    assert bucket.rate == 4.0
+    assert bucket.capacity == 20
+    assert bucket.reserve(2) == pytest.approx(0.5, abs=0.01)
+
+
+def test_local_bucket_set_rate_keeps_tokens():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    bucket.set_rate(0)
+    assert bucket.rate == 1.0
+
+    bucket.set_rate(5.0)
+    assert bucket.rate == 5.0
+    assert bucket.reserve(2) == 0.0
+
+
+# ========== RedisTokenBucket（全ワーカーで共有） ==========
+
+def test_redis_bucket_allows_burst_then_waits(redis):
+    bucket = RedisTokenBucket(redis, "ratelimit:test:op", rate=2.0, capacity=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.05)
+
+
+def test_redis_bucket_shared_between_instances(redis):
+    # 別プロセスのワーカーに相当（同じキー）
+    first = RedisTokenBucket(redis, "ratelimit:test:op", rate=1.0, capacity=1)
+    second = RedisTokenBucket(redis, "ratelimit:test:op", rate=1.0, capacity=1)
+
+    assert first.reserve() == 0.0
+    assert second.reserve() == pytest.approx(1.0, abs=0.05)
+
+
+def test_redis_bucket_sync_overrides_rate_and_tokens(redis):
+    bucket = RedisTokenBucket(redis, "ratelimit:test:op", rate=1.0, capacity=1)
+    other = RedisTokenBucket(redis, "ratelimit:test:op", rate=1.0, capacity=1)
+
+    # レスポンスで判明した値（残量0・毎秒4トークン）は他のワーカーにも反映される
+    bucket.sync(0, rate=4.0, capacity=8)
+    assert other.reserve() == pytest.approx(0.25, abs=0.05)
+
+
+def test_redis_bucket_falls_back_to_local_bucket():
+    unreachable = Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.1, retry=Retry(NoBackoff(), 0))
+    bucket = RedisTokenBucket(unreachable, "ratelimit:test:op", rate=0.1, capacity=1)
+
+    assert bucket.reserve() == 0.0
+    # Redisに接続できなくてもプロセス内のバケットで制限する（1トークン = 10秒）
+    assert bucket.reserve() > 5
@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from sp_api.base import SellingApiNotFoundException
+
+from app.services import api_cache, sp_api
+from app.services.api_cache import NOT_FOUND
+from app.services.sp_api import SpApiService
+
+
+# ========== ネガティブキャッシュ ==========
+
+def test_catalog_not_found_is_negative_cached(db, sqlite_upsert, monkeypatch):
+    calls = []
+
+    def get_catalog_item(asin, includedData):
+        calls.append(asin)
+        raise SellingApiNotFoundException([{"code": "NotFound", "message": f"{asin} not found"}])
+
+    catalog_api = SimpleNamespace(get_catalog_item=get_catalog_item)
+    monkeypatch.setattr(sp_api.SpApiClient, "_get_api", lambda self, api_class: catalog_api)
+    monkeypatch.setattr(sp_api.SpApiClient, "_wait_for_rate_limit", lambda self, operation="default": None)
+    api_cache._local_cache.clear()
+
+    assert SpApiService(db).get_catalog_item("B000000001") is None
+    # 再問い合わせはL3（api_cache）のNOT_FOUNDを読む
+    api_cache._local_cache.clear()
+    service = SpApiService(db)
+    assert service.cache.get("sp_api_catalog_B000000001") is NOT_FOUND
+    assert service.get_catalog_item("B000000001") is None
+
+    assert calls == ["B000000001"]
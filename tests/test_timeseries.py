@@ -0,0 +1,208 @@
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.dialects import mysql
+
+from app.config import Settings
+from app.database import upsert_statement
+from app.models import ResearchTimeseries, ResearchTimeseriesPacked
+from app.schemas.job import JobCreate
+from app.services.job_service import JobService
+from app.services.keepa import MINUTES_PER_DAY, KeepaService
+from app.services.timeseries import (
+    DAILY_AGGREGATION_BY_METRIC,
+    TimeseriesService,
+    downsample_daily,
+    pack_series,
+    unpack_series,
+)
+from app.workers import tasks
+
+
+# ========== 設定 ==========
+
+@pytest.mark.parametrize("name", ["TIMESERIES_DAILY_AGG_PRICE", "TIMESERIES_DAILY_AGG_RANK", "TIMESERIES_STORAGE"])
+def test_invalid_timeseries_setting_fails_at_startup(monkeypatch, name):
+    monkeypatch.setenv(name, "median")
+    with pytest.raises(ValidationError):
+        Settings()
+
+
+def test_valid_daily_aggregation_setting(monkeypatch):
+    monkeypatch.setenv("TIMESERIES_DAILY_AGG_PRICE", "last")
+    assert Settings().timeseries_daily_agg_price == "last"
+
+
+# ========== downsample_daily ==========
+
+DAY = 7000 * MINUTES_PER_DAY
+
+# 1日目に3点、2日目に1点、4日目に2点
+MINUTES = [DAY + 60, DAY + 600, DAY + 1200, DAY + MINUTES_PER_DAY + 5, DAY + 3 * MINUTES_PER_DAY, DAY + 3 * MINUTES_PER_DAY + 1]
+VALUES = [300, 100, 200, 50, 10, 21]
+DAYS = [DAY, DAY + MINUTES_PER_DAY, DAY + 3 * MINUTES_PER_DAY]
+
+
+@pytest.mark.parametrize(
+    "how, expected",
+    [
+        ("min", [100, 50, 10]),
+        ("max", [300, 50, 21]),
+        ("last", [200, 50, 21]),
+        # meanは整数に丸める（15.5 → 16）
+        ("mean", [200, 50, 16]),
+    ],
+)
+def test_downsample_daily(how, expected):
+    assert downsample_daily(MINUTES, VALUES, how) == (DAYS, expected)
+
+
+def test_downsample_daily_empty():
+    assert downsample_daily([], [], "min") == ([], [])
+
+
+def test_downsample_daily_rejects_unknown_aggregation():
+    with pytest.raises(ValueError):
+        downsample_daily(MINUTES, VALUES, "median")
+
+
+@pytest.mark.parametrize("how", ["min", "max", "last", "mean"])
+def test_parsed_history_downsamples_like_full_series(db, how):
+    """解析済みの直近90日分を集約した結果 = 全期間を集約してから直近90日を取った結果"""
+    data = []
+    for i in range(1000):
+        # 約3.3時間ごと（日の境界をまたいで不規則に並ぶ）
+        data.extend((DAY + i * 197, (i * 7919) % 1000))
+    service = KeepaService(db)
+    try:
+        parsed = service._parse_time_series(data, days=90)
+        full = service._parse_time_series(data)
+    finally:
+        service.close()
+
+    full_days, full_values = downsample_daily(full["minutes"], full["values"], how)
+    assert downsample_daily(parsed["minutes"], parsed["values"], how) == (full_days[-90:], full_values[-90:])
+
+
+# ========== pack_series / unpack_series ==========
+
+def test_pack_unpack_round_trip():
+    minutes = [7_000_000, 7_001_440, 7_002_880, 7_010_080]
+    values = [1980, 1500, -1, 2_000_000]
+
+    data = pack_series(minutes, values)
+    # 1組8バイト（int32 × 2）
+    assert len(data) == 8 * len(minutes)
+
+    unpacked_minutes, unpacked_values = unpack_series(data)
+    assert list(unpacked_minutes) == minutes
+    assert list(unpacked_values) == values
+
+
+def test_pack_unpack_empty():
+    assert pack_series([], []) == b""
+    minutes, values = unpack_series(b"")
+    assert list(minutes) == []
+    assert list(values) == []
+
+
+def test_pack_rejects_length_mismatch():
+    with pytest.raises(ValueError):
+        pack_series([1, 2], [1])
+
+
+def test_pack_rejects_delta_out_of_int32_range():
+    with pytest.raises(ValueError):
+        pack_series([0, 2**31], [0, 0])
+
+
+# ========== upsert_timeseries ==========
+
+def _parsed(prices: list[int]) -> dict:
+    """1日1点の価格・ランキング履歴（解析済みKeepaデータ）"""
+    minutes = [DAY + i * MINUTES_PER_DAY for i in range(len(prices))]
+    return {
+        "price_history": {"minutes": minutes, "values": prices},
+        "rank_history": {"minutes": minutes, "values": [price * 10 for price in prices]},
+    }
+
+
+def _saved_series(db, model) -> dict:
+    """保存済みの時系列を (asin, metric) ごとの値の列で取得"""
+    db.expire_all()
+    series = {}
+    if model is ResearchTimeseries:
+        rows = db.query(model).order_by(model.recorded_date)
+        for row in rows:
+            series.setdefault((row.asin, row.metric), []).append(row.value)
+    else:
+        for row in db.query(model):
+            series[(row.asin, row.metric)] = unpack_series(row.data)[1].tolist()
+    return series
+
+
+@pytest.mark.parametrize(
+    "storage, model", [("rows", ResearchTimeseries), ("packed", ResearchTimeseriesPacked)]
+)
+def test_upsert_timeseries_overwrites_on_rerun(db, sqlite_upsert, monkeypatch, storage, model):
+    monkeypatch.setattr(tasks.settings, "timeseries_storage", storage)
+    job = JobService.create_job(db, JobCreate(asins=["B000000001"]))
+
+    tasks.upsert_timeseries(db, tasks.timeseries_rows(job.job_id, "B000000001", _parsed([100, 200, 300])))
+    db.commit()
+    count = db.query(model).count()
+
+    # 同じ (job_id, asin, metric[, recorded_date]) を保存し直すと行は増えず値だけ変わる
+    tasks.upsert_timeseries(db, tasks.timeseries_rows(job.job_id, "B000000001", _parsed([100, 250, 300])))
+    db.commit()
+
+    assert count == db.query(model).count() == (6 if storage == "rows" else 2)
+    assert _saved_series(db, model) == {
+        ("B000000001", "PRICE"): [100, 250, 300],
+        ("B000000001", "RANK"): [1000, 2500, 3000],
+    }
+
+
+def test_timeseries_upsert_statement_for_mysql():
+    rows = tasks.timeseries_rows("job", "B000000001", _parsed([100, 200]))
+    sql = str(upsert_statement(ResearchTimeseries, rows, ("value", "source")).compile(dialect=mysql.dialect()))
+
+    assert sql.endswith("ON DUPLICATE KEY UPDATE value = VALUES(value), source = VALUES(source)")
+
+
+# ========== TimeseriesService.get_series ==========
+
+def _read_back(db, monkeypatch, storage: str, parsed: dict) -> dict:
+    """storageで保存した時系列を get_series で読み戻す"""
+    monkeypatch.setattr(tasks.settings, "timeseries_storage", storage)
+    job = JobService.create_job(db, JobCreate(asins=["B000000001"]))
+    tasks.upsert_timeseries(db, tasks.timeseries_rows(job.job_id, "B000000001", parsed))
+    db.commit()
+
+    series = {}
+    for metric in ("PRICE", "RANK"):
+        minutes, values = TimeseriesService.get_series(db, job.job_id, "B000000001", metric)
+        series[metric] = (minutes.tolist(), values.tolist())
+    return series
+
+
+def test_packed_series_reads_back_like_rows(db, sqlite_upsert, monkeypatch):
+    # 日の途中の点・欠けた日を含む履歴（保存時に1日1点へ集約される）
+    minutes = [DAY + 60, DAY + 600, DAY + MINUTES_PER_DAY + 5, DAY + 4 * MINUTES_PER_DAY + 1000]
+    parsed = {
+        "price_history": {"minutes": minutes, "values": [1980, 1500, 1700, 2_000_000]},
+        "rank_history": {"minutes": minutes, "values": [15000, 12000, 9000, 30000]},
+    }
+
+    rows_series = _read_back(db, monkeypatch, "rows", parsed)
+    packed_series = _read_back(db, monkeypatch, "packed", parsed)
+
+    assert packed_series == rows_series
+    for metric, key in tasks.TIMESERIES_METRICS:
+        history = parsed[key]
+        assert rows_series[metric] == downsample_daily(
+            history["minutes"], history["values"], DAILY_AGGREGATION_BY_METRIC[metric]
+        )
+
+
+def test_get_series_without_data(db):
+    assert TimeseriesService.get_series(db, "job", "B000000001", "PRICE") is None